@@ -2,17 +2,35 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import configparser
 import base64
+import datetime
+import os
+import time
+import uuid
 from io import StringIO, BytesIO
-from sqlalchemy import create_engine
 
-
-# Load configuration from database.ini
-def get_config():
-    config = configparser.ConfigParser()
-    config.read("config/database.ini")
-    return config
+from shcdc_emr_db import charts, queries
+from shcdc_emr_db.trends import ALL_ORGS
+from shcdc_emr_db import (
+    DatabaseManager,
+    QueryExecutor,
+    CodeValidator,
+    DatabaseError,
+    QueryRejectedError,
+    GuardedQueryExecutor,
+    LinkageCounters,
+    OrgDimension,
+    OrgDrilldown,
+    QualityTrendStore,
+    QueryCatalog,
+    QueryJobManager,
+    SnapshotExecutor,
+    compact_frame,
+    column_types,
+    generate_database_metadata,
+    label_orgs,
+    validate_read_only_query,
+)
 
 
 # Page config with custom theme
@@ -65,31 +83,297 @@ div[data-testid="stDataFrame"] {
 )
 
 
-# Get SQLAlchemy engine
+# SQLAlchemy engine for the dashboard aggregates: the least-lagged read replica
+# when replicas are configured, otherwise the primary
 def get_engine():
-    config = get_config()
-    db_user = config["postgresql"]["user"]
-    db_password = config["postgresql"]["password"]
-    db_host = config["postgresql"]["host"]
-    db_port = config["postgresql"]["port"]
-    db_name = config["postgresql"]["database"]
-    engine = create_engine(
-        f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    )
-    return engine
+    db_manager = get_db_manager()
+    return db_manager.endpoint_engine(db_manager.route("analytics"))
+
+
+# Local Parquet snapshot queried with DuckDB, shared by all sessions
+@st.cache_resource
+def get_snapshot_executor():
+    return SnapshotExecutor(os.environ.get("EMR_SNAPSHOT_DIR", "snapshot"))
+
+
+# Column types, used to pick compact dtypes for query results. Snapshot mode reads
+# them from the DuckDB views, so the source database is not queried.
+@st.cache_data(ttl=3600)
+def get_column_types(use_snapshot=False):
+    if use_snapshot:
+        return get_snapshot_executor().column_types()
+    types = column_types(generate_database_metadata(db_manager=get_db_manager()))
+    if not types:
+        # Metadata is empty when the database is unreachable; raising keeps it out of the cache
+        raise DatabaseError("No column metadata")
+    return types
+
+
+# Categorical codes and organization names, Arrow strings and int32 counts
+def compact_result(df, query=None):
+    try:
+        types = get_column_types(bool(st.session_state.get("use_snapshot")))
+    except DatabaseError:
+        types = {}
+    return compact_frame(df, query, types)
 
 
 # Function to execute queries and return pandas dataframes
 def execute_query(query):
     try:
+        # 快照模式：在本地Parquet快照上用DuckDB执行相同的SQL，不访问数据库
+        if st.session_state.get("use_snapshot"):
+            return compact_result(get_snapshot_executor().frame(query), query)
         engine = get_engine()
         df = pd.read_sql_query(query, engine)
-        return df
+        return compact_result(df, query)
     except Exception as e:
         st.error(f"查询执行错误: {e}")
         return pd.DataFrame()
 
 
+# Compiled dashboard query catalog; its prepared statements live on the shared pool's connections
+@st.cache_resource
+def get_query_catalog():
+    return QueryCatalog(get_db_manager())
+
+
+# Run a named catalog query with the scope's values bound. In snapshot mode the
+# same SQL runs on DuckDB with the values inlined.
+def execute_named(name, scope=None):
+    catalog = get_query_catalog()
+    if st.session_state.get("use_snapshot"):
+        return execute_query(catalog.sql(name, scope))
+    try:
+        return compact_result(catalog.frame(name, scope), catalog.sql(name, scope))
+    except DatabaseError as e:
+        st.error(f"查询执行错误: {e}")
+        return pd.DataFrame()
+
+
+# Shared package database manager, cached across reruns and sessions
+@st.cache_resource
+def get_db_manager():
+    return DatabaseManager()
+
+
+def get_query_executor():
+    return QueryExecutor(get_db_manager())
+
+
+# Background job manager for long-running aggregates, shared by all sessions
+@st.cache_resource
+def get_job_manager():
+    return QueryJobManager(get_db_manager(), max_workers=4)
+
+
+# Run a query as a background job, showing progress while polling for the result.
+# If the user navigates away the script run stops and the job is cancelled on the next run.
+def execute_query_in_background(query, label):
+    job_manager = get_job_manager()
+    job_id = job_manager.submit(query, owner=st.session_state["session_id"])
+    status = st.empty()
+    job = job_manager.progress(job_id)
+    try:
+        while not job.finished:
+            status.caption(
+                f"{label}: 已运行 {job.elapsed:.1f} 秒，已获取 {job.rows_fetched:,} 行"
+            )
+            time.sleep(0.5)
+            job = job_manager.progress(job_id)
+        job = job_manager.get(job_id)
+    finally:
+        status.empty()
+        # Script run interrupted by a rerun: stop the query on the server
+        if not job.finished:
+            job_manager.cancel(job_id)
+        # A job still stopping is dropped by the manager once finished_ttl passes
+        job_manager.forget(job_id)
+
+    if job.status == "done":
+        return compact_result(pd.DataFrame(job.rows, columns=job.columns), query)
+    if job.status == "failed":
+        st.error(f"查询执行错误: {job.error}")
+    return pd.DataFrame()
+
+
+# Organization dimension (code -> canonical name), reloaded every 10 minutes
+@st.cache_resource
+def get_org_dimension():
+    return OrgDimension(get_db_manager(), max_age_seconds=600)
+
+
+# Attach organization names to results grouped by org code
+def with_org_names(df):
+    try:
+        return get_org_dimension().label(df)
+    except DatabaseError:
+        return label_orgs(df, {})
+
+
+# Rows of organizations whose code, name or former names contain the keyword
+def filter_orgs(df, code_col, name_col, search_term):
+    try:
+        return df[df[code_col].isin(get_org_dimension().find(search_term))]
+    except DatabaseError:
+        return df[df[name_col].str.contains(search_term, case=False, regex=False, na=False)]
+
+
+# Organizations of a parent table for the sidebar filter, refreshed every 10 minutes
+@st.cache_data(ttl=600)
+def get_org_options(parent_table):
+    try:
+        return get_org_dimension().options(parent_table)
+    except DatabaseError:
+        return execute_query(
+            f"SELECT DISTINCT org_code, org_name FROM {parent_table} "
+            "WHERE org_code IS NOT NULL ORDER BY org_code"
+        )
+
+
+# Per-organization drill-down; its prepared statements live on the shared pool's connections
+@st.cache_resource
+def get_org_drilldown():
+    return OrgDrilldown(get_db_manager())
+
+
+# Trigger-maintained linkage counters, shared by all sessions
+@st.cache_resource
+def get_linkage_counters():
+    return LinkageCounters(get_db_manager())
+
+
+# Overview frames read from the linkage counters; None when they are not installed,
+# the scope has a time window or the dashboard is in snapshot mode
+def get_counted_overview(linkage, item_label, parent_label, scope):
+    if st.session_state.get("use_snapshot"):
+        return None
+    try:
+        return get_linkage_counters().overview(linkage, item_label, parent_label, scope)
+    except DatabaseError:
+        return None
+
+
+# Code-domain violations of one table, checked against the in-memory dictionaries
+@st.cache_data(ttl=600)
+def get_code_violations(table):
+    validator = CodeValidator(get_db_manager(), source="memory")
+    return pd.DataFrame(
+        validator.validate([table]),
+        columns=["table_name", "field", "org_code", "value", "violations"],
+    )
+
+
+# Quality metric snapshot store shared by all sessions
+@st.cache_resource
+def get_trend_store():
+    return QualityTrendStore(get_db_manager())
+
+
+# 指标名称
+TREND_METRIC_LABELS = {
+    "parents": "父记录数",
+    "parents_without_items": "无项目父记录数",
+    "orphaned_items": "孤立项目数",
+}
+
+
+# Completeness rate history of emr_patient_info for one organization (ALL_ORGS for the total)
+@st.cache_data(ttl=60)
+def get_completeness_history(org_code):
+    return get_trend_store().completeness("emr_patient_info", org_code=org_code)
+
+
+# Linkage metric history of a parent/item pair, over all organizations
+@st.cache_data(ttl=60)
+def get_linkage_history(linkage):
+    tables = queries.LINKAGE_TABLES[linkage]
+    store = get_trend_store()
+    history = pd.concat(
+        [
+            store.series(table=tables["parent_table"].split(".")[-1]),
+            store.series(table=tables["item_table"].split(".")[-1], metric="orphaned_items"),
+        ]
+    )
+    if history.empty:
+        return history
+    history = history[history["metric"].isin(TREND_METRIC_LABELS)]
+    return pd.DataFrame(
+        {
+            "快照时间": history["snapshot_at"],
+            "指标": history["metric"].map(TREND_METRIC_LABELS),
+            "数量": history["value"],
+        }
+    )
+
+
+# 自定义查询的行数、超时和内存预算
+GUARD_MAX_ROWS = 1000
+GUARD_STATEMENT_TIMEOUT_MS = 30000
+GUARD_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+# Guarded executor for ad-hoc SQL from the custom query tab
+@st.cache_resource
+def get_guarded_executor():
+    return GuardedQueryExecutor(
+        get_db_manager(),
+        max_rows=GUARD_MAX_ROWS,
+        statement_timeout_ms=GUARD_STATEMENT_TIMEOUT_MS,
+        max_memory_bytes=GUARD_MAX_MEMORY_BYTES,
+    )
+
+
+# Run a query with EXPLAIN ANALYZE and render the plan tree
+def render_query_profile(query):
+    try:
+        profile = get_query_executor().explain(
+            query, statement_timeout_ms=GUARD_STATEMENT_TIMEOUT_MS
+        )
+    except DatabaseError as e:
+        st.error(f"性能分析失败: {e}")
+        return
+
+    profile_cols = st.columns(3)
+    profile_cols[0].metric("规划耗时", f"{profile.planning_time:.2f} ms")
+    profile_cols[1].metric("执行耗时", f"{profile.execution_time:.2f} ms")
+    profile_cols[2].metric("计划节点数", f"{len(profile.nodes())}")
+
+    plan_df = pd.DataFrame(profile.to_rows())
+    plan_df["node_type"] = [
+        "\u3000" * depth + node_type
+        for depth, node_type in zip(plan_df["depth"], plan_df["node_type"])
+    ]
+    plan_df = plan_df.drop(columns=["depth"]).rename(
+        columns={
+            "node_type": "节点类型",
+            "relation_name": "表名",
+            "index_name": "索引",
+            "exclusive_time_ms": "自身耗时(ms)",
+            "inclusive_time_ms": "累计耗时(ms)",
+            "plan_rows": "预估行数",
+            "actual_rows": "实际行数",
+            "loops": "循环次数",
+            "row_estimate_ratio": "实际/预估",
+            "shared_hit_blocks": "缓存命中块",
+            "shared_read_blocks": "磁盘读取块",
+            "filter": "过滤条件",
+            "rows_removed_by_filter": "过滤行数",
+        }
+    )
+    st.dataframe(plan_df, use_container_width=True)
+
+    seq_scans = profile.seq_scans()
+    if seq_scans:
+        st.warning(
+            "发现全表扫描: "
+            + ", ".join(
+                f"{node.relation_name} ({node.exclusive_time:.2f} ms)"
+                for node in seq_scans
+            )
+        )
+
+
 # Function to get downloadable link for dataframe
 def get_download_link(df, filename, text):
     csv = df.to_csv(index=False)
@@ -98,15 +382,44 @@ def get_download_link(df, filename, text):
     return href
 
 
-# Function to create a plotly chart with configured template
-def create_chart(df, chart_type, x_col, y_col, title, color_col=None):
+# Function to create a plotly chart with configured template.
+# Data is reduced server-side first (top-N + 其他, binned scatter/histogram,
+# downsampled lines) so the chart payload stays bounded however many orgs there are.
+def create_chart(
+    df, chart_type, x_col, y_col, title, color_col=None, size_col=None, hover_col=None, agg="sum"
+):
     fig = None
     if chart_type == "bar":
+        df = charts.top_n_with_others(df, x_col, y_col, color_col=color_col, agg=agg)
         fig = px.bar(df, x=x_col, y=y_col, title=title, color=color_col)
     elif chart_type == "pie":
+        df = charts.top_n_with_others(df, x_col, y_col, agg=agg)
         fig = px.pie(df, names=x_col, values=y_col, title=title)
     elif chart_type == "line":
+        df = charts.downsample_line(df, x_col, y_col, group_col=color_col)
         fig = px.line(df, x=x_col, y=y_col, title=title, color=color_col)
+    elif chart_type == "scatter":
+        if len(df) > charts.MAX_SCATTER_POINTS:
+            # Each point is a grid cell: mean position, size from the summed size_col
+            df = charts.bin_scatter(df, x_col, y_col, size_col=size_col)
+            hover_col = None
+            if color_col not in (x_col, y_col):
+                color_col = None
+        fig = px.scatter(
+            df,
+            x=x_col,
+            y=y_col,
+            title=title,
+            color=color_col,
+            size=size_col,
+            hover_name=hover_col,
+            hover_data=[charts.COUNT_LABEL] if charts.COUNT_LABEL in df else None,
+            render_mode="webgl" if len(df) > charts.WEBGL_THRESHOLD else "auto",
+        )
+    elif chart_type == "histogram":
+        df = charts.histogram_bins(df[x_col])
+        fig = px.bar(df, x="区间", y=charts.COUNT_LABEL, title=title)
+        fig.update_layout(bargap=0, xaxis_title=x_col)
 
     if fig is not None:
         fig.update_layout(
@@ -136,23 +449,20 @@ with header_col2:
 DATA_TYPES = {
     "患者信息质量": {"icon": "👤", "type": "patient_info"},
     "医嘱处方项": {
-        "item_table": "emr_back.emr_order_item",
-        "parent_table": "emr_back.emr_order",
-        "join_field": "order_id",
+        **queries.LINKAGE_TABLES["order"],
+        "linkage": "order",
         "icon": "💊",
         "type": "item_analysis",
     },
     "检验项目": {
-        "item_table": "emr_back.emr_ex_lab_item",
-        "parent_table": "emr_back.emr_ex_lab",
-        "join_field": "ex_lab_id",
+        **queries.LINKAGE_TABLES["ex_lab"],
+        "linkage": "ex_lab",
         "icon": "🧪",
         "type": "item_analysis",
     },
     "临床检验项目": {
-        "item_table": "emr_back.emr_ex_clinical_item",
-        "parent_table": "emr_back.emr_ex_clinical",
-        "join_field": "ex_clinical_id",
+        **queries.LINKAGE_TABLES["ex_clinical"],
+        "linkage": "ex_clinical",
         "icon": "🩺",
         "type": "item_analysis",
     },
@@ -167,6 +477,45 @@ with st.sidebar:
         format_func=lambda x: f"{DATA_TYPES[x]['icon']} {x}",
     )
 
+    # 机构与时间筛选条件下推到SQL中，分区表只扫描匹配的分区
+    query_scope = queries.QueryScope()
+    if DATA_TYPES[data_type]["type"] == "item_analysis":
+        st.markdown("### 🔎 筛选条件")
+        org_options = get_org_options(DATA_TYPES[data_type]["parent_table"])
+        org_names = dict(zip(org_options.get("org_code", []), org_options.get("org_name", [])))
+        selected_orgs = st.multiselect(
+            "机构:",
+            list(org_names),
+            format_func=lambda code: f"{org_names[code]} ({code})",
+            placeholder="全部机构",
+        )
+        use_time_range = st.checkbox("按操作时间筛选")
+        since = until = None
+        if use_time_range:
+            today = datetime.date.today()
+            time_range = st.date_input(
+                "操作时间范围:", (today - datetime.timedelta(days=30), today)
+            )
+            if len(time_range) == 2:
+                since, until = time_range[0], time_range[1] + datetime.timedelta(days=1)
+        query_scope = queries.QueryScope(
+            org_codes=tuple(selected_orgs), since=since, until=until
+        )
+
+    # 本地快照存在时可切换到快照模式
+    snapshot_time = get_snapshot_executor().exported_at
+    if snapshot_time:
+        st.markdown("### 🗂️ 数据来源")
+        st.checkbox("使用本地快照 (DuckDB)", key="use_snapshot")
+        st.caption(f"快照导出时间: {snapshot_time}")
+
+# 切换数据类型时取消本会话仍在服务器上运行的查询
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+if st.session_state.get("active_data_type") != data_type:
+    get_job_manager().cancel_owner(st.session_state["session_id"])
+    st.session_state["active_data_type"] = data_type
+
 # Get current data type configuration
 current_config = DATA_TYPES[data_type]
 data_icon = current_config["icon"]
@@ -176,46 +525,17 @@ if current_config["type"] == "patient_info":
     st.markdown(f"## {data_icon} {data_type}")
 
     # 使用标签页组织内容
-    quality_tab1, quality_tab2, quality_tab3 = st.tabs(
-        ["📋 总体统计", "📊 必填字段分析", "🔍 建议字段分析"]
+    quality_tab1, quality_tab2, quality_tab3, quality_tab4, quality_tab5 = st.tabs(
+        ["📋 总体统计", "📊 必填字段分析", "🔍 建议字段分析", "🧾 值域检查", "📈 质量趋势"]
     )
 
     with quality_tab1:
-        # 总记录数统计
-        total_records_query = """
-        SELECT COUNT(*) AS 总记录数 FROM emr_back.emr_patient_info;
-        """
-
-        # 必填字段统计
-        mandatory_fields_query = """
-        SELECT 
-            SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) AS id空值数,
-            SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) AS 患者姓名空值数,
-            SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) AS 身份证件类别代码空值数,
-            SUM(CASE WHEN id_card_type_name IS NULL OR TRIM(id_card_type_name) = '' THEN 1 ELSE 0 END) AS 身份证件类别名称空值数,
-            SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) AS 身份证件号码空值数,
-            SUM(CASE WHEN org_code IS NULL OR TRIM(org_code) = '' THEN 1 ELSE 0 END) AS 医疗机构代码空值数,
-            SUM(CASE WHEN org_name IS NULL OR TRIM(org_name) = '' THEN 1 ELSE 0 END) AS 医疗机构名称空值数,
-            SUM(CASE WHEN operation_time IS NULL THEN 1 ELSE 0 END) AS 操作时间空值数
-        FROM emr_back.emr_patient_info;
-        """
-
-        # 建议字段统计 (选择最关键的几个)
-        suggested_fields_query = """
-        SELECT 
-            SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) AS 性别代码空值数,
-            SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) AS 出生日期空值数,
-            SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) AS 患者电话空值数,
-            SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) AS 婚姻状况代码空值数,
-            SUM(CASE WHEN current_addr_detail IS NULL OR TRIM(current_addr_detail) = '' THEN 1 ELSE 0 END) AS 现住详细地址空值数
-        FROM emr_back.emr_patient_info;
-        """
-
+        # 总记录数、必填字段、建议字段 (选择最关键的几个) 统计
         # 执行查询
         with st.spinner("正在加载患者信息统计数据..."):
-            total_df = execute_query(total_records_query)
-            mandatory_df = execute_query(mandatory_fields_query)
-            suggested_df = execute_query(suggested_fields_query)
+            total_df = execute_named("patient_info.total_records")
+            mandatory_df = execute_named("patient_info.mandatory_fields")
+            suggested_df = execute_named("patient_info.suggested_fields")
 
             if not total_df.empty and not mandatory_df.empty and not suggested_df.empty:
                 total_records = total_df.iloc[0, 0]
@@ -260,7 +580,7 @@ if current_config["type"] == "patient_info":
                 # 显示柱状图
                 st.subheader("数据完整率概览")
                 fig = create_chart(
-                    completeness_data, "bar", "字段类型", "完整率", "患者信息数据完整率"
+                    completeness_data, "bar", "字段类型", "完整率", "患者信息数据完整率", agg="mean"
                 )
                 fig.update_traces(marker_color=["#3366cc", "#109618", "#ff9900"])
                 st.plotly_chart(fig, use_container_width=True)
@@ -299,43 +619,10 @@ if current_config["type"] == "patient_info":
         st.subheader("必填字段完整率分析")
 
         # 按机构统计必填字段完整率
-        mandatory_by_org_query = """
-        SELECT
-            org_name AS 医疗机构名称,
-            COUNT(*) AS 记录总数,
-            
-            -- 必填字段缺失统计
-            SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) AS ID缺失数,
-            ROUND(100.0 * SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS ID缺失率,
-            SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) AS 患者姓名缺失数,
-            ROUND(100.0 * SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 患者姓名缺失率,
-            SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) AS 证件类型代码缺失数,
-            ROUND(100.0 * SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 证件类型代码缺失率,
-            SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) AS 证件号码缺失数,
-            ROUND(100.0 * SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 证件号码缺失率,
-            
-            -- 综合质量评分（必填字段填写完整率）
-            ROUND(100.0 - (
-                100.0 * (
-                    SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN id_card_type_name IS NULL OR TRIM(id_card_type_name) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN org_code IS NULL OR TRIM(org_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN operation_time IS NULL THEN 1 ELSE 0 END)
-                ) / (COUNT(*) * 7)
-            ), 2) AS 必填字段完整率
-        FROM
-            emr_back.emr_patient_info
-        GROUP BY
-            org_name
-        ORDER BY
-            必填字段完整率 DESC, 记录总数 DESC;
-        """
-
         with st.spinner("正在加载机构必填字段统计..."):
-            mandatory_org_df = execute_query(mandatory_by_org_query)
+            mandatory_org_df = with_org_names(
+                execute_named("patient_info.mandatory_by_org")
+            )
 
             if not mandatory_org_df.empty:
                 # 分析视图标签页
@@ -365,16 +652,17 @@ if current_config["type"] == "patient_info":
 
                     # 散点图：记录总数与必填字段完整率的关系
                     st.subheader("记录总数与必填字段完整率的关系")
-                    fig = px.scatter(
+                    fig = create_chart(
                         mandatory_org_df,
-                        x="记录总数",
-                        y="必填字段完整率",
-                        size="记录总数",
-                        color="必填字段完整率",
-                        hover_name="医疗机构名称",
-                        color_continuous_scale="Viridis",
-                        title="各机构记录总数与必填字段完整率关系",
+                        "scatter",
+                        "记录总数",
+                        "必填字段完整率",
+                        "各机构记录总数与必填字段完整率关系",
+                        color_col="必填字段完整率",
+                        size_col="记录总数",
+                        hover_col="医疗机构名称",
                     )
+                    fig.update_layout(coloraxis_colorscale="Viridis")
                     st.plotly_chart(fig, use_container_width=True)
 
                 with m_view2:
@@ -393,11 +681,9 @@ if current_config["type"] == "patient_info":
 
                     # 应用筛选
                     if search_term:
-                        filtered_data = mandatory_org_df[
-                            mandatory_org_df["医疗机构名称"].str.contains(
-                                search_term, case=False
-                            )
-                        ]
+                        filtered_data = filter_orgs(
+                            mandatory_org_df, "医疗机构代码", "医疗机构名称", search_term
+                        )
                     else:
                         filtered_data = mandatory_org_df
 
@@ -438,49 +724,10 @@ if current_config["type"] == "patient_info":
         st.subheader("建议字段完整率分析")
 
         # 按机构统计建议字段完整率
-        suggested_by_org_query = """
-        SELECT
-            org_name AS 医疗机构名称,
-            COUNT(*) AS 记录总数,
-            
-            -- 核心建议填写字段统计
-            SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) AS 性别代码缺失数,
-            ROUND(100.0 * SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 性别代码缺失率,
-            
-            SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) AS 出生日期缺失数,
-            ROUND(100.0 * SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) / COUNT(*), 2) AS 出生日期缺失率,
-            
-            SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) AS 电话号码缺失数,
-            ROUND(100.0 * SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 电话号码缺失率,
-            
-            SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) AS 婚姻状况缺失数,
-            ROUND(100.0 * SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 婚姻状况缺失率,
-            
-            -- 建议填写字段综合完整率（选取10个重要的建议字段）
-            ROUND(100.0 - (
-                100.0 * (
-                    SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN nation_code IS NULL OR TRIM(nation_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN current_addr_code IS NULL OR TRIM(current_addr_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN current_addr_detail IS NULL OR TRIM(current_addr_detail) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN education_code IS NULL OR TRIM(education_code) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN contacts IS NULL OR TRIM(contacts) = '' THEN 1 ELSE 0 END) +
-                    SUM(CASE WHEN contacts_tel IS NULL OR TRIM(contacts_tel) = '' THEN 1 ELSE 0 END)
-                ) / (COUNT(*) * 10)
-            ), 2) AS 建议字段完整率
-        FROM
-            emr_back.emr_patient_info
-        GROUP BY
-            org_name
-        ORDER BY
-            建议字段完整率 DESC, 记录总数 DESC;
-        """
-
         with st.spinner("正在加载机构建议字段统计..."):
-            suggested_org_df = execute_query(suggested_by_org_query)
+            suggested_org_df = with_org_names(
+                execute_named("patient_info.suggested_by_org")
+            )
 
             if not suggested_org_df.empty:
                 # 分析视图标签页
@@ -569,11 +816,9 @@ if current_config["type"] == "patient_info":
 
                     # 应用筛选
                     if search_term:
-                        filtered_data = suggested_org_df[
-                            suggested_org_df["医疗机构名称"].str.contains(
-                                search_term, case=False
-                            )
-                        ]
+                        filtered_data = filter_orgs(
+                            suggested_org_df, "医疗机构代码", "医疗机构名称", search_term
+                        )
                     else:
                         filtered_data = suggested_org_df
 
@@ -610,11 +855,108 @@ if current_config["type"] == "patient_info":
             else:
                 st.error("无法获取机构建议字段统计数据")
 
+    with quality_tab4:
+        st.subheader("编码字段值域检查")
+        st.markdown("按WS364、GB/T等标准编码表校验所有编码字段，一次扫描完成")
+
+        with st.spinner("正在校验编码字段..."):
+            try:
+                violations_df = get_code_violations("emr_patient_info")
+            except DatabaseError as e:
+                st.error(f"查询执行错误: {e}")
+                violations_df = None
+
+        if violations_df is not None and violations_df.empty:
+            st.success("所有编码字段均符合值域")
+        elif violations_df is not None:
+            by_field = (
+                violations_df.groupby("field", as_index=False)["violations"]
+                .sum()
+                .sort_values("violations", ascending=False)
+            )
+            field_cols = st.columns(min(len(by_field), 5))
+            for col, (_, row) in zip(field_cols, by_field.iterrows()):
+                col.metric(row["field"], f"{row['violations']:,}")
+
+            st.markdown("##### 不符合值域的编码值")
+            st.dataframe(
+                violations_df.groupby(["field", "value"], as_index=False)["violations"]
+                .sum()
+                .sort_values("violations", ascending=False)
+                .rename(columns={"field": "字段", "value": "编码值", "violations": "记录数"}),
+                use_container_width=True,
+            )
+
+            st.markdown("##### 按机构统计")
+            st.dataframe(
+                violations_df.pivot_table(
+                    index="org_code",
+                    columns="field",
+                    values="violations",
+                    aggfunc="sum",
+                    fill_value=0,
+                ).rename_axis(index="机构代码"),
+                use_container_width=True,
+            )
+
+    with quality_tab5:
+        st.subheader("质量指标趋势")
+        st.markdown("每次快照按机构、字段增量记录质量指标，用于观察各机构数据质量的变化")
+
+        if st.button("📸 记录当前快照", key="trend_snapshot"):
+            with st.spinner("正在记录质量快照..."):
+                try:
+                    points = get_trend_store().snapshot()
+                    get_completeness_history.clear()
+                    get_linkage_history.clear()
+                    st.success(f"已记录 {points:,} 个指标数据点")
+                except DatabaseError as e:
+                    st.error(f"快照记录失败: {e}")
+
+        patient_orgs = get_org_options("emr_back.emr_patient_info")
+        trend_org_names = {
+            ALL_ORGS: "全部机构",
+            **dict(zip(patient_orgs.get("org_code", []), patient_orgs.get("org_name", []))),
+        }
+        trend_org = st.selectbox(
+            "机构:",
+            list(trend_org_names),
+            format_func=lambda code: trend_org_names[code]
+            if code == ALL_ORGS
+            else f"{trend_org_names[code]} ({code})",
+            key="trend_org",
+        )
+
+        history = get_completeness_history(trend_org)
+        if history.empty:
+            st.info("暂无历史快照，请先记录快照")
+        else:
+            history = history.rename(
+                columns={"snapshot_at": "快照时间", "field": "字段", "rate": "完整率"}
+            )
+            fig = create_chart(
+                history, "line", "快照时间", "完整率", "字段完整率趋势", color_col="字段"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.markdown("##### 各字段完整率变化")
+            trend_df = get_trend_store().trends("emr_patient_info", org_code=trend_org)
+            st.dataframe(
+                trend_df[["field", "snapshots", "first_rate", "latest_rate", "slope_per_day"]].rename(
+                    columns={
+                        "field": "字段",
+                        "snapshots": "快照数",
+                        "first_rate": "首次完整率",
+                        "latest_rate": "最新完整率",
+                        "slope_per_day": "日均变化(百分点)",
+                    }
+                ),
+                use_container_width=True,
+            )
+
 else:  # 医嘱与检验分析模式
     # Get item type configuration
-    item_table = current_config["item_table"]
-    parent_table = current_config["parent_table"]
-    join_field = current_config["join_field"]
+    linkage = current_config["linkage"]
 
     # 根据数据类型设置父表名称
     if data_type == "医嘱处方项":
@@ -631,60 +973,32 @@ else:  # 医嘱与检验分析模式
     # ---------- Overview Page ----------
     with tab1:
         with st.spinner("正在加载数据..."):
-            # Get summary statistics
-            total_items_query = f"""
-            SELECT '{data_type}总数' as "Metric", COUNT(*) as "Count"
-            FROM {item_table}
-            """
-
-            # 根据数据类型使用不同的父表名称显示
-            parent_with_items_query = f"""
-            SELECT '有{data_type}的{parent_table_name}' as "Metric", COUNT(*) as "Count"
-            FROM {parent_table} p
-            INNER JOIN {item_table} i ON p.id = i.{join_field}
-            """
-
-            parent_without_items_query = f"""
-            SELECT '无{data_type}的{parent_table_name}' as "Metric", COUNT(*) as "Count"
-            FROM {parent_table} p
-            LEFT JOIN {item_table} i ON p.id = i.{join_field}
-            WHERE i.id IS NULL
-            """
-
-            valid_items_query = f"""
-            SELECT '有效{data_type}' as "Metric", COUNT(*) as "Count"
-            FROM {item_table} i
-            INNER JOIN {parent_table} p ON i.{join_field} = p.id
-            """
-
-            orphaned_items_query = f"""
-            SELECT '孤立{data_type}' as "Metric", COUNT(*) as "Count"
-            FROM {item_table} i
-            LEFT JOIN {parent_table} p ON i.{join_field} = p.id
-            WHERE p.id IS NULL
-            """
-
-            # 使用进度条提示数据加载
-            progress_bar = st.progress(0)
-
-            # 执行查询并更新进度
-            result1 = execute_query(total_items_query)
-            progress_bar.progress(20)
-
-            result2 = execute_query(parent_with_items_query)
-            progress_bar.progress(40)
-
-            result3 = execute_query(parent_without_items_query)
-            progress_bar.progress(60)
-
-            result4 = execute_query(valid_items_query)
-            progress_bar.progress(80)
-
-            result5 = execute_query(orphaned_items_query)
-            progress_bar.progress(100)
-
-            # 移除进度条
-            progress_bar.empty()
+            # 已安装计数触发器时直接读取实时计数，无需反连接全表
+            counted = get_counted_overview(linkage, data_type, parent_table_name, query_scope)
+            if counted is not None:
+                result1, result2, result3, result4, result5 = counted.values()
+            else:
+                # 使用进度条提示数据加载
+                progress_bar = st.progress(0)
+
+                # 执行查询并更新进度
+                result1 = execute_named(f"{linkage}.overview.total_items", query_scope)
+                progress_bar.progress(20)
+
+                result2 = execute_named(f"{linkage}.overview.parent_with_items", query_scope)
+                progress_bar.progress(40)
+
+                result3 = execute_named(f"{linkage}.overview.parent_without_items", query_scope)
+                progress_bar.progress(60)
+
+                result4 = execute_named(f"{linkage}.overview.valid_items", query_scope)
+                progress_bar.progress(80)
+
+                result5 = execute_named(f"{linkage}.overview.orphaned_items", query_scope)
+                progress_bar.progress(100)
+
+                # 移除进度条
+                progress_bar.empty()
 
             # Combine all stats into one dataframe
             combined_stats = pd.concat([result1, result2, result3, result4, result5])
@@ -768,6 +1082,21 @@ else:  # 医嘱与检验分析模式
                     mime="text/csv",
                 )
 
+                st.markdown("##### 历史趋势")
+                linkage_history = get_linkage_history(linkage)
+                if linkage_history.empty:
+                    st.info("暂无历史快照，可在“患者信息质量 → 质量趋势”中记录快照")
+                else:
+                    fig = create_chart(
+                        linkage_history,
+                        "line",
+                        "快照时间",
+                        "数量",
+                        f"{data_type}关联性趋势",
+                        color_col="指标",
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+
     # ---------- Data Explorer ----------
     with tab2:
         # 使用原生Streamlit子标签页
@@ -781,84 +1110,12 @@ else:  # 医嘱与检验分析模式
                 f"查询无关联{parent_table_name}的{data_type}记录，最多显示1000条"
             )
 
-            # 根据数据类型创建不同的查询
-            if data_type == "医嘱处方项":
-                query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.order_id AS 医嘱处方ID,
-                    i.drug_code AS 药品代码,
-                    i.drug_name AS 药品名称,
-                    i.drug_specifications AS 药品规格,
-                    i.drug_dosage_code AS 剂量代码,
-                    i.drug_dosage_unit_code AS 剂量单位代码,
-                    i.drug_dosage_unit_name AS 剂量单位名称,
-                    i.drug_dosage_total AS 总剂量,
-                    i.tcm_prescription AS 中药处方,
-                    i.tcm_number AS 中药编号,
-                    i.tcm_decoction_method AS 中药煎煮方法,
-                    i.tcm_use_method AS 中药使用方法,
-                    i.operator_id AS 操作员ID,
-                    i.operation_time AS 操作时间,
-                    i.invalid_flag AS 无效标志,
-                    i.data_status AS 数据状态,
-                    i.create_date AS 创建日期
-                FROM {item_table} i
-                LEFT JOIN {parent_table} p ON i.{join_field} = p.id
-                WHERE p.id IS NULL
-                LIMIT 1000
-                """
-            elif data_type == "检验项目":  # 检验项目
-                query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.ex_lab_id AS 检验工作单ID,
-                    i.lab_item_code AS 检验项目代码,
-                    i.lab_item_name AS 检验项目名称,
-                    i.item_result AS 检验结果,
-                    i.item_unit AS 结果单位,
-                    i.item_result_flag AS 结果标志,
-                    i.reference_range AS 参考范围,
-                    i.critical_value_flag AS 危急值标志,
-                    i.operator_id AS 操作员ID,
-                    i.operation_time AS 操作时间,
-                    i.invalid_flag AS 无效标志,
-                    i.data_status AS 数据状态,
-                    i.create_date AS 创建日期
-                FROM {item_table} i
-                LEFT JOIN {parent_table} p ON i.{join_field} = p.id
-                WHERE p.id IS NULL
-                LIMIT 1000
-                """
-            else:  # 临床检验项目
-                query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.ex_clinical_id AS 临床检验单ID,
-                    i.clinical_item_code AS 检验项目代码,
-                    i.clinical_item_name AS 临床检验项目名称,
-                    i.item_result AS 检验结果值,
-                    i.item_unit AS 检验单位,
-                    i.item_method AS 检验方法,
-                    i.item_device AS 检验设备,
-                    i.item_result_flag AS 结果标志,
-                    i.operator_id AS 操作员ID,
-                    i.operation_time AS 操作时间,
-                    i.invalid_flag AS 无效标志,
-                    i.data_status AS 数据状态,
-                    i.create_date AS 创建日期
-                FROM {item_table} i
-                LEFT JOIN {parent_table} p ON i.{join_field} = p.id
-                WHERE p.id IS NULL
-                LIMIT 1000
-                """
-
             # 执行按钮
             query_button = st.button("执行孤立数据查询", key="orphaned_query")
 
             if query_button:
                 with st.spinner("正在查询..."):
-                    df = execute_query(query)
+                    df = execute_named(f"{linkage}.orphaned_items", query_scope)
 
                     if not df.empty:
                         st.success(f"查询成功，共找到 {len(df)} 条记录")
@@ -880,71 +1137,12 @@ else:  # 医嘱与检验分析模式
                 f"查询没有关联{data_type}的{parent_table_name}记录，最多显示1000条"
             )
 
-            # 根据数据类型创建不同的查询
-            if data_type == "医嘱处方项":
-                query = f"""
-                SELECT 
-                    p.id AS 医嘱处方ID,
-                    p.patient_id AS 患者ID,
-                    p.patient_name AS 患者姓名,
-                    p.activity_type_name AS 活动类型,
-                    p.prescription_no AS 处方号,
-                    p.prescription_type_code AS 处方类型,
-                    p.prescription_issuance_date AS 处方开具日期,
-                    p.org_code AS 机构代码,
-                    p.org_name AS 机构名称,
-                    p.dept_name AS 科室名称,
-                    p.create_date AS 创建日期
-                FROM {parent_table} p
-                LEFT JOIN {item_table} i ON p.id = i.{join_field}
-                WHERE i.id IS NULL
-                LIMIT 1000
-                """
-            elif data_type == "检验项目":  # 检验项目
-                query = f"""
-                SELECT 
-                    p.id AS 检验工作单ID,
-                    p.patient_id AS 患者ID,
-                    p.patient_name AS 患者姓名, 
-                    p.apply_dept_name AS 申请科室,
-                    p.sample_type_name AS 标本类型,
-                    p.lab_apply_no AS 检验申请单号,
-                    p.apply_time AS 申请时间,
-                    p.report_time AS 报告时间,
-                    p.org_code AS 机构代码,
-                    p.org_name AS 机构名称,
-                    p.create_date AS 创建日期
-                FROM {parent_table} p
-                LEFT JOIN {item_table} i ON p.id = i.{join_field}
-                WHERE i.id IS NULL
-                LIMIT 1000
-                """
-            else:  # 临床检验项目
-                query = f"""
-                SELECT 
-                    p.id AS 临床检验单ID,
-                    p.patient_id AS 患者ID,
-                    p.patient_name AS 患者姓名,
-                    p.clinical_type_name AS 检验类型,
-                    p.application_date AS 申请日期,
-                    p.clinical_apply_no AS 检验申请单号,
-                    p.apply_dept_name AS 申请科室,
-                    p.result_date AS 结果日期,
-                    p.org_code AS 机构代码,
-                    p.org_name AS 机构名称,
-                    p.create_date AS 创建日期
-                FROM {parent_table} p
-                LEFT JOIN {item_table} i ON p.id = i.{join_field}
-                WHERE i.id IS NULL
-                LIMIT 1000
-                """
-
             # 执行按钮
             query_button = st.button("执行缺失数据查询", key="missing_query")
 
             if query_button:
                 with st.spinner("正在查询..."):
-                    df = execute_query(query)
+                    df = execute_named(f"{linkage}.missing_items", query_scope)
 
                     if not df.empty:
                         st.success(f"查询成功，共找到 {len(df)} 条记录")
@@ -965,69 +1163,87 @@ else:  # 医嘱与检验分析模式
             st.markdown("在下方编辑框中输入SQL查询语句，然后点击执行按钮")
 
             # Prepare default query with the selected data type
-            if data_type == "医嘱处方项":
-                default_query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.order_id AS 医嘱处方ID,
-                    i.drug_name AS 药品名称,
-                    p.patient_name AS 患者姓名,
-                    p.org_name AS 机构名称
-                FROM {item_table} i
-                JOIN {parent_table} p ON i.{join_field} = p.id
-                LIMIT 100
-                """
-            elif data_type == "检验项目":  # 检验项目
-                default_query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.ex_lab_id AS 医嘱处方ID,
-                    i.lab_item_name AS 检验项目名称,
-                    p.patient_name AS 患者姓名,
-                    p.org_name AS 机构名称
-                FROM {item_table} i
-                JOIN {parent_table} p ON i.{join_field} = p.id
-                LIMIT 100
-                """
-            else:  # 临床检验项目
-                default_query = f"""
-                SELECT 
-                    i.id AS 项目ID,
-                    i.ex_clinical_id AS 临床检验单ID,
-                    i.clinical_item_name AS 临床检验项目名称,
-                    p.patient_name AS 患者姓名,
-                    p.org_name AS 机构名称
-                FROM {item_table} i
-                JOIN {parent_table} p ON i.{join_field} = p.id
-                LIMIT 100
-                """
+            default_query = queries.default_custom_query(linkage, scope=query_scope)
 
             query = st.text_area("SQL查询:", default_query, height=200)
+            profile_mode = st.checkbox(
+                "性能分析模式 (EXPLAIN ANALYZE)", key="custom_query_profile"
+            )
             custom_query_button = st.button("执行自定义查询", key="custom_query")
 
+            if custom_query_button and profile_mode:
+                with st.spinner("正在分析查询计划..."):
+                    try:
+                        render_query_profile(validate_read_only_query(query))
+                    except QueryRejectedError as e:
+                        st.error(f"查询被拒绝: {e}")
+                custom_query_button = False
+
             if custom_query_button:
                 with st.spinner("正在执行查询..."):
-                    df = execute_query(query)
-
-                    if not df.empty:
-                        st.success(f"查询成功，共返回 {len(df)} 条记录")
-                        st.dataframe(df)
+                    try:
+                        page = get_guarded_executor().execute(query)
+                        st.session_state["custom_query_state"] = {
+                            "query": query,
+                            "df": pd.DataFrame(page.rows, columns=page.columns),
+                            "page": page,
+                        }
+                    except QueryRejectedError as e:
+                        st.session_state.pop("custom_query_state", None)
+                        st.error(f"查询被拒绝: {e}")
+                    except DatabaseError as e:
+                        st.session_state.pop("custom_query_state", None)
+                        st.error(f"查询执行错误: {e}")
+
+            custom_state = st.session_state.get("custom_query_state")
+            if custom_state and custom_state["query"] == query:
+                page = custom_state["page"]
+                if page.has_more and st.button(
+                    f"加载更多 (每次 {GUARD_MAX_ROWS:,} 行)", key="custom_query_more"
+                ):
+                    with st.spinner("正在加载更多..."):
+                        try:
+                            page = get_guarded_executor().execute(
+                                query, offset=page.next_offset
+                            )
+                            custom_state["df"] = pd.concat(
+                                [
+                                    custom_state["df"],
+                                    pd.DataFrame(page.rows, columns=page.columns),
+                                ],
+                                ignore_index=True,
+                            )
+                            custom_state["page"] = page
+                        except DatabaseError as e:
+                            st.error(f"查询执行错误: {e}")
+
+                df = custom_state["df"]
+                if not df.empty:
+                    st.success(f"查询成功，已加载 {len(df)} 条记录")
+                    if page.truncated_by_memory:
+                        st.warning("结果超出内存预算，已截断本页，可继续加载更多")
+                    elif page.has_more:
+                        st.info(
+                            "结果超过行数上限，可点击“加载更多”继续获取；"
+                            "查询需以唯一键 ORDER BY 排序，分页才不会重复或遗漏记录"
+                        )
+                    st.dataframe(df)
 
-                        # Show stats for numerical columns with improved UI
-                        numeric_cols = df.select_dtypes(include=["number"]).columns
-                        if len(numeric_cols) > 0:
-                            with st.expander("数值字段统计信息"):
-                                st.dataframe(df[numeric_cols].describe())
+                    # Show stats for numerical columns with improved UI
+                    numeric_cols = df.select_dtypes(include=["number"]).columns
+                    if len(numeric_cols) > 0:
+                        with st.expander("数值字段统计信息"):
+                            st.dataframe(df[numeric_cols].describe())
 
-                        # 提供下载选项
-                        st.download_button(
-                            label="📥 下载查询结果",
-                            data=df.to_csv(index=False).encode("utf-8"),
-                            file_name="custom_query_results.csv",
-                            mime="text/csv",
-                        )
-                    else:
-                        st.info("查询未返回任何结果")
+                    # 提供下载选项
+                    st.download_button(
+                        label="📥 下载查询结果",
+                        data=df.to_csv(index=False).encode("utf-8"),
+                        file_name="custom_query_results.csv",
+                        mime="text/csv",
+                    )
+                else:
+                    st.info("查询未返回任何结果")
 
     # ---------- Organization Analysis ----------
     with tab3:
@@ -1035,17 +1251,12 @@ else:  # 医嘱与检验分析模式
         st.markdown("此页面展示各机构缺失的数据统计信息")
 
         # Get missing items by organization
-        missing_by_org_query = f"""
-        SELECT p.org_name as "机构名称", COUNT(*) as "缺失数量"
-        FROM {parent_table} p
-        LEFT JOIN {item_table} i ON p.id = i.{join_field}
-        WHERE i.id IS NULL
-        GROUP BY p.org_name
-        ORDER BY "缺失数量" DESC
-        """
+        missing_by_org_query = queries.missing_by_org_query(linkage, query_scope)
 
         with st.spinner("正在加载数据..."):
-            missing_by_org = execute_query(missing_by_org_query)
+            missing_by_org = with_org_names(
+                execute_query_in_background(missing_by_org_query, "按机构统计")
+            )
 
             if not missing_by_org.empty:
                 # 显示摘要指标
@@ -1084,8 +1295,8 @@ else:  # 医嘱与检验分析模式
 
                     # 缺失数量分布直方图
                     st.markdown("##### 缺失数量分布")
-                    hist_fig = px.histogram(
-                        missing_by_org, x="缺失数量", nbins=20, title="机构缺失数量分布"
+                    hist_fig = create_chart(
+                        missing_by_org, "histogram", "缺失数量", None, "机构缺失数量分布"
                     )
                     hist_fig.update_traces(marker_color="#6699cc")
                     hist_fig.update_layout(
@@ -1107,11 +1318,9 @@ else:  # 医嘱与检验分析模式
 
                     # 应用筛选
                     if search_term:
-                        filtered_data = missing_by_org[
-                            missing_by_org["机构名称"].str.contains(
-                                search_term, case=False
-                            )
-                        ]
+                        filtered_data = filter_orgs(
+                            missing_by_org, "机构代码", "机构名称", search_term
+                        )
                     else:
                         filtered_data = missing_by_org
 
@@ -1143,5 +1352,50 @@ else:  # 医嘱与检验分析模式
                         file_name=f"{data_type}_missing_by_organization.csv",
                         mime="text/csv",
                     )
+
+                    # 机构明细：按机构代码在服务器端查询，使用预编译语句
+                    st.markdown("##### 机构明细")
+                    org_labels = dict(
+                        zip(filtered_data["机构代码"], filtered_data["机构名称"])
+                    )
+                    drill_org = st.selectbox(
+                        "选择机构:",
+                        list(org_labels),
+                        format_func=lambda code: f"{org_labels[code]} ({code})",
+                        key="drilldown_org",
+                    )
+                    if drill_org is not None and st.button(
+                        "查看机构明细", key="drilldown_button"
+                    ):
+                        try:
+                            drilldown = get_org_drilldown()
+                            start = time.perf_counter()
+                            missing_df = pd.DataFrame(
+                                drilldown.missing_items(linkage, drill_org)
+                            )
+                            patients_df = pd.DataFrame(
+                                drilldown.missing_patients(linkage, drill_org)
+                            )
+                            elapsed_ms = (time.perf_counter() - start) * 1000
+                        except DatabaseError as e:
+                            st.error(f"查询执行错误: {e}")
+                        else:
+                            st.caption(f"查询耗时 {elapsed_ms:.1f} ms")
+                            drill_tab1, drill_tab2 = st.tabs(
+                                [
+                                    f"无{data_type}的{parent_table_name} ({len(missing_df)})",
+                                    f"患者信息缺失 ({len(patients_df)})",
+                                ]
+                            )
+                            with drill_tab1:
+                                st.dataframe(missing_df)
+                            with drill_tab2:
+                                st.dataframe(patients_df)
             else:
                 st.info(f"未找到{data_type}缺失数据")
+
+        with st.expander("⏱️ 查询性能分析"):
+            st.code(missing_by_org_query, language="sql")
+            if st.button("分析按机构统计查询", key="profile_missing_by_org"):
+                with st.spinner("正在分析查询计划..."):
+                    render_query_profile(missing_by_org_query)
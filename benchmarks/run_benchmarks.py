@@ -0,0 +1,259 @@
+"""
+Benchmark suite for the dashboard query catalog and the package APIs.
+
+Loads synthetic emr_back data at a configurable scale into a throwaway local
+PostgreSQL (started with initdb/pg_ctl) or into a database given by --dsn, then
+times every dashboard query, fetch_patient_emr_records, generate_database_metadata
+and the CSV/JSON export paths. Results are written as JSON for regression tracking.
+
+    python benchmarks/run_benchmarks.py --scale 1000000 --output bench.json
+    python benchmarks/run_benchmarks.py --dsn postgresql://u:p@host:5432/bench --skip-load
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import pandas as pd
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shcdc_emr_db import DatabaseManager, QueryExecutor, EMRRecordManager, generate_database_metadata  # noqa: E402
+from shcdc_emr_db.catalog import QueryCatalog  # noqa: E402
+from shcdc_emr_db.search import NarrativeSearch, NARRATIVE_FIELDS  # noqa: E402
+from shcdc_emr_db.vitals import VitalSignsSeries  # noqa: E402
+from shcdc_emr_db.synthetic import SyntheticConfig, SyntheticDataGenerator  # noqa: E402
+from shcdc_emr_db.queries import dashboard_query_catalog, orphaned_items_query  # noqa: E402
+
+from schema import DDL, LOAD_STATEMENTS, POST_LOAD, scale_parameters  # noqa: E402
+
+
+@contextmanager
+def local_postgres() -> Iterator[str]:
+    """Start a temporary PostgreSQL cluster and yield its DSN; removed on exit"""
+    for binary in ("initdb", "pg_ctl"):
+        if shutil.which(binary) is None:
+            raise SystemExit(f"{binary} not found on PATH; install PostgreSQL or pass --dsn")
+
+    data_dir = tempfile.mkdtemp(prefix="emr-bench-pg-")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    subprocess.run(["initdb", "-D", data_dir, "-U", "bench", "--auth=trust", "-E", "UTF8"],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(["pg_ctl", "-D", data_dir, "-w", "-l", os.path.join(data_dir, "server.log"),
+                    "-o", f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://bench@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def manager_from_dsn(dsn: str, config_dir: str) -> DatabaseManager:
+    """Write the DSN out as an INI section so the package's DatabaseManager can use it"""
+    url = urlparse(dsn)
+    config_file = os.path.join(config_dir, "database.ini")
+    with open(config_file, "w", encoding="utf-8") as f:
+        f.write("[postgresql]\n")
+        f.write(f"host={url.hostname or 'localhost'}\n")
+        f.write(f"port={url.port or 5432}\n")
+        f.write(f"database={url.path.lstrip('/') or 'postgres'}\n")
+        f.write(f"user={url.username or ''}\n")
+        f.write(f"password={url.password or ''}\n")
+    return DatabaseManager(config_file)
+
+
+def load_data(db_manager: DatabaseManager, params: Dict[str, float], seed: float) -> Dict[str, float]:
+    """Create the schema and fill every table; returns load seconds per table"""
+    timings = {}
+    with db_manager.engine.begin() as conn:
+        conn.execute(text(DDL))
+        conn.execute(text("SELECT setseed(:seed)"), {"seed": seed})
+        for table, statement in LOAD_STATEMENTS.items():
+            start = time.perf_counter()
+            conn.execute(text(statement), params)
+            timings[table] = time.perf_counter() - start
+            print(f"loaded {table} in {timings[table]:.1f}s")
+    with db_manager.engine.begin() as conn:
+        conn.execute(text(POST_LOAD))
+    return timings
+
+
+def copy_data(db_manager: DatabaseManager, args: argparse.Namespace) -> Dict[str, float]:
+    """Load every emr_back table through the package's COPY-based generator"""
+    config = SyntheticConfig(
+        scale=args.scale,
+        seed=int(abs(args.seed) * 1_000_000),
+        n_orgs=args.orgs,
+        default_null_rate=args.null_rate,
+        orphan_rate=args.orphan_rate,
+        duplicate_id_rate=0.0,
+    )
+    generator = SyntheticDataGenerator(config)
+    stats = generator.load(
+        db_manager,
+        progress=lambda s: print(f"copied {s.table} ({s.rows:,} rows) in {s.seconds:.1f}s"),
+    )
+    with db_manager.engine.begin() as conn:
+        conn.execute(text(POST_LOAD))
+    return {s.table: s.seconds for s in stats}
+
+
+def time_call(name: str, group: str, func: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Run `func` once to warm caches, then `repeat` timed runs"""
+    result = func()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        runs.append((time.perf_counter() - start) * 1000)
+    rows = len(result) if hasattr(result, "__len__") else None
+    entry = {
+        "name": name,
+        "group": group,
+        "runs_ms": [round(run, 3) for run in runs],
+        "min_ms": round(min(runs), 3),
+        "median_ms": round(statistics.median(runs), 3),
+        "max_ms": round(max(runs), 3),
+        "rows": rows,
+    }
+    print(f"{group:10s} {name:45s} median {entry['median_ms']:10.1f} ms")
+    return entry
+
+
+def run_benchmarks(db_manager: DatabaseManager, repeat: int, workdir: str) -> List[Dict[str, Any]]:
+    """Time the dashboard catalog, package APIs and export paths"""
+    results = []
+    engine = db_manager.engine
+    executor = QueryExecutor(db_manager)
+    emr_manager = EMRRecordManager(executor)
+
+    # Dashboard queries run through pandas exactly as app_integrated.execute_query does
+    for name, query in dashboard_query_catalog().items():
+        results.append(time_call(name, "dashboard", lambda q=query: pd.read_sql_query(q, engine), repeat))
+
+    # The same queries as compiled prepared statements, as the dashboard runs them
+    catalog = QueryCatalog(db_manager)
+    for name in catalog.names():
+        results.append(time_call(name, "prepared", lambda n=name: catalog.frame(n), repeat))
+
+    # Narrative search: LIKE over the four fields, then the same term through the bigram GIN index
+    like = " OR ".join(f"{column} LIKE :pattern" for column in NARRATIVE_FIELDS)
+    like_query = f"SELECT id FROM emr_back.emr_outpatient_record WHERE {like}"
+    results.append(time_call(
+        "outpatient_narrative.like_scan", "search",
+        lambda: executor.execute(like_query, {"pattern": "%主诉12%"}), repeat))
+    search = NarrativeSearch(db_manager)
+    search.install()
+    try:
+        results.append(time_call(
+            "outpatient_narrative.bigram_index", "search", lambda: search.search("主诉12").rows, repeat))
+    finally:
+        search.uninstall()
+
+    results.append(time_call(
+        "fetch_patient_emr_records.latest", "package",
+        lambda: emr_manager.fetch_patient_emr_records(limit=100), repeat))
+    results.append(time_call(
+        "fetch_patient_emr_records.by_patient", "package",
+        lambda: emr_manager.fetch_patient_emr_records(patient_id="P1", limit=100), repeat))
+    vitals = VitalSignsSeries(executor)
+    results.append(time_call(
+        "vital_signs.series_by_patient", "package",
+        lambda: vitals.series(["P1"], max_points=200), repeat))
+    results.append(time_call(
+        "generate_database_metadata", "package",
+        lambda: generate_database_metadata(db_manager=db_manager)["tables"], repeat))
+
+    metadata_file = os.path.join(workdir, "metadata.json")
+    results.append(time_call(
+        "metadata_json", "export",
+        lambda: generate_database_metadata(output_file=metadata_file, db_manager=db_manager)["tables"], repeat))
+    for linkage in ("order", "ex_lab", "ex_clinical"):
+        query = orphaned_items_query(linkage)
+        results.append(time_call(
+            f"{linkage}.orphaned_items_csv", "export",
+            lambda q=query: pd.read_sql_query(q, engine).to_csv(index=False).encode("utf-8"), repeat))
+    return results
+
+
+def environment_info(db_manager: DatabaseManager) -> Dict[str, Any]:
+    with db_manager.get_connection() as conn:
+        server_version = conn.execute(text("SHOW server_version")).scalar()
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "postgresql": server_version,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the EMR dashboard queries and package APIs")
+    parser.add_argument("--dsn", help="PostgreSQL DSN to use instead of a temporary local cluster")
+    parser.add_argument("--scale", type=int, default=1_000_000,
+                        help="number of order items (largest table); other tables are derived from it")
+    parser.add_argument("--orgs", type=int, default=200, help="number of organizations")
+    parser.add_argument("--null-rate", type=float, default=0.05, help="share of NULLs in nullable fields")
+    parser.add_argument("--orphan-rate", type=float, default=0.02, help="share of items without a parent")
+    parser.add_argument("--seed", type=float, default=0.42, help="random seed in [-1, 1] for setseed()")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--skip-load", action="store_true", help="reuse data already loaded at --dsn")
+    parser.add_argument("--loader", choices=("sql", "copy"), default="sql",
+                        help="generate data server-side with generate_series, or client-side streamed via COPY")
+    parser.add_argument("--output", default="bench_output.json", help="where to write the JSON results")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    params = scale_parameters(args.scale, args.orgs, args.null_rate, args.orphan_rate)
+
+    with tempfile.TemporaryDirectory(prefix="emr-bench-") as workdir:
+        with (nullcontext(args.dsn) if args.dsn else local_postgres()) as dsn:
+            db_manager = manager_from_dsn(dsn, workdir)
+            if args.skip_load:
+                load_timings = {}
+            elif args.loader == "copy":
+                load_timings = copy_data(db_manager, args)
+            else:
+                load_timings = load_data(db_manager, params, args.seed)
+            results = run_benchmarks(db_manager, args.repeat, workdir)
+            report = {
+                "environment": environment_info(db_manager),
+                "parameters": {**params, "scale": args.scale, "seed": args.seed, "repeat": args.repeat,
+                               "loader": args.loader},
+                "load_seconds": load_timings,
+                "results": results,
+            }
+            db_manager.engine.dispose()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
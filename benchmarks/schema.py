@@ -0,0 +1,226 @@
+"""
+Benchmark schema and synthetic data.
+Creates the emr_back tables used by the dashboard and package APIs and fills them
+server-side with generate_series, so loading tens of millions of rows needs no
+client round trips.
+"""
+
+from typing import Dict
+
+# Columns are text unless noted, mirroring the source system's loose typing
+DDL = """
+CREATE SCHEMA IF NOT EXISTS emr_back;
+
+DROP TABLE IF EXISTS emr_back.emr_patient_info, emr_back.emr_outpatient_record,
+    emr_back.emr_order, emr_back.emr_order_item,
+    emr_back.emr_ex_lab, emr_back.emr_ex_lab_item,
+    emr_back.emr_ex_clinical, emr_back.emr_ex_clinical_item,
+    emr_back.emr_vital_signs_record CASCADE;
+
+CREATE TABLE emr_back.emr_patient_info (
+    id varchar(80), patient_id varchar(80), patient_name varchar(100),
+    gender varchar(10), age integer,
+    id_card_type_code varchar(2), id_card_type_name varchar(20), id_card varchar(50),
+    gender_code varchar(2), gender_name varchar(10), birth_date date,
+    nation_code varchar(4), current_addr_code varchar(12), current_addr_detail varchar(200),
+    marital_status_code varchar(2), education_code varchar(4),
+    tel varchar(20), contacts varchar(50), contacts_tel varchar(20),
+    org_code varchar(50), org_name varchar(100), operation_time timestamp
+);
+
+CREATE TABLE emr_back.emr_outpatient_record (
+    id varchar(80), outpatient_record_id varchar(80),
+    patient_id varchar(80), patient_name varchar(100), visit_time timestamp,
+    dept_name varchar(100), clinic_diagnosis text, chief_complaint text,
+    present_illness text, physical_examination text,
+    org_code varchar(50), org_name varchar(100)
+);
+
+CREATE TABLE emr_back.emr_order (
+    id varchar(80), patient_id varchar(80), patient_name varchar(100),
+    activity_type_name varchar(50), prescription_no varchar(50),
+    prescription_type_code varchar(2), prescription_issuance_date timestamp,
+    org_code varchar(50), org_name varchar(100), dept_name varchar(100),
+    create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_order_item (
+    id varchar(80), order_id varchar(80), drug_code varchar(50), drug_name varchar(200),
+    drug_specifications varchar(100), drug_dosage_code varchar(20),
+    drug_dosage_unit_code varchar(20), drug_dosage_unit_name varchar(20),
+    drug_dosage_total numeric, tcm_prescription varchar(200), tcm_number integer,
+    tcm_decoction_method varchar(100), tcm_use_method varchar(100),
+    operator_id varchar(50), operation_time timestamp, invalid_flag varchar(1),
+    data_status varchar(1), create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_ex_lab (
+    id varchar(80), patient_id varchar(80), patient_name varchar(100),
+    apply_dept_name varchar(100), sample_type_name varchar(50), lab_apply_no varchar(50),
+    apply_time timestamp, report_time timestamp,
+    org_code varchar(50), org_name varchar(100), create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_ex_lab_item (
+    id varchar(80), ex_lab_id varchar(80), lab_item_code varchar(50),
+    lab_item_name varchar(100), item_result varchar(100), item_unit varchar(20),
+    item_result_flag varchar(2), reference_range varchar(100), critical_value_flag varchar(1),
+    operator_id varchar(50), operation_time timestamp, invalid_flag varchar(1),
+    data_status varchar(1), create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_ex_clinical (
+    id varchar(80), patient_id varchar(80), patient_name varchar(100),
+    clinical_type_name varchar(50), application_date timestamp,
+    clinical_apply_no varchar(50), apply_dept_name varchar(100), result_date timestamp,
+    org_code varchar(50), org_name varchar(100), create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_ex_clinical_item (
+    id varchar(80), ex_clinical_id varchar(80), clinical_item_code varchar(50),
+    clinical_item_name varchar(100), item_result varchar(100), item_unit varchar(20),
+    item_method varchar(50), item_device varchar(50), item_result_flag varchar(2),
+    operator_id varchar(50), operation_time timestamp, invalid_flag varchar(1),
+    data_status varchar(1), create_date timestamp
+);
+
+CREATE TABLE emr_back.emr_vital_signs_record (
+    id varchar(80), patient_id varchar(80), patient_name varchar(100),
+    vital_signs_item_code varchar(20), vital_signs_item_name varchar(50),
+    vital_signs_value numeric, measure_time timestamp,
+    org_code varchar(50), org_name varchar(100),
+    operation_time timestamp, invalid_flag varchar(1), data_status varchar(1)
+);
+"""
+
+# Unique ids as created by the sql/ scripts after deduplication
+POST_LOAD = """
+ALTER TABLE emr_back.emr_patient_info ADD CONSTRAINT emr_patient_info_pk PRIMARY KEY (id);
+CREATE INDEX emr_patient_info_patient_id_idx ON emr_back.emr_patient_info (patient_id);
+ALTER TABLE emr_back.emr_order ADD CONSTRAINT emr_order_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_order_item ADD CONSTRAINT emr_order_item_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_ex_lab ADD CONSTRAINT emr_ex_lab_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_ex_lab_item ADD CONSTRAINT emr_ex_lab_item_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_ex_clinical ADD CONSTRAINT emr_ex_clinical_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_ex_clinical_item ADD CONSTRAINT emr_ex_clinical_item_unique UNIQUE (id);
+ALTER TABLE emr_back.emr_vital_signs_record ADD CONSTRAINT emr_vital_signs_record_unique UNIQUE (id);
+CREATE INDEX emr_vital_signs_record_patient_time_idx ON emr_back.emr_vital_signs_record (patient_id, measure_time);
+ANALYZE;
+"""
+
+# Expression for a skewed organization number: a few orgs hold most of the rows
+_ORG = "lpad(floor(power(random(), 2) * :n_orgs)::text, 4, '0')"
+
+# Expression returning NULL with probability :null_rate
+def _nullable(expr: str) -> str:
+    return f"CASE WHEN random() < :null_rate THEN NULL ELSE {expr} END"
+
+LOAD_STATEMENTS: Dict[str, str] = {
+    "emr_patient_info": f"""
+    INSERT INTO emr_back.emr_patient_info
+    SELECT 'P' || g, 'P' || g, {_nullable("'患者' || g")},
+        CASE WHEN g % 2 = 0 THEN '男' ELSE '女' END, (g % 90)::int,
+        {_nullable("'01'")}, '居民身份证',
+        {_nullable("'3101' || lpad((g % 100000000000000)::text, 14, '0')")},
+        {_nullable("((g % 2) + 1)::text")}, CASE WHEN g % 2 = 0 THEN '男' ELSE '女' END,
+        {_nullable("date '1930-01-01' + (g % 30000)")},
+        {_nullable("'01'")}, {_nullable("'310101'")}, {_nullable("'上海市某路' || (g % 1000) || '号'")},
+        {_nullable("'10'")}, {_nullable("'20'")}, {_nullable("'138' || lpad((g % 100000000)::text, 8, '0')")},
+        {_nullable("'联系人' || g")}, {_nullable("'139' || lpad((g % 100000000)::text, 8, '0')")},
+        'ORG' || org, '机构' || org, timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_patients) g) s
+    """,
+    # Narrative text uses the COPY loader's '<prefix><n>' vocabulary, so search terms match under both
+    "emr_outpatient_record": f"""
+    INSERT INTO emr_back.emr_outpatient_record
+    SELECT 'OP' || g, 'OP' || g, 'P' || (1 + floor(random() * :n_patients))::bigint, '患者' || g,
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day', '内科',
+        '诊断' || (g % 500), '主诉' || (g % 2000), '现病史' || (g % 5000), '体格检查' || (g % 2000),
+        'ORG' || org, '机构' || org
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_outpatient) g) s
+    """,
+    "emr_order": f"""
+    INSERT INTO emr_back.emr_order
+    SELECT 'O' || g, 'P' || (1 + floor(random() * :n_patients))::bigint, '患者' || g,
+        '门诊', 'RX' || g, '1', timestamp '2020-01-01' + (g % 1500) * interval '1 day',
+        'ORG' || org, '机构' || org, '内科', timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_orders) g) s
+    """,
+    # Parent ids drawn past the parent range produce :orphan_rate orphaned items
+    "emr_order_item": f"""
+    INSERT INTO emr_back.emr_order_item
+    SELECT 'OI' || g, 'O' || (1 + floor(random() * :n_orders * (1 + :orphan_rate)))::bigint,
+        {_nullable("'D' || (g % 5000)")}, '药品' || (g % 5000), '10mg*24片', '1', 'mg', '毫克',
+        (g % 100)::numeric, NULL, NULL, NULL, NULL, 'U' || (g % 500),
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day', '0', '1',
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM generate_series(1, :n_order_items) g
+    """,
+    "emr_ex_lab": f"""
+    INSERT INTO emr_back.emr_ex_lab
+    SELECT 'L' || g, 'P' || (1 + floor(random() * :n_patients))::bigint, '患者' || g,
+        '检验科', '血液', 'LA' || g, timestamp '2020-01-01' + (g % 1500) * interval '1 day',
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day' + interval '4 hours',
+        'ORG' || org, '机构' || org, timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_labs) g) s
+    """,
+    "emr_ex_lab_item": f"""
+    INSERT INTO emr_back.emr_ex_lab_item
+    SELECT 'LI' || g, 'L' || (1 + floor(random() * :n_labs * (1 + :orphan_rate)))::bigint,
+        'LI' || (g % 300), '检验项目' || (g % 300), {_nullable("(g % 200)::text")}, 'g/L', 'N',
+        '0-200', '0', 'U' || (g % 500), timestamp '2020-01-01' + (g % 1500) * interval '1 day',
+        '0', '1', timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM generate_series(1, :n_lab_items) g
+    """,
+    "emr_ex_clinical": f"""
+    INSERT INTO emr_back.emr_ex_clinical
+    SELECT 'C' || g, 'P' || (1 + floor(random() * :n_patients))::bigint, '患者' || g,
+        '心电图', timestamp '2020-01-01' + (g % 1500) * interval '1 day', 'CA' || g, '功能科',
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day' + interval '1 day',
+        'ORG' || org, '机构' || org, timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_clinicals) g) s
+    """,
+    "emr_ex_clinical_item": f"""
+    INSERT INTO emr_back.emr_ex_clinical_item
+    SELECT 'CI' || g, 'C' || (1 + floor(random() * :n_clinicals * (1 + :orphan_rate)))::bigint,
+        'CI' || (g % 100), '临床项目' || (g % 100), {_nullable("(g % 100)::text")}, 'bpm',
+        '自动', '设备' || (g % 10), 'N', 'U' || (g % 500),
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day', '0', '1',
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day'
+    FROM generate_series(1, :n_clinical_items) g
+    """,
+    # Readings cycle through the six VitalSignsSeries items; :null_rate of them are flagged invalid
+    "emr_vital_signs_record": f"""
+    INSERT INTO emr_back.emr_vital_signs_record
+    SELECT 'VS' || g, 'P' || (1 + floor(random() * :n_patients))::bigint, '患者' || g,
+        (ARRAY['T', 'P', 'R', 'SBP', 'DBP', 'SPO2'])[1 + g % 6],
+        (ARRAY['体温', '脉搏', '呼吸', '收缩压', '舒张压', '血氧饱和度'])[1 + g % 6],
+        round((30 + random() * 150)::numeric, 1),
+        timestamp '2020-01-01' + (g % 1500) * interval '1 day' + (g % 24) * interval '1 hour',
+        'ORG' || org, '机构' || org, timestamp '2020-01-01' + (g % 1500) * interval '1 day',
+        CASE WHEN random() < :null_rate THEN '1' ELSE '0' END, '1'
+    FROM (SELECT g, {_ORG} AS org FROM generate_series(1, :n_vital_signs) g) s
+    """,
+}
+
+
+def scale_parameters(scale: int, n_orgs: int = 200, null_rate: float = 0.05, orphan_rate: float = 0.02) -> Dict[str, float]:
+    """
+    Row counts for every table given `scale`, the number of order items.
+    Ratios follow the production data: roughly 4 items per order and 10 per patient,
+    and one vital-sign reading per order item.
+    """
+    return {
+        "n_order_items": scale,
+        "n_orders": max(scale // 4, 1),
+        "n_patients": max(scale // 10, 1),
+        "n_outpatient": max(scale // 5, 1),
+        "n_labs": max(scale // 4, 1),
+        "n_lab_items": scale,
+        "n_clinicals": max(scale // 10, 1),
+        "n_clinical_items": max(scale // 2, 1),
+        "n_vital_signs": scale,
+        "n_orgs": n_orgs,
+        "null_rate": null_rate,
+        "orphan_rate": orphan_rate,
+    }
@@ -9,7 +9,18 @@ setup(
         "psycopg2-binary>=2.9.9",
         "langchain-community>=0.0.10",
         "configparser>=6.0.0",
+        "numpy>=1.24.0",
+        "pandas>=2.1.0",
     ],
+    extras_require={
+        "parquet": ["pyarrow>=14.0.0"],
+        "snapshot": ["duckdb>=0.10.0", "pyarrow>=14.0.0"],
+    },
+    entry_points={
+        "console_scripts": [
+            "shcdc-emr=shcdc_emr_db.cli:main",
+        ],
+    },
     author="SHCDC",
     author_email="",
     description="A Python package for managing EMR database operations",
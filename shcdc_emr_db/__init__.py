@@ -10,11 +10,33 @@ from .db import (
     DatabaseError,
     ConfigError,
     QueryError,
+    QueryRejectedError,
     generate_database_metadata,
     get_db,
     run_sql_query,
     fetch_patient_emr_records,
 )
+from .profiler import PlanNode, QueryProfile, parse_explain_json
+from .guard import GuardedQueryExecutor, GuardedResult, validate_read_only_query
+from .jobs import QueryJob, QueryJobManager
+from .synthetic import SyntheticConfig, SyntheticDataGenerator, TABLE_SPECS
+from .formatting import EMRTextFormatter, EMR_ANALYSIS_TEMPLATE, truncate_tokens
+from .partitioning import PartitionManager, PartitionInfo
+from .drilldown import OrgDrilldown
+from .checks import PatientInfoChecker, CheckReport, check_patient_frame
+from .scan import ScanEngine, ScanRange, ScanResult
+from .matching import PatientMatcher, MatchResult
+from .trends import QualityTrendStore, MetricSet
+from .report import QualityReport, ReportResult
+from .federation import FederatedExecutor, FederatedResult, merge_frames
+from .snapshot import ParquetSnapshot, SnapshotExecutor
+from .counters import LinkageCounters
+from .catalog import QueryCatalog, CompiledQuery
+from .dtypes import compact_frame, column_types
+from .orgs import OrgDimension, label_orgs
+from .search import NarrativeSearch, SearchPage
+from .vitals import VitalSignsSeries, VITAL_SIGN_ITEMS
+from .codes import CodeValidator, CODE_SYSTEMS, FIELD_CODE_SYSTEMS, read_code_systems_csv
 
 __version__ = "0.1.0"
 __all__ = [
@@ -24,8 +46,58 @@ __all__ = [
     "DatabaseError",
     "ConfigError",
     "QueryError",
+    "QueryRejectedError",
     "generate_database_metadata",
     "get_db",
     "run_sql_query",
     "fetch_patient_emr_records",
+    "PlanNode",
+    "QueryProfile",
+    "parse_explain_json",
+    "GuardedQueryExecutor",
+    "GuardedResult",
+    "validate_read_only_query",
+    "QueryJob",
+    "QueryJobManager",
+    "SyntheticConfig",
+    "SyntheticDataGenerator",
+    "TABLE_SPECS",
+    "EMRTextFormatter",
+    "EMR_ANALYSIS_TEMPLATE",
+    "truncate_tokens",
+    "PartitionManager",
+    "PartitionInfo",
+    "OrgDrilldown",
+    "CodeValidator",
+    "CODE_SYSTEMS",
+    "FIELD_CODE_SYSTEMS",
+    "read_code_systems_csv",
+    "PatientInfoChecker",
+    "CheckReport",
+    "check_patient_frame",
+    "ScanEngine",
+    "ScanRange",
+    "ScanResult",
+    "PatientMatcher",
+    "MatchResult",
+    "QualityTrendStore",
+    "MetricSet",
+    "QualityReport",
+    "ReportResult",
+    "FederatedExecutor",
+    "FederatedResult",
+    "merge_frames",
+    "ParquetSnapshot",
+    "SnapshotExecutor",
+    "LinkageCounters",
+    "QueryCatalog",
+    "CompiledQuery",
+    "compact_frame",
+    "column_types",
+    "OrgDimension",
+    "label_orgs",
+    "NarrativeSearch",
+    "SearchPage",
+    "VitalSignsSeries",
+    "VITAL_SIGN_ITEMS",
 ] 
\ No newline at end of file
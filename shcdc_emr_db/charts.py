@@ -0,0 +1,114 @@
+"""
+Chart payload reduction.
+Server-side aggregation that keeps the data handed to Plotly bounded however many
+organizations a result has: top-N plus an "others" bucket for categories, 2-D
+binning for large scatter plots, pre-binned histograms and min/max line downsampling.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Categories shown in bar and pie charts before the rest are bucketed
+MAX_CATEGORIES = 20
+# Scatter plots switch to WebGL above this many points, and are binned above MAX_SCATTER_POINTS
+WEBGL_THRESHOLD = 500
+MAX_SCATTER_POINTS = 2000
+# Points per line series
+MAX_LINE_POINTS = 500
+HISTOGRAM_BINS = 20
+
+OTHERS_LABEL = "其他"
+COUNT_LABEL = "机构数"
+
+
+def top_n_with_others(
+    df: pd.DataFrame,
+    label_col: str,
+    value_col: str,
+    n: int = MAX_CATEGORIES,
+    color_col: Optional[str] = None,
+    agg: str = "sum",
+    others_label: str = OTHERS_LABEL
+) -> pd.DataFrame:
+    """
+    Keep the `n` labels with the largest values and fold the rest into one
+    `others_label` row (per color group), aggregated with `agg` ("sum" or "mean").
+    """
+    if df[label_col].nunique() <= n:
+        return df
+    totals = df.groupby(label_col, sort=False, observed=True)[value_col].agg(agg)
+    top = totals.nlargest(n).index
+    keep = df[label_col].isin(top)
+    group = [color_col] if color_col else []
+    if group:
+        others = df[~keep].groupby(group, as_index=False, sort=False, observed=True)[value_col].agg(agg)
+    else:
+        others = pd.DataFrame({value_col: [df.loc[~keep, value_col].agg(agg)]})
+    others[label_col] = others_label
+    return pd.concat([df.loc[keep, [label_col, value_col, *group]], others], ignore_index=True)
+
+
+def bin_scatter(
+    df: pd.DataFrame,
+    x_col: str,
+    y_col: str,
+    max_points: int = MAX_SCATTER_POINTS,
+    size_col: Optional[str] = None,
+    count_label: str = COUNT_LABEL
+) -> pd.DataFrame:
+    """
+    Aggregate points into at most `max_points` cells of a regular grid; each cell is
+    drawn at the mean of its points with the point count (and summed `size_col`).
+    """
+    bins = max(int(np.sqrt(max_points)), 1)
+    data = df[[x_col, y_col, *([size_col] if size_col and size_col not in (x_col, y_col) else [])]].dropna()
+    cells = [pd.cut(data[x_col], bins, labels=False), pd.cut(data[y_col], bins, labels=False)]
+    grouped = data.groupby(cells, observed=True)
+    binned = grouped[[x_col, y_col]].mean()
+    binned[count_label] = grouped.size()
+    if size_col and size_col not in (x_col, y_col):
+        binned[size_col] = grouped[size_col].sum()
+    return binned.reset_index(drop=True)
+
+
+def histogram_bins(values: pd.Series, bins: int = HISTOGRAM_BINS, count_label: str = COUNT_LABEL) -> pd.DataFrame:
+    """Histogram counts computed server-side, one row per bin with a range label"""
+    values = pd.to_numeric(values, errors="coerce").dropna()
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({
+        "区间": [f"{lo:,.0f}-{hi:,.0f}" for lo, hi in zip(edges[:-1], edges[1:])],
+        "起点": edges[:-1],
+        count_label: counts,
+    })
+
+
+def downsample_line(
+    df: pd.DataFrame,
+    x_col: str,
+    y_col: str,
+    group_col: Optional[str] = None,
+    max_points: int = MAX_LINE_POINTS
+) -> pd.DataFrame:
+    """
+    Reduce each line series to about `max_points` points by keeping the first, last,
+    minimum and maximum point of equal-width x buckets, so peaks and dips survive.
+    """
+    groups = df.groupby(group_col, sort=False) if group_col else [(None, df)]
+    if all(len(series) <= max_points for _, series in groups):
+        return df
+    parts = []
+    for _, series in groups:
+        series = series.sort_values(x_col).reset_index(drop=True)
+        if len(series) <= max_points:
+            parts.append(series)
+            continue
+        buckets = np.arange(len(series)) * max(max_points // 4, 1) // len(series)
+        by_bucket = series[y_col].groupby(buckets)
+        keep = np.unique(np.concatenate([
+            by_bucket.head(1).index, by_bucket.tail(1).index,
+            by_bucket.idxmin().dropna(), by_bucket.idxmax().dropna(),
+        ]).astype(int))
+        parts.append(series.iloc[keep])
+    return pd.concat(parts, ignore_index=True)
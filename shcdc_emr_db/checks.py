@@ -0,0 +1,279 @@
+"""
+Vectorized in-process quality checks.
+Checks that are awkward in SQL (ID-card format and checksum, birth-date
+plausibility, phone patterns, org code/name consistency) run on DataFrame chunks
+streamed from QueryExecutor. Strings are viewed as fixed-width code-point matrices
+so the per-character checks are NumPy array arithmetic, not per-row Python.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .db import QueryExecutor
+from .queries import QueryScope, _where
+
+# CV02.01.101 types whose number is a resident ID number (居民身份证, 居民户口簿)
+RESIDENT_ID_TYPES = ("01", "02")
+
+# GB 11643 check digit weights and check characters indexed by the weighted sum mod 11
+ID_CARD_WEIGHTS = np.array([7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2])
+ID_CARD_CHECK_CHARS = np.array([ord(c) for c in "10X98765432"])
+
+# Fixed lines with optional area code and extension; mobiles are checked on the matrix
+LANDLINE_PATTERN = r"(?:0\d{2,3}-?)?\d{7,8}(?:-\d{1,6})?"
+PHONE_PATTERN = LANDLINE_PATTERN + r"|1[3-9]\d{9}"
+
+MAX_AGE_YEARS = 150
+
+PATIENT_CHECKS = (
+    "id_card_format",
+    "id_card_checksum",
+    "id_card_birth_date",
+    "birth_date_implausible",
+    "age_mismatch",
+    "tel_format",
+    "contacts_tel_format",
+)
+
+PATIENT_COLUMNS = (
+    "id", "id_card_type_code", "id_card", "birth_date", "age",
+    "tel", "contacts_tel", "org_code", "org_name", "operation_time",
+)
+
+
+def _char_matrix(values: pd.Series, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (code points, lengths) of `values` as an (n, width) int matrix, padded with 0.
+    Strings longer than `width` report a length of width + 1.
+    """
+    chars = values.fillna("").to_numpy(dtype=f"U{width + 1}")
+    matrix = chars.view(np.int32).reshape(len(chars), width + 1)
+    # Code points are never 0 inside a string, only in the padding
+    return matrix[:, :width], (matrix != 0).sum(axis=1)
+
+
+def _is_digit(matrix: np.ndarray) -> np.ndarray:
+    return (matrix >= 48) & (matrix <= 57)
+
+
+def _digits_value(digits: np.ndarray) -> np.ndarray:
+    """Integer value of each row of a digit matrix"""
+    return digits @ (10 ** np.arange(digits.shape[1] - 1, -1, -1))
+
+
+def _dates(years: np.ndarray, months: np.ndarray, days: np.ndarray) -> pd.Series:
+    """Vectorized date construction; impossible dates become NaT"""
+    return pd.to_datetime(
+        pd.DataFrame({"year": years, "month": months, "day": days}), errors="coerce"
+    )
+
+
+def id_card_flags(
+    id_card: pd.Series,
+    birth_date: Optional[pd.Series] = None,
+    id_card_type_code: Optional[pd.Series] = None
+) -> pd.DataFrame:
+    """
+    Flag malformed resident ID numbers: id_card_format (not 18 digits with a digit/X
+    check character, or 15 legacy digits, or an impossible embedded birth date),
+    id_card_checksum (GB 11643 check character wrong) and id_card_birth_date
+    (embedded birth date differs from birth_date). Missing numbers and non-resident
+    ID types are not flagged.
+    """
+    index = id_card.index
+    matrix, lengths = _char_matrix(id_card, 18)
+    present = id_card.notna().to_numpy() & (lengths > 0)
+    if id_card_type_code is not None:
+        present &= id_card_type_code.isin(RESIDENT_ID_TYPES).to_numpy()
+
+    is_digit = _is_digit(matrix)
+    last = matrix[:, 17]
+    last_upper = np.where(last == ord("x"), ord("X"), last)
+    long_form = (lengths == 18) & is_digit[:, :17].all(axis=1) & (_is_digit(last) | (last_upper == ord("X")))
+    short_form = (lengths == 15) & is_digit[:, :15].all(axis=1)
+
+    digits = np.where(is_digit, matrix - 48, 0)
+    embedded = _dates(
+        np.where(long_form, _digits_value(digits[:, 6:10]), 1900 + _digits_value(digits[:, 6:8])),
+        np.where(long_form, _digits_value(digits[:, 10:12]), _digits_value(digits[:, 8:10])),
+        np.where(long_form, _digits_value(digits[:, 12:14]), _digits_value(digits[:, 10:12])),
+    )
+    well_formed = (long_form | short_form) & embedded.notna().to_numpy()
+
+    expected = ID_CARD_CHECK_CHARS[(digits[:, :17] @ ID_CARD_WEIGHTS) % 11]
+    checksum_ok = ~long_form | (expected == last_upper)
+
+    flags = pd.DataFrame(index=index)
+    flags["id_card_format"] = present & ~well_formed
+    flags["id_card_checksum"] = present & well_formed & ~checksum_ok
+    if birth_date is not None:
+        birth = pd.to_datetime(birth_date, errors="coerce").to_numpy()
+        differs = ~pd.isna(birth) & (birth != embedded.to_numpy())
+        flags["id_card_birth_date"] = present & well_formed & differs
+    return flags
+
+
+def birth_date_flags(
+    birth_date: pd.Series,
+    operation_time: Optional[pd.Series] = None,
+    age: Optional[pd.Series] = None,
+    as_of: Optional[date] = None
+) -> pd.DataFrame:
+    """
+    Flag implausible birth dates (in the future, more than MAX_AGE_YEARS ago, or
+    after the record's operation_time) and ages that disagree with the birth date
+    by more than a year at operation_time.
+    """
+    as_of_ts = pd.Timestamp(as_of or date.today())
+    birth = pd.to_datetime(birth_date, errors="coerce")
+    implausible = (birth > as_of_ts) | (birth < as_of_ts - pd.DateOffset(years=MAX_AGE_YEARS))
+    reference = as_of_ts
+    if operation_time is not None:
+        recorded = pd.to_datetime(operation_time, errors="coerce")
+        implausible |= birth > recorded.dt.normalize()
+        reference = recorded.fillna(as_of_ts)
+
+    flags = pd.DataFrame(index=birth_date.index)
+    flags["birth_date_implausible"] = implausible.fillna(False).to_numpy(dtype=bool)
+    if age is not None:
+        years = (pd.Series(reference, index=birth.index) - birth).dt.days / 365.2425
+        stated = pd.to_numeric(age, errors="coerce")
+        flags["age_mismatch"] = ((stated - years).abs() > 1).fillna(False).to_numpy(dtype=bool)
+    return flags
+
+
+def _is_mobile(matrix: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    return (
+        (lengths == 11)
+        & _is_digit(matrix[:, :11]).all(axis=1)
+        & (matrix[:, 0] == ord("1"))
+        & (matrix[:, 1] >= ord("3"))
+    )
+
+
+def phone_invalid(phones: pd.Series) -> pd.Series:
+    """
+    Flag phone numbers that are neither an 11-digit mainland mobile (1[3-9]...) nor
+    a fixed line. Spaces, brackets and a +86/86 prefix are ignored; missing numbers
+    are not flagged.
+    """
+    matrix, lengths = _char_matrix(phones, 20)
+    present = phones.notna().to_numpy() & (lengths > 0)
+    overlong = lengths > 20
+
+    # Drop separators by shifting the kept characters of each row to the left
+    keep = (matrix != 0) & ~np.isin(matrix, [ord(" "), ord("("), ord(")")])
+    order = np.argsort(~keep, axis=1, kind="stable")
+    matrix = np.where(np.take_along_axis(keep, order, axis=1), np.take_along_axis(matrix, order, axis=1), 0)
+    lengths = keep.sum(axis=1)
+
+    plus = matrix[:, 0] == ord("+")
+    country = (matrix[:, 0:2] == [ord("8"), ord("6")]).all(axis=1)
+    plus_country = plus & (matrix[:, 1:3] == [ord("8"), ord("6")]).all(axis=1)
+    mobile = (
+        _is_mobile(matrix, lengths)
+        | (country & _is_mobile(matrix[:, 2:], lengths - 2))
+        | (plus_country & _is_mobile(matrix[:, 3:], lengths - 3))
+    ) & ~overlong
+
+    # Only the remaining numbers, usually few, go through the regex
+    candidates = present & ~mobile
+    invalid = np.zeros(len(phones), dtype=bool)
+    if candidates.any():
+        cleaned = phones[candidates].str.replace(r"[\s()]|^\+?86-?", "", regex=True)
+        invalid[candidates] = ~cleaned.str.fullmatch(PHONE_PATTERN).fillna(False).to_numpy(dtype=bool)
+    return pd.Series(invalid, index=phones.index)
+
+
+def check_patient_frame(frame: pd.DataFrame, as_of: Optional[date] = None) -> pd.DataFrame:
+    """Boolean violation flags, one column per check in PATIENT_CHECKS present in `frame`"""
+    flags = pd.DataFrame(index=frame.index)
+    if "id_card" in frame:
+        flags = flags.join(id_card_flags(frame["id_card"], frame.get("birth_date"), frame.get("id_card_type_code")))
+    if "birth_date" in frame:
+        flags = flags.join(birth_date_flags(frame["birth_date"], frame.get("operation_time"), frame.get("age"), as_of))
+    for column in ("tel", "contacts_tel"):
+        if column in frame:
+            flags[f"{column}_format"] = phone_invalid(frame[column])
+    return flags
+
+
+@dataclass
+class CheckReport:
+    """Violation counts accumulated over all checked chunks"""
+
+    rows: int = 0
+    violations: Dict[str, int] = field(default_factory=dict)
+    by_org: pd.DataFrame = field(default_factory=pd.DataFrame)
+    org_names: pd.DataFrame = field(default_factory=pd.DataFrame)
+    samples: Dict[str, List[Any]] = field(default_factory=dict)
+
+    def org_conflicts(self) -> pd.DataFrame:
+        """(org_code, org_name, records) rows for org codes recorded under more than one name"""
+        if self.org_names.empty:
+            return self.org_names
+        names = self.org_names.groupby("org_code")["org_name"].transform("nunique")
+        return self.org_names[names > 1].sort_values(["org_code", "records"], ascending=[True, False])
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """One row per check with its count and rate"""
+        return [
+            {
+                "check": check,
+                "violations": count,
+                "rate": round(100.0 * count / self.rows, 2) if self.rows else 0.0,
+            }
+            for check, count in self.violations.items()
+        ]
+
+
+class PatientInfoChecker:
+    """Runs the vectorized checks over emr_patient_info in streamed chunks"""
+
+    def __init__(
+        self,
+        query_executor: QueryExecutor,
+        chunk_size: int = 100000,
+        schema: str = "emr_back",
+        as_of: Optional[date] = None,
+        max_samples: int = 10
+    ):
+        self.query_executor = query_executor
+        self.chunk_size = chunk_size
+        self.schema = schema
+        self.as_of = as_of
+        self.max_samples = max_samples
+
+    def query(self, scope: Optional[QueryScope] = None) -> str:
+        scope = scope or QueryScope()
+        conditions = scope.parent_conditions("p") + scope.item_conditions("p")
+        return f"SELECT {', '.join(PATIENT_COLUMNS)} FROM {self.schema}.emr_patient_info p {_where(conditions)}"
+
+    def run(self, scope: Optional[QueryScope] = None) -> CheckReport:
+        """Check every matching row and return the accumulated report"""
+        report = CheckReport(violations={check: 0 for check in PATIENT_CHECKS})
+        by_org: List[pd.DataFrame] = []
+        org_names: List[pd.Series] = []
+        for frame in self.query_executor.iter_frames(self.query(scope), chunk_size=self.chunk_size):
+            flags = check_patient_frame(frame, self.as_of)
+            report.rows += len(frame)
+            for check in flags.columns:
+                report.violations[check] += int(flags[check].sum())
+                if len(report.samples.get(check, ())) < self.max_samples:
+                    ids = frame.loc[flags[check], "id"].head(self.max_samples).tolist()
+                    report.samples.setdefault(check, []).extend(ids)
+                    del report.samples[check][self.max_samples:]
+            by_org.append(flags.groupby(frame["org_code"].fillna("")).sum())
+            org_names.append(frame.groupby(["org_code", "org_name"], dropna=False).size())
+
+        if by_org:
+            report.by_org = pd.concat(by_org).groupby(level=0).sum().astype(int)
+            report.org_names = (
+                pd.concat(org_names).groupby(level=[0, 1], dropna=False).sum()
+                .rename("records").reset_index()
+            )
+        return report
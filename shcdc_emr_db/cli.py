@@ -0,0 +1,203 @@
+"""
+Command line entry point (`shcdc-emr`).
+
+    shcdc-emr report --output-dir reports/2024-06-01 --format parquet --workers 4
+    shcdc-emr report --query 'patient_info.*' --query '*.missing_by_org' --format json
+    shcdc-emr snapshot --directory snapshot
+    shcdc-emr report --snapshot snapshot --format json
+    shcdc-emr counters install
+    shcdc-emr drilldown indexes
+    shcdc-emr orgs refresh --indexes
+    shcdc-emr search install
+    shcdc-emr search find 胸痛 发热 --page 2
+    shcdc-emr list
+"""
+
+import argparse
+import sys
+from typing import List, Optional
+
+from .db import DatabaseManager, DatabaseError, QueryExecutor
+from .queries import LINKAGE_TABLES, dashboard_query_catalog
+from .report import QualityReport, REPORT_FORMATS
+from .counters import LinkageCounters
+from .drilldown import OrgDrilldown
+from .orgs import OrgDimension
+from .search import NarrativeSearch
+from .snapshot import ParquetSnapshot, SnapshotExecutor
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="shcdc-emr", description="EMR data quality reports without the dashboard")
+    parser.add_argument("--config", default="config/database.ini", help="database INI file")
+    parser.add_argument("--section", default="postgresql", help="section of the INI file to use")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="run the quality report and write its result tables")
+    report.add_argument("--output-dir", default="quality_report", help="directory for result files and manifest.json")
+    report.add_argument("--format", choices=REPORT_FORMATS, default="parquet", help="result file format")
+    report.add_argument("--workers", type=int, default=4, help="queries run concurrently")
+    report.add_argument("--query", action="append", default=[], metavar="PATTERN",
+                        help="only run catalog queries matching this glob; may be repeated")
+    report.add_argument("--snapshot", metavar="DIRECTORY",
+                        help="run on a local Parquet snapshot with DuckDB instead of the database")
+
+    snapshot = commands.add_parser("snapshot", help="export the emr_back tables to a local Parquet snapshot")
+    snapshot.add_argument("--directory", default="snapshot", help="snapshot directory")
+    snapshot.add_argument("--table", action="append", default=None, help="only export this table; may be repeated")
+    snapshot.add_argument("--full", action="store_true", help="re-export in full instead of appending newer rows")
+
+    counters = commands.add_parser("counters", help="manage the trigger-maintained linkage counters")
+    counters.add_argument("action", choices=("install", "uninstall", "verify"))
+    counters.add_argument("--linkage", action="append", choices=list(LINKAGE_TABLES), default=None,
+                          help="only this parent/item pair; may be repeated")
+
+    drilldown = commands.add_parser("drilldown", help="prepare the per-organization drill-down")
+    drilldown.add_argument("action", choices=("indexes",))
+    drilldown.add_argument("--linkage", action="append", choices=list(LINKAGE_TABLES), default=None,
+                           help="only this parent/item pair; may be repeated")
+
+    orgs = commands.add_parser("orgs", help="build or inspect the organization dimension")
+    orgs.add_argument("action", choices=("refresh", "conflicts"))
+    orgs.add_argument("--indexes", action="store_true", help="also index org_code on every table of the dimension")
+
+    search = commands.add_parser("search", help="manage or query the outpatient narrative search index")
+    search.add_argument("action", choices=("install", "uninstall", "maintain", "find"))
+    search.add_argument("terms", nargs="*", help="terms every visit found must contain (find)")
+    search.add_argument("--page", type=int, default=1)
+    search.add_argument("--page-size", type=int, default=20)
+
+    commands.add_parser("list", help="list the catalog query names")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.command == "list":
+        print("\n".join(dashboard_query_catalog()))
+        return 0
+
+    db_manager = DatabaseManager(args.config, args.section)
+    if args.command == "snapshot":
+        try:
+            written = ParquetSnapshot(QueryExecutor(db_manager), args.directory).export(args.table, full=args.full)
+        except DatabaseError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        for table, rows in written.items():
+            print(f"{table:45s} {rows} rows")
+        print(f"exported {len(written)} tables to {args.directory}")
+        return 0
+
+    if args.command == "counters":
+        return run_counters(LinkageCounters(db_manager), args.action, args.linkage)
+
+    if args.command == "drilldown":
+        return run_drilldown(OrgDrilldown(db_manager), args.linkage)
+
+    if args.command == "orgs":
+        return run_orgs(OrgDimension(db_manager), args.action, args.indexes)
+
+    if args.command == "search":
+        return run_search(NarrativeSearch(db_manager), args.action, " ".join(args.terms), args.page, args.page_size)
+
+    snapshot = SnapshotExecutor(args.snapshot) if args.snapshot else None
+    # A snapshot run does not need the database, so its results keep bare org codes
+    orgs = OrgDimension(db_manager) if snapshot is None else None
+    report = QualityReport(db_manager, workers=args.workers, snapshot=snapshot, orgs=orgs)
+    try:
+        result = report.run(args.output_dir, args.format, args.query)
+    except DatabaseError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    for entry in result.entries:
+        status = f"FAILED: {entry.error}" if entry.error else f"{entry.rows} rows"
+        print(f"{entry.name:45s} {entry.seconds:8.2f}s  {status}")
+    print(f"wrote {len(result.entries) - len(result.failed)} of {len(result.entries)} results "
+          f"to {result.output_dir} in {result.elapsed:.1f}s")
+    return 1 if result.failed else 0
+
+
+def run_counters(counters: LinkageCounters, action: str, linkages: Optional[List[str]]) -> int:
+    try:
+        if action == "install":
+            counters.install(linkages)
+        elif action == "uninstall":
+            counters.uninstall(linkages)
+        else:
+            installed = counters.installed()
+            mismatched = 0
+            if not (linkages or installed):
+                print("no linkage counters installed")
+            for linkage in linkages or installed:
+                if linkage not in installed:
+                    print(f"{linkage:15s} not installed")
+                    continue
+                mismatches = counters.verify(linkage)
+                mismatched += bool(mismatches)
+                print(f"{linkage:15s} {mismatches or 'ok'}")
+            return 1 if mismatched else 0
+    except DatabaseError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(f"{action}ed counters for {', '.join(linkages or LINKAGE_TABLES)}")
+    return 0
+
+
+def run_drilldown(drilldown: OrgDrilldown, linkages: Optional[List[str]]) -> int:
+    try:
+        created = drilldown.create_indexes(linkages)
+    except DatabaseError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    for table, index, _ in drilldown.indexes(linkages):
+        print(f"{table:35s} {index:40s} {'created' if index in created else 'exists'}")
+    return 0
+
+
+def run_orgs(orgs: OrgDimension, action: str, indexes: bool = False) -> int:
+    try:
+        if action == "refresh":
+            print(f"{orgs.refresh()} organizations in {orgs.dimension_schema}.org_dimension")
+            for index in orgs.create_indexes() if indexes else ():
+                print(f"index {index}")
+        else:
+            conflicts = orgs.conflicts()
+            for row in conflicts.itertuples():
+                print(f"{row.org_code:15s} {row.org_name}  also recorded as: {', '.join(row.aliases)}")
+            print(f"{len(conflicts)} organization codes with more than one name")
+    except DatabaseError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def run_search(search: NarrativeSearch, action: str, query: str = "", page: int = 1, page_size: int = 20) -> int:
+    try:
+        if action == "install":
+            search.install()
+            print(f"index {search.schema}.{search.index_name} ready")
+        elif action == "uninstall":
+            search.uninstall()
+            print(f"dropped {search.schema}.{search.index_name}")
+        elif action == "maintain":
+            print(f"merged {search.maintain()} pending index pages")
+        else:
+            if not query.strip():
+                print("error: find needs at least one term", file=sys.stderr)
+                return 2
+            result = search.search(query, page, page_size)
+            for row in result.rows:
+                print(f"{row['rank']:4d}  {row['visit_time']}  {row['org_code'] or '':10s} {row['id']}  "
+                      f"{(row['chief_complaint'] or '')[:40]}")
+            total = f"at least {result.total}" if result.truncated else str(result.total)
+            print(f"page {result.page} of {result.pages}, {total} visits, {result.elapsed * 1000:.1f} ms")
+    except DatabaseError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
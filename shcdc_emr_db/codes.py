@@ -0,0 +1,287 @@
+"""
+Code-domain validation.
+Checks every coded field of the emr_back tables against reference dictionaries
+(WS364 / GB/T code tables) in one scan per table, by joining the unpivoted coded
+columns to a dictionary table, and caches the violation counts per field and org.
+"""
+
+import csv
+from typing import List, Dict, Any, Literal, Optional, Sequence
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError
+
+# Reference dictionaries: code system -> {code: name}
+CODE_SYSTEMS: Dict[str, Dict[str, str]] = {
+    # WS364.3 身份证件类别代码
+    "CV02.01.101": {
+        "01": "居民身份证", "02": "居民户口簿", "03": "护照", "04": "军官证",
+        "05": "驾驶证", "06": "港澳居民来往内地通行证", "07": "台湾居民来往内地通行证",
+        "08": "", "09": "", "10": "", "11": "", "99": "其他法定有效证件",
+    },
+    # GB/T 2261.1 人的性别代码
+    "GB/T 2261.1": {"0": "未知的性别", "1": "男性", "2": "女性", "9": "未说明的性别"},
+    # GB/T 2261.2 婚姻状况代码
+    "GB/T 2261.2": {
+        "10": "未婚", "20": "已婚", "21": "初婚", "22": "再婚", "23": "复婚",
+        "30": "丧偶", "40": "离婚", "90": "未说明的婚姻状况",
+    },
+    # GB/T 4658 学历代码
+    "GB/T 4658": {
+        "10": "研究生教育", "20": "大学本科", "30": "大学专科和专科学校", "40": "中等专业学校",
+        "50": "技工学校", "60": "普通高级中学", "70": "初级中学", "80": "小学", "90": "其他",
+    },
+    # GB 3304 民族代码, 01-56 及 97 其他、98 外国血统中国籍人士
+    "GB 3304": {
+        **{f"{i:02d}": "" for i in range(1, 57)},
+        "01": "汉族", "97": "其他", "98": "外国血统中国籍人士",
+    },
+    "FLAG": {"0": "否", "1": "是"},
+    "RESULT_FLAG": {"N": "正常", "H": "偏高", "L": "偏低"},
+}
+
+# Coded columns per table and the code system they must belong to
+FIELD_CODE_SYSTEMS: Dict[str, Dict[str, str]] = {
+    "emr_patient_info": {
+        "id_card_type_code": "CV02.01.101",
+        "gender_code": "GB/T 2261.1",
+        "marital_status_code": "GB/T 2261.2",
+        "education_code": "GB/T 4658",
+        "nation_code": "GB 3304",
+    },
+    **{
+        table: {"id_card_type_code": "CV02.01.101", "invalid_flag": "FLAG"}
+        for table in (
+            "emr_activity_info", "emr_outpatient_record", "emr_admission_record",
+            "emr_daily_course", "emr_discharge_info", "emr_death_info",
+            "emr_order", "emr_ex_lab", "emr_ex_clinical", "emr_vital_signs_record",
+        )
+    },
+    "emr_order_item": {"invalid_flag": "FLAG"},
+    "emr_ex_lab_item": {"item_result_flag": "RESULT_FLAG", "critical_value_flag": "FLAG", "invalid_flag": "FLAG"},
+    "emr_ex_clinical_item": {"item_result_flag": "RESULT_FLAG", "invalid_flag": "FLAG"},
+}
+
+DictionarySource = Literal["database", "memory"]
+
+
+def read_code_systems_csv(path: str) -> Dict[str, Dict[str, str]]:
+    """Read a reference code table with code_system, code and optional name columns"""
+    code_systems: Dict[str, Dict[str, str]] = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            code_systems.setdefault(row["code_system"].strip(), {})[row["code"].strip()] = (row.get("name") or "").strip()
+    return code_systems
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class CodeValidator:
+    """Validates coded fields of every table against reference dictionaries in one pass"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        schema: str = "emr_back",
+        code_schema: str = "emr_ref",
+        code_systems: Optional[Dict[str, Dict[str, str]]] = None,
+        field_code_systems: Optional[Dict[str, Dict[str, str]]] = None,
+        source: DictionarySource = "database"
+    ):
+        self.db_manager = db_manager
+        self.schema = schema
+        self.code_schema = code_schema
+        self.code_systems = {name: dict(codes) for name, codes in (code_systems or CODE_SYSTEMS).items()}
+        self.field_code_systems = field_code_systems or FIELD_CODE_SYSTEMS
+        self.source = source
+
+    def register(self, code_systems: Dict[str, Dict[str, str]]) -> None:
+        """Add or extend code systems, e.g. from read_code_systems_csv"""
+        for name, codes in code_systems.items():
+            self.code_systems.setdefault(name, {}).update(codes)
+
+    def load_code_tables(self) -> int:
+        """(Re)load the reference dictionaries into <code_schema>.code_value; returns rows loaded"""
+        rows = [
+            {"code_system": name, "code": code, "name": label}
+            for name, codes in self.code_systems.items()
+            for code, label in codes.items()
+        ]
+        try:
+            with self.db_manager.engine.begin() as conn:
+                self._create_tables(conn)
+                conn.execute(text(f"TRUNCATE {self.code_schema}.code_value"))
+                conn.execute(
+                    text(f"INSERT INTO {self.code_schema}.code_value (code_system, code, name) "
+                         "VALUES (:code_system, :code, :name)"),
+                    rows,
+                )
+            return len(rows)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def validation_query(self, tables: Optional[Sequence[str]] = None) -> str:
+        """
+        One statement checking all coded fields of `tables`: each table is scanned
+        once, its coded columns unpivoted with LATERAL VALUES and anti-joined to the
+        dictionary. Returns table_name, field, org_code, value, violations rows.
+        """
+        columns = self._existing_columns(tables or list(self.field_code_systems))
+        branches = []
+        for table, fields in self.field_code_systems.items():
+            present = {field: system for field, system in fields.items() if field in columns.get(table, ())}
+            if not present:
+                continue
+            org = "t.org_code" if "org_code" in columns[table] else "NULL::text"
+            values = ", ".join(
+                f"({_literal(field)}, {_literal(system)}, NULLIF(t.{field}::text, ''))"
+                for field, system in present.items()
+            )
+            branches.append(f"""
+            SELECT {_literal(table)} AS table_name, v.field, {org} AS org_code, v.value, COUNT(*) AS violations
+            FROM {self.schema}.{table} t
+            CROSS JOIN LATERAL (VALUES {values}) AS v(field, code_system, value)
+            LEFT JOIN code_dictionary c ON c.code_system = v.code_system AND c.code = v.value
+            WHERE v.value IS NOT NULL AND c.code IS NULL
+            GROUP BY v.field, {org}, v.value""")
+        if not branches:
+            raise ValueError("No coded fields found for the requested tables")
+        return f"WITH code_dictionary AS ({self._dictionary_sql()})" + "\n            UNION ALL".join(branches)
+
+    def validate(self, tables: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Run the validation now and return violation counts per table, field, org and value"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                self._check_dictionary(conn)
+                result = conn.exec_driver_sql(self.validation_query(tables))
+                return [dict(row._mapping) for row in result]
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def refresh(self, tables: Optional[Sequence[str]] = None) -> int:
+        """Re-run the validation and replace the cached counts for `tables`; returns rows cached"""
+        tables = list(tables or self.field_code_systems)
+        query = self.validation_query(tables)
+        try:
+            with self.db_manager.engine.begin() as conn:
+                self._create_tables(conn)
+                self._check_dictionary(conn)
+                conn.execute(
+                    text(f"DELETE FROM {self.code_schema}.code_violations WHERE table_name = ANY(:tables)"),
+                    {"tables": tables},
+                )
+                result = conn.exec_driver_sql(
+                    f"INSERT INTO {self.code_schema}.code_violations "
+                    f"(table_name, field, org_code, value, violations) {query}"
+                )
+                conn.execute(text(f"""
+                    INSERT INTO {self.code_schema}.code_checks (table_name, checked_at)
+                    SELECT unnest(CAST(:tables AS text[])), now()
+                    ON CONFLICT (table_name) DO UPDATE SET checked_at = EXCLUDED.checked_at
+                """), {"tables": tables})
+                return result.rowcount
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def violations(
+        self,
+        tables: Optional[Sequence[str]] = None,
+        max_age_seconds: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Cached violation counts, refreshed first when `max_age_seconds` is given and
+        the cache for any requested table is missing or older than that.
+        """
+        tables = list(tables or self.field_code_systems)
+        if max_age_seconds is not None and self._cache_age(tables) > max_age_seconds:
+            self.refresh(tables)
+        try:
+            with self.db_manager.get_connection() as conn:
+                result = conn.execute(text(f"""
+                    SELECT table_name, field, org_code, value, violations, checked_at
+                    FROM {self.code_schema}.code_violations
+                    WHERE table_name = ANY(:tables)
+                    ORDER BY table_name, field, violations DESC
+                """), {"tables": tables})
+                return [dict(row._mapping) for row in result]
+
+        except sa_exc.ProgrammingError:
+            # Cache table not created yet
+            return []
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def _cache_age(self, tables: Sequence[str]) -> float:
+        """Seconds since the stalest requested table was checked; infinite if never"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                age = conn.execute(text(f"""
+                    SELECT EXTRACT(EPOCH FROM now() - min(c.checked_at))
+                    FROM unnest(CAST(:tables AS text[])) AS t(table_name)
+                    LEFT JOIN {self.code_schema}.code_checks c ON c.table_name = t.table_name
+                    HAVING bool_and(c.checked_at IS NOT NULL)
+                """), {"tables": list(tables)}).scalar()
+        except sa_exc.ProgrammingError:
+            return float("inf")
+        return float("inf") if age is None else float(age)
+
+    def _check_dictionary(self, conn) -> None:
+        """Refuse to validate against a missing or empty dictionary table, which would flag every code"""
+        if self.source != "database":
+            return
+        exists = conn.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": f"{self.code_schema}.code_value"}
+        ).scalar()
+        if not exists or conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {self.code_schema}.code_value)")).scalar():
+            raise DatabaseError(
+                f"Reference code table {self.code_schema}.code_value is empty; call load_code_tables() first"
+            )
+
+    def _dictionary_sql(self) -> str:
+        if self.source == "database":
+            return f"SELECT code_system, code FROM {self.code_schema}.code_value"
+        values = ", ".join(
+            f"({_literal(name)}, {_literal(code)})"
+            for name, codes in self.code_systems.items()
+            for code in codes
+        )
+        return f"SELECT * FROM (VALUES {values}) AS d(code_system, code)"
+
+    def _existing_columns(self, tables: Sequence[str]) -> Dict[str, set]:
+        try:
+            with self.db_manager.get_connection() as conn:
+                result = conn.execute(text("""
+                    SELECT table_name, column_name FROM information_schema.columns
+                    WHERE table_schema = :schema AND table_name = ANY(:tables)
+                """), {"schema": self.schema, "tables": list(tables)})
+                columns: Dict[str, set] = {}
+                for table, column in result:
+                    columns.setdefault(table, set()).add(column)
+                return columns
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def _create_tables(self, conn) -> None:
+        conn.execute(text(f"""
+            CREATE SCHEMA IF NOT EXISTS {self.code_schema};
+            CREATE TABLE IF NOT EXISTS {self.code_schema}.code_value (
+                code_system varchar(50), code varchar(50), name varchar(200),
+                PRIMARY KEY (code_system, code)
+            );
+            CREATE TABLE IF NOT EXISTS {self.code_schema}.code_violations (
+                table_name varchar(100), field varchar(100), org_code varchar(50),
+                value text, violations bigint, checked_at timestamptz DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS code_violations_table_idx
+                ON {self.code_schema}.code_violations (table_name, field);
+            CREATE TABLE IF NOT EXISTS {self.code_schema}.code_checks (
+                table_name varchar(100) PRIMARY KEY, checked_at timestamptz
+            )
+        """))
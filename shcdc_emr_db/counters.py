@@ -0,0 +1,378 @@
+"""
+Trigger-maintained linkage counters.
+Statement-level triggers with transition tables keep, per parent/item pair and
+organization, the number of linked items, childless parents and orphaned items
+up to date as rows are written, so the overview counts are read from a handful of
+counter rows instead of anti-joining the item tables. A per-parent item count
+(linkage_parents) keeps every transition exact under concurrent writes: the
+upserts lock the parent's row, so two statements adding a parent's first items
+cannot both see it as childless.
+"""
+
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, QueryError
+from .queries import LINKAGE_TABLES, QueryScope, linkage_overview_labels, linkage_overview_queries
+
+# Counter row holding the items whose parent does not exist
+ORPHAN_ORG = ""
+
+# Transition table names of the triggers
+NEW_ROWS = "new_rows"
+OLD_ROWS = "old_rows"
+
+
+def _counter_upsert(schema: str, linkage: str, moves: str) -> str:
+    """Add the (org_code, linked, childless, orphaned) deltas selected by `moves` to the counters"""
+    return f"""
+        INSERT INTO {schema}.linkage_counters AS c (linkage, org_code, linked_items, childless_parents, orphaned_items)
+        SELECT '{linkage}', org_code, SUM(linked), SUM(childless), SUM(orphaned)
+        FROM ({moves}) m
+        GROUP BY org_code
+        ORDER BY org_code
+        ON CONFLICT (linkage, org_code) DO UPDATE SET
+            linked_items = c.linked_items + EXCLUDED.linked_items,
+            childless_parents = c.childless_parents + EXCLUDED.childless_parents,
+            orphaned_items = c.orphaned_items + EXCLUDED.orphaned_items
+    """
+
+
+def _drop_dead_parents(schema: str, linkage: str, ids: str) -> str:
+    """Forget state rows of missing parents left without items"""
+    return f"""
+        DELETE FROM {schema}.linkage_parents
+        WHERE linkage = '{linkage}' AND NOT present AND items = 0
+          AND parent_id IN (SELECT parent_id FROM ({ids}) ids);
+    """
+
+
+def _apply_item_delta(schema: str, linkage: str, delta: str) -> str:
+    """
+    Add the per-parent item count changes `delta` (parent_id, n). The upsert returns
+    the counts after the change, so a parent's count before it is items - n.
+    """
+    return f"""
+        WITH delta AS ({delta}),
+        state AS (
+            INSERT INTO {schema}.linkage_parents AS s (linkage, parent_id, items)
+            SELECT '{linkage}', parent_id, n FROM delta WHERE parent_id IS NOT NULL ORDER BY parent_id
+            ON CONFLICT (linkage, parent_id) DO UPDATE SET items = s.items + EXCLUDED.items
+            RETURNING s.parent_id, s.present, s.org_code, s.items
+        )
+        {_counter_upsert(schema, linkage, f'''
+            SELECT CASE WHEN s.present THEN s.org_code ELSE '{ORPHAN_ORG}' END AS org_code,
+                   CASE WHEN s.present THEN d.n ELSE 0 END AS linked,
+                   CASE WHEN s.present THEN (s.items = 0)::int - (s.items - d.n = 0)::int ELSE 0 END AS childless,
+                   CASE WHEN s.present THEN 0 ELSE d.n END AS orphaned
+            FROM state s JOIN delta d USING (parent_id)
+            UNION ALL
+            SELECT '{ORPHAN_ORG}', 0, 0, n FROM delta WHERE parent_id IS NULL
+        ''')};
+    """
+
+
+def _apply_parent_changes(schema: str, linkage: str, removed: Optional[str], added: Optional[str]) -> str:
+    """Move the items of `removed` parents (parent_id, org_code) to the orphans, then those of `added` ones to their org"""
+    steps = []
+    if removed:
+        steps.append(f"""
+        WITH gone AS (SELECT parent_id, org_code, COUNT(*) AS n FROM ({removed}) r GROUP BY parent_id, org_code),
+        state AS (
+            UPDATE {schema}.linkage_parents s SET present = false, org_code = '{ORPHAN_ORG}'
+            FROM gone g WHERE s.linkage = '{linkage}' AND s.parent_id = g.parent_id
+            RETURNING s.parent_id, s.items
+        )
+        {_counter_upsert(schema, linkage, f'''
+            SELECT g.org_code, -s.items AS linked, -(s.items = 0)::int AS childless, 0 AS orphaned
+            FROM state s JOIN gone g USING (parent_id)
+            UNION ALL
+            SELECT '{ORPHAN_ORG}', 0, 0, items FROM state
+            UNION ALL
+            SELECT org_code, 0, -n, 0 FROM gone WHERE parent_id IS NULL
+        ''')};
+        """)
+    if added:
+        steps.append(f"""
+        WITH arrived AS (SELECT parent_id, org_code, COUNT(*) AS n FROM ({added}) a GROUP BY parent_id, org_code),
+        state AS (
+            INSERT INTO {schema}.linkage_parents AS s (linkage, parent_id, present, org_code, items)
+            SELECT '{linkage}', parent_id, true, org_code, 0 FROM arrived WHERE parent_id IS NOT NULL ORDER BY parent_id
+            ON CONFLICT (linkage, parent_id) DO UPDATE SET present = true, org_code = EXCLUDED.org_code
+            RETURNING s.parent_id, s.items
+        )
+        {_counter_upsert(schema, linkage, f'''
+            SELECT a.org_code, s.items AS linked, (s.items = 0)::int AS childless, 0 AS orphaned
+            FROM state s JOIN arrived a USING (parent_id)
+            UNION ALL
+            SELECT '{ORPHAN_ORG}', 0, 0, -s.items FROM state s JOIN arrived a USING (parent_id)
+            UNION ALL
+            SELECT org_code, 0, n, 0 FROM arrived WHERE parent_id IS NULL
+        ''')};
+        """)
+    if removed:
+        steps.append(_drop_dead_parents(schema, linkage, removed))
+    return "".join(steps)
+
+
+def _trigger_function(name: str, branches: Dict[str, str]) -> str:
+    """plpgsql trigger function running the statements of the firing operation"""
+    body = "".join(
+        f"{'ELSIF' if index else 'IF'} TG_OP = '{operation}' THEN\n{statements}\n"
+        for index, (operation, statements) in enumerate(branches.items())
+    )
+    return f"""
+        CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $body$
+        BEGIN
+            {body}
+            END IF;
+            RETURN NULL;
+        END
+        $body$
+    """
+
+
+class LinkageCounters:
+    """Installs the counter triggers for parent/item pairs and reads the overview counts from them"""
+
+    def __init__(self, db_manager: DatabaseManager, schema: str = "emr_ref"):
+        self.db_manager = db_manager
+        self.schema = schema
+
+    def installed(self) -> List[str]:
+        """Linkages whose counter triggers are in place"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                # Triggers left on a table renamed away (e.g. by a partition migration) do not count
+                found = set(conn.execute(text("""
+                    SELECT t.tgname, n.nspname || '.' || c.relname
+                    FROM pg_trigger t
+                    JOIN pg_class c ON c.oid = t.tgrelid
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE t.tgname LIKE 'linkage\\_counters\\_%' AND NOT t.tgisinternal
+                """)).tuples())
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        return [
+            linkage for linkage in LINKAGE_TABLES
+            if all((name, table) in found for name, table, _, _ in self._triggers(linkage))
+        ]
+
+    def install(self, linkages: Optional[Sequence[str]] = None) -> None:
+        """
+        Create the counter tables and triggers and fill the counters from the current
+        rows. Writes to the pair's tables wait while a pair is installed, so the
+        counters start exact. Re-installing rebuilds them.
+        """
+        try:
+            with self.db_manager.engine.begin() as conn:
+                self._create_tables(conn)
+                for linkage in linkages or list(LINKAGE_TABLES):
+                    tables = LINKAGE_TABLES[linkage]
+                    conn.execute(text(
+                        f"LOCK TABLE {tables['parent_table']}, {tables['item_table']} IN SHARE ROW EXCLUSIVE MODE"
+                    ))
+                    self._drop_triggers(conn, linkage)
+                    for statement in self._install_statements(linkage):
+                        conn.execute(text(statement))
+                    conn.execute(text(f"SELECT {self._function(linkage, 'rebuild')}()"))
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def uninstall(self, linkages: Optional[Sequence[str]] = None) -> None:
+        """Drop the triggers, functions and counter rows of the linkages"""
+        try:
+            with self.db_manager.engine.begin() as conn:
+                for linkage in linkages or list(LINKAGE_TABLES):
+                    self._drop_triggers(conn, linkage)
+                    for kind in ("items", "parents", "truncate", "rebuild"):
+                        conn.execute(text(f"DROP FUNCTION IF EXISTS {self._function(linkage, kind)}()"))
+                    if conn.execute(text("SELECT to_regclass(:table)"), {"table": f"{self.schema}.linkage_counters"}).scalar():
+                        for table in ("linkage_counters", "linkage_parents"):
+                            conn.execute(text(f"DELETE FROM {self.schema}.{table} WHERE linkage = :linkage"),
+                                         {"linkage": linkage})
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def counts(self, linkage: str, org_codes: Sequence[str] = ()) -> Dict[str, int]:
+        """
+        Overview counts keyed like linkage_overview_queries, for the given parent
+        organizations (all by default). As in those queries, an organization filter
+        limits items to those of its parents, while orphans are always counted.
+        """
+        conditions = "" if not org_codes else "AND org_code = ANY(:org_codes)"
+        try:
+            with self.db_manager.get_connection() as conn:
+                row = conn.execute(text(f"""
+                    SELECT COALESCE(SUM(linked_items) FILTER (WHERE TRUE {conditions}), 0) AS linked,
+                           COALESCE(SUM(childless_parents) FILTER (WHERE TRUE {conditions}), 0) AS childless,
+                           COALESCE(SUM(orphaned_items), 0) AS orphaned
+                    FROM {self.schema}.linkage_counters WHERE linkage = :linkage
+                """), {"linkage": linkage, "org_codes": list(org_codes)}).mappings().one()
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        linked, childless, orphaned = int(row["linked"]), int(row["childless"]), int(row["orphaned"])
+        return {
+            "total_items": linked + (0 if org_codes else orphaned),
+            "parent_with_items": linked,
+            "parent_without_items": childless,
+            "valid_items": linked,
+            "orphaned_items": orphaned,
+        }
+
+    def overview(
+        self,
+        linkage: str,
+        item_label: str,
+        parent_label: str,
+        scope: Optional[QueryScope] = None
+    ) -> Optional[Dict[str, pd.DataFrame]]:
+        """
+        The ("Metric", "Count") frames of linkage_overview_queries read from the
+        counters, or None when they cannot answer: the pair is not installed, or the
+        scope has a time window (counters are not kept per operation_time).
+        """
+        scope = scope or QueryScope()
+        if scope.since is not None or scope.until is not None or linkage not in self.installed():
+            return None
+        labels = linkage_overview_labels(item_label, parent_label)
+        return {
+            key: pd.DataFrame({"Metric": [labels[key]], "Count": [count]})
+            for key, count in self.counts(linkage, scope.org_codes).items()
+        }
+
+    def verify(self, linkage: str, org_codes: Sequence[str] = ()) -> Dict[str, Dict[str, int]]:
+        """Counts that differ from a full recomputation with the overview queries, as {key: {counter, actual}}"""
+        counters = self.counts(linkage, org_codes)
+        scope = QueryScope(org_codes=tuple(org_codes))
+        mismatches = {}
+        try:
+            with self.db_manager.get_connection("analytics") as conn:
+                for key, query in linkage_overview_queries(linkage, "", "", scope).items():
+                    actual = conn.execute(text(query)).mappings().one()["Count"]
+                    if actual != counters[key]:
+                        mismatches[key] = {"counter": counters[key], "actual": actual}
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        return mismatches
+
+    def _function(self, linkage: str, kind: str) -> str:
+        return f"{self.schema}.linkage_counters_{linkage}_{kind}"
+
+    def _triggers(self, linkage: str) -> List[Tuple[str, str, str, str]]:
+        """(name, table, event, function) of every counter trigger of a linkage"""
+        tables = LINKAGE_TABLES[linkage]
+        triggers = []
+        for kind, table in (("items", tables["item_table"]), ("parents", tables["parent_table"])):
+            for event in ("insert", "update", "delete"):
+                triggers.append((f"linkage_counters_{linkage}_{kind}_{event}", table, event, kind))
+            triggers.append((f"linkage_counters_{linkage}_{kind}_truncate", table, "truncate", "truncate"))
+        return triggers
+
+    def _drop_triggers(self, conn, linkage: str) -> None:
+        for name, table, _, _ in self._triggers(linkage):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON {table}"))
+
+    def _install_statements(self, linkage: str) -> List[str]:
+        tables = LINKAGE_TABLES[linkage]
+        item_table, parent_table, join_field = tables["item_table"], tables["parent_table"], tables["join_field"]
+        schema = self.schema
+
+        def item_ids(rows: str) -> str:
+            return f"SELECT {join_field}::text AS parent_id FROM {rows}"
+
+        def parent_keys(rows: str) -> str:
+            return f"SELECT id::text AS parent_id, COALESCE(org_code, '{ORPHAN_ORG}') AS org_code FROM {rows}"
+
+        item_branches = {
+            "INSERT": _apply_item_delta(schema, linkage, f"""
+                SELECT parent_id, COUNT(*) AS n FROM ({item_ids(NEW_ROWS)}) i GROUP BY parent_id"""),
+            "DELETE": _apply_item_delta(schema, linkage, f"""
+                SELECT parent_id, -COUNT(*) AS n FROM ({item_ids(OLD_ROWS)}) i GROUP BY parent_id""")
+            + _drop_dead_parents(schema, linkage, item_ids(OLD_ROWS)),
+            # Only items moved to another parent change a count
+            "UPDATE": _apply_item_delta(schema, linkage, f"""
+                SELECT parent_id, SUM(n) AS n FROM (
+                    SELECT parent_id, 1 AS n FROM ({item_ids(NEW_ROWS)}) i
+                    UNION ALL SELECT parent_id, -1 FROM ({item_ids(OLD_ROWS)}) o
+                ) moved GROUP BY parent_id HAVING SUM(n) <> 0""")
+            + _drop_dead_parents(schema, linkage, item_ids(OLD_ROWS)),
+        }
+        # Unchanged (id, org_code) pairs of an UPDATE cancel out
+        parent_branches = {
+            "INSERT": _apply_parent_changes(schema, linkage, None, parent_keys(NEW_ROWS)),
+            "DELETE": _apply_parent_changes(schema, linkage, parent_keys(OLD_ROWS), None),
+            "UPDATE": _apply_parent_changes(
+                schema, linkage,
+                f"{parent_keys(OLD_ROWS)} EXCEPT ALL {parent_keys(NEW_ROWS)}",
+                f"{parent_keys(NEW_ROWS)} EXCEPT ALL {parent_keys(OLD_ROWS)}",
+            ),
+        }
+
+        statements = [
+            _trigger_function(self._function(linkage, "items"), item_branches),
+            _trigger_function(self._function(linkage, "parents"), parent_branches),
+            f"""
+            CREATE OR REPLACE FUNCTION {self._function(linkage, 'rebuild')}() RETURNS void LANGUAGE sql AS $body$
+                DELETE FROM {schema}.linkage_parents WHERE linkage = '{linkage}';
+                DELETE FROM {schema}.linkage_counters WHERE linkage = '{linkage}';
+                INSERT INTO {schema}.linkage_parents (linkage, parent_id, present, org_code, items)
+                SELECT '{linkage}', COALESCE(p.parent_id, i.parent_id), p.parent_id IS NOT NULL,
+                       COALESCE(p.org_code, '{ORPHAN_ORG}'), COALESCE(i.items, 0)
+                FROM ({parent_keys(parent_table)} WHERE id IS NOT NULL) p
+                FULL JOIN (SELECT {join_field}::text AS parent_id, COUNT(*) AS items FROM {item_table}
+                           WHERE {join_field} IS NOT NULL GROUP BY {join_field}) i ON i.parent_id = p.parent_id;
+                {_counter_upsert(schema, linkage, f'''
+                    SELECT CASE WHEN present THEN org_code ELSE '{ORPHAN_ORG}' END AS org_code,
+                           CASE WHEN present THEN items ELSE 0 END AS linked,
+                           (present AND items = 0)::int AS childless,
+                           CASE WHEN present THEN 0 ELSE items END AS orphaned
+                    FROM {schema}.linkage_parents WHERE linkage = '{linkage}'
+                    UNION ALL
+                    SELECT COALESCE(org_code, '{ORPHAN_ORG}'), 0, 1, 0 FROM {parent_table} WHERE id IS NULL
+                    UNION ALL
+                    SELECT '{ORPHAN_ORG}', 0, 0, 1 FROM {item_table} WHERE {join_field} IS NULL
+                ''')};
+            $body$
+            """,
+            # TRUNCATE has no transition tables: recount from the remaining rows
+            f"""
+            CREATE OR REPLACE FUNCTION {self._function(linkage, 'truncate')}() RETURNS trigger LANGUAGE plpgsql AS $body$
+            BEGIN
+                PERFORM {self._function(linkage, 'rebuild')}();
+                RETURN NULL;
+            END
+            $body$
+            """,
+        ]
+        transitions = {
+            "insert": f"REFERENCING NEW TABLE AS {NEW_ROWS} ",
+            "update": f"REFERENCING OLD TABLE AS {OLD_ROWS} NEW TABLE AS {NEW_ROWS} ",
+            "delete": f"REFERENCING OLD TABLE AS {OLD_ROWS} ",
+            "truncate": "",
+        }
+        for name, table, event, function in self._triggers(linkage):
+            statements.append(f"""
+                CREATE TRIGGER {name} AFTER {event.upper()} ON {table}
+                {transitions[event]}FOR EACH STATEMENT EXECUTE FUNCTION {self._function(linkage, function)}()
+            """)
+        return statements
+
+    def _create_tables(self, conn) -> None:
+        conn.execute(text(f"""
+            CREATE SCHEMA IF NOT EXISTS {self.schema};
+            CREATE TABLE IF NOT EXISTS {self.schema}.linkage_parents (
+                linkage varchar(50) NOT NULL, parent_id text NOT NULL,
+                present boolean NOT NULL DEFAULT false, org_code varchar(50) NOT NULL DEFAULT '{ORPHAN_ORG}',
+                items bigint NOT NULL DEFAULT 0,
+                PRIMARY KEY (linkage, parent_id)
+            );
+            CREATE TABLE IF NOT EXISTS {self.schema}.linkage_counters (
+                linkage varchar(50) NOT NULL, org_code varchar(50) NOT NULL,
+                linked_items bigint NOT NULL DEFAULT 0, childless_parents bigint NOT NULL DEFAULT 0,
+                orphaned_items bigint NOT NULL DEFAULT 0,
+                PRIMARY KEY (linkage, org_code)
+            )
+        """))
@@ -5,15 +5,41 @@ Provides a unified interface for database operations with proper connection mana
 
 from configparser import ConfigParser, NoSectionError
 import json
-from typing import Literal, List, Dict, Any, Optional, Union, TypeVar, cast
+import threading
+import time
+from itertools import groupby
+from typing import Literal, List, Dict, Any, Iterator, Optional, Sequence, Tuple, Union, TypeVar, cast
 from contextlib import contextmanager
 
+import pandas as pd
 from sqlalchemy import text, exc as sa_exc, create_engine, Engine
 from sqlalchemy.engine.row import Row
 from langchain_community.utilities import SQLDatabase
 
+from .profiler import QueryProfile, parse_explain_json
+from .formatting import EMRTextFormatter
+from .queries import patient_timeline_query
+
 T = TypeVar('T', bound=Dict[str, Any])
 
+EMR_ANALYSIS_FORMATTER = EMRTextFormatter()
+
+# Workloads for DatabaseManager routing: point lookups and writes stay on the
+# primary, heavy aggregates and exports go to a read replica when one is fresh enough
+Workload = Literal["primary", "analytics"]
+
+DEFAULT_MAX_REPLICA_LAG = 30.0
+REPLICA_CHECK_INTERVAL = 10.0
+
+# Seconds a standby is behind; 0 on a primary or a standby that has replayed all it received
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
 class DatabaseError(Exception):
     """Base class for database errors"""
     pass
@@ -26,8 +52,17 @@ class QueryError(DatabaseError):
     """Query execution related errors"""
     pass
 
+class QueryRejectedError(QueryError):
+    """Query refused before execution, e.g. by the read-only guard"""
+    pass
+
 class DatabaseManager:
-    """Manages database connections and provides unified interface for database operations"""
+    """
+    Manages database connections and provides unified interface for database operations.
+    The section may list read replicas (`replicas = section_a, section_b`, each its own
+    INI section) and a `max_replica_lag` in seconds; "analytics" connections then go to
+    the least-lagged replica within that bound and fall back to the primary.
+    """
     
     def __init__(self, config_file: str = "config/database.ini", section: str = "postgresql"):
         self._config_file = config_file
@@ -35,6 +70,18 @@ class DatabaseManager:
         self._config = None
         self._engine = None
         self._sqlalchemy_db = None
+        self._replica_engines: Dict[str, Engine] = {}
+        # replica section -> (checked at, lag in seconds or None when unreachable)
+        self._replica_status: Dict[str, Tuple[float, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config_file(self) -> str:
+        return self._config_file
+
+    @property
+    def section(self) -> str:
+        return self._section
 
     @property
     def config(self) -> Dict[str, str]:
@@ -47,7 +94,9 @@ class DatabaseManager:
     def engine(self) -> Engine:
         """Lazy load and cache SQLAlchemy engine"""
         if not self._engine:
-            self._engine = self._create_engine()
+            with self._lock:
+                if not self._engine:
+                    self._engine = self._create_engine()
         return self._engine
 
     @property
@@ -57,19 +106,30 @@ class DatabaseManager:
             self._sqlalchemy_db = self._create_sqlalchemy_db()
         return self._sqlalchemy_db
 
-    def _load_config(self) -> Dict[str, str]:
+    @property
+    def replicas(self) -> List[str]:
+        """Sections of the configured read replicas"""
+        return [name.strip() for name in self.config.get("replicas", "").split(",") if name.strip()]
+
+    @property
+    def max_replica_lag(self) -> float:
+        return float(self.config.get("max_replica_lag", DEFAULT_MAX_REPLICA_LAG))
+
+    def _load_config(self, section: Optional[str] = None) -> Dict[str, str]:
         """Read database configuration from the specified INI file"""
+        section = section or self._section
         parser = ConfigParser()
         parser.read(self._config_file)
 
-        if not parser.has_section(self._section):
-            raise ConfigError(f"Section {self._section} not found in {self._config_file}")
+        if not parser.has_section(section):
+            raise ConfigError(f"Section {section} not found in {self._config_file}")
 
-        return dict(parser.items(self._section))
+        return dict(parser.items(section))
 
-    def _create_connection_string(self) -> str:
+    def _create_connection_string(self, config: Optional[Dict[str, str]] = None) -> str:
         """Create database connection string from config"""
-        return f"postgresql://{self.config['user']}:{self.config['password']}@{self.config['host']}:{self.config['port']}/{self.config['database']}"
+        config = config or self.config
+        return f"postgresql://{config['user']}:{config['password']}@{config['host']}:{config['port']}/{config['database']}"
 
     def _create_engine(self) -> Engine:
         """Create SQLAlchemy engine instance"""
@@ -79,12 +139,95 @@ class DatabaseManager:
         """Create SQLDatabase instance"""
         return SQLDatabase.from_uri(self._create_connection_string())
 
+    def endpoint_engine(self, endpoint: Optional[str] = None) -> Engine:
+        """Engine of the primary (None or the main section) or of one replica section"""
+        if endpoint is None or endpoint == self._section:
+            return self.engine
+        with self._lock:
+            if endpoint not in self._replica_engines:
+                self._replica_engines[endpoint] = create_engine(
+                    self._create_connection_string(self._load_config(endpoint)), pool_pre_ping=True
+                )
+            return self._replica_engines[endpoint]
+
+    def replica_lag(self, endpoint: str) -> Optional[float]:
+        """Replication lag of a replica in seconds, None if unreachable; cached for REPLICA_CHECK_INTERVAL"""
+        checked_at, lag = self._replica_status.get(endpoint, (0.0, None))
+        if time.monotonic() - checked_at < REPLICA_CHECK_INTERVAL:
+            return lag
+        try:
+            with self.endpoint_engine(endpoint).connect() as conn:
+                lag = float(conn.execute(text(REPLICA_LAG_QUERY)).scalar() or 0)
+        except (sa_exc.SQLAlchemyError, ConfigError):
+            lag = None
+        self._replica_status[endpoint] = (time.monotonic(), lag)
+        return lag
+
+    def route(self, workload: Workload = "primary") -> str:
+        """
+        Section that serves `workload`: the primary for "primary", otherwise the
+        reachable replica with the least lag within max_replica_lag, else the primary.
+        """
+        if workload == "primary":
+            return self._section
+        candidates = []
+        for endpoint in self.replicas:
+            lag = self.replica_lag(endpoint)
+            if lag is not None and lag <= self.max_replica_lag:
+                candidates.append((lag, endpoint))
+        return min(candidates)[1] if candidates else self._section
+
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        with self.engine.connect() as connection:
+    def get_connection(self, workload: Workload = "primary", endpoint: Optional[str] = None):
+        """
+        Context manager for database connections, on the endpoint routed for
+        `workload` or on an explicit `endpoint` section. A routed replica that
+        refuses the connection is marked down and the primary is used instead.
+        """
+        routed = endpoint is None
+        endpoint = endpoint or self.route(workload)
+        try:
+            connection = self.endpoint_engine(endpoint).connect()
+        except sa_exc.OperationalError:
+            if not routed or endpoint == self._section:
+                raise
+            self._replica_status[endpoint] = (time.monotonic(), None)
+            connection = self.engine.connect()
+        with connection:
             yield connection
 
+    def create_index(self, table: str, index: str, columns: Sequence[str]) -> bool:
+        """
+        Index `columns` of `table` (schema-qualified) as `index` without blocking
+        writes: one autocommit CREATE INDEX CONCURRENTLY, after dropping an invalid
+        index left by an interrupted build. Partitioned tables do not support
+        CONCURRENTLY, so they get a plain CREATE INDEX that cascades to every
+        partition. Returns False when a valid index of that name already exists.
+        """
+        schema = table.split(".")[0]
+        try:
+            with self.engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                state = conn.execute(text("""
+                    SELECT c.relkind = 'p' AS partitioned,
+                           (SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(:index)) AS valid
+                    FROM pg_class c WHERE c.oid = to_regclass(:table)
+                """), {"table": table, "index": f"{schema}.{index}"}).mappings().first()
+                if state is None:
+                    raise QueryError(f"Table {table} not found")
+                if state["valid"]:
+                    return False
+                concurrently = "" if state["partitioned"] else "CONCURRENTLY "
+                if state["valid"] is not None:
+                    conn.exec_driver_sql(f"DROP INDEX {concurrently}IF EXISTS {schema}.{index}")
+                conn.exec_driver_sql(
+                    f"CREATE INDEX {concurrently}IF NOT EXISTS {index} ON {table} ({', '.join(columns)})"
+                )
+                return True
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
 class QueryExecutor:
     """Handles query execution with standardized error handling"""
 
@@ -95,17 +238,19 @@ class QueryExecutor:
         self, 
         query: str, 
         params: Optional[Dict[str, Any]] = None,
-        fetch: Literal["all", "one", "cursor"] = "all"
+        fetch: Literal["all", "one", "cursor"] = "all",
+        workload: Workload = "primary"
     ) -> List[Dict[str, Any]]:
         """
-        Execute SQL query with standardized error handling and result formatting
+        Execute SQL query with standardized error handling and result formatting.
+        Pass workload="analytics" for aggregates that may run on a read replica.
         """
         try:
             if fetch == "cursor":
                 result = self.db_manager.sqlalchemy_db.run(query, fetch="cursor")
                 return cast(List[Dict[str, Any]], result or [])
             
-            with self.db_manager.get_connection() as conn:
+            with self.db_manager.get_connection(workload) as conn:
                 result = conn.execute(text(query), parameters=params or {})
                 
                 if fetch == "one":
@@ -120,6 +265,64 @@ class QueryExecutor:
         except Exception as e:
             raise DatabaseError(f"Unexpected error: {str(e)}")
 
+    def iter_frames(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 100000,
+        workload: Workload = "analytics"
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Stream query results from a server-side cursor as DataFrames of up to
+        `chunk_size` rows, so large tables can be processed in bounded memory.
+        Streams are exports and scans, so they go to a read replica when available.
+        """
+        try:
+            with self.db_manager.get_connection(workload) as conn:
+                result = conn.execution_options(
+                    stream_results=True, max_row_buffer=chunk_size
+                ).execute(text(query), parameters=params or {})
+                columns = list(result.keys())
+                for partition in result.partitions(chunk_size):
+                    yield pd.DataFrame.from_records(partition, columns=columns)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def explain(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        statement_timeout_ms: Optional[int] = None,
+        workload: Workload = "analytics"
+    ) -> QueryProfile:
+        """
+        Profile a query with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+        The statement really runs, so it runs in a read-only transaction that is
+        always rolled back, cancelled after `statement_timeout_ms` when given, and
+        on a read replica when one is available.
+        """
+        statement = query.strip().rstrip(";")
+        try:
+            with self.db_manager.get_connection(workload) as conn:
+                try:
+                    conn.execute(text("SET TRANSACTION READ ONLY"))
+                    if statement_timeout_ms is not None:
+                        conn.execute(text(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}"))
+                    result = conn.execute(
+                        text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}"),
+                        parameters=params or {}
+                    )
+                    plan = result.scalar()
+                finally:
+                    conn.rollback()
+            return parse_explain_json(plan)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        except Exception as e:
+            raise DatabaseError(f"Unexpected error: {str(e)}")
+
 class EMRRecordManager:
     """Handles EMR-specific database operations"""
 
@@ -135,64 +338,121 @@ class EMRRecordManager:
         Fetch patient EMR records, optionally filtered by patient ID.
         """
         try:
-            sql = """
-            SELECT 
-                op.outpatient_record_id,
-                pi.patient_id,
-                pi.patient_name,
-                pi.gender,
-                pi.age,
-                op.visit_time,
-                op.dept_name,
-                op.clinic_diagnosis,
-                op.chief_complaint,
-                op.present_illness,
-                op.physical_examination
-            FROM 
-                emr_back.emr_outpatient_record op
-            JOIN 
-                emr_back.emr_patient_info pi ON op.patient_id = pi.patient_id
-            """
-
-            params = {"limit": limit}
-            if patient_id:
-                sql += " WHERE pi.patient_id = :patient_id"
-                params["patient_id"] = patient_id
-
-            sql += " ORDER BY op.visit_time DESC LIMIT :limit"
-            
+            sql, params = self._emr_records_query(patient_id, limit)
             return self.query_executor.execute(sql, params=params)
 
         except (QueryError, DatabaseError) as e:
             print(f"Error fetching EMR records: {e}")
             return []
 
+    def iter_emr_texts(
+        self,
+        patient_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        formatter: Optional[EMRTextFormatter] = None,
+        batch_size: int = 10000
+    ) -> Iterator[str]:
+        """
+        Stream analysis texts for EMR records straight from a server-side cursor,
+        formatting each fetched batch in bulk without building per-row dicts.
+        """
+        formatter = formatter or EMR_ANALYSIS_FORMATTER
+        sql, params = self._emr_records_query(patient_id, limit)
+        try:
+            with self.query_executor.db_manager.get_connection() as conn:
+                result = conn.execution_options(
+                    stream_results=True, max_row_buffer=batch_size
+                ).execute(text(sql), parameters=params)
+                columns = list(result.keys())
+                for partition in result.partitions(batch_size):
+                    yield from formatter.iter_format(partition, columns, batch_size)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def iter_patient_timelines(
+        self,
+        patient_ids: Sequence[str],
+        event_types: Optional[Sequence[str]] = None,
+        batch_size: int = 5000
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Stream (patient_id, events) pairs for many patients from a single UNION ALL
+        query over the EMR tables, events ordered by time. Only one patient's events
+        are held in memory at a time.
+        """
+        if not patient_ids:
+            return
+        sql = patient_timeline_query(event_types)
+        try:
+            with self.query_executor.db_manager.get_connection() as conn:
+                result = conn.execution_options(
+                    stream_results=True, max_row_buffer=batch_size
+                ).execute(text(sql), parameters={"patient_ids": list(patient_ids)})
+                rows = (row for partition in result.partitions(batch_size) for row in partition)
+                for patient_id, events in groupby(rows, key=lambda row: row.patient_id):
+                    yield patient_id, [dict(row._mapping) for row in events]
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def fetch_patient_timeline(
+        self,
+        patient_id: str,
+        event_types: Optional[Sequence[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Fetch every event for one patient across the EMR tables, ordered by time."""
+        for _, events in self.iter_patient_timelines([patient_id], event_types):
+            return events
+        return []
+
     def format_emr_for_analysis(self, record: Dict[str, Any]) -> str:
         """Format an EMR record into a text string suitable for LLM analysis."""
-        return f"""
-PATIENT INFORMATION:
-- ID: {record.get('patient_id', 'N/A')}
-- Name: {record.get('patient_name', 'N/A')}
-- Gender: {record.get('gender', 'N/A')}
-- Age: {record.get('age', 'N/A')}
-- Visit Time: {record.get('visit_time', 'N/A')}
-- Department: {record.get('dept_name', 'N/A')}
-
-CLINICAL INFORMATION:
-- Diagnosis: {record.get('clinic_diagnosis', 'N/A')}
-- Chief Complaint: {record.get('chief_complaint', 'N/A')}
-- Present Illness: {record.get('present_illness', 'N/A')}
-- Physical Examination: {record.get('physical_examination', 'N/A')}
-"""
+        return EMR_ANALYSIS_FORMATTER.format_record(record)
+
+    def _emr_records_query(
+        self,
+        patient_id: Optional[str],
+        limit: Optional[int]
+    ) -> Tuple[str, Dict[str, Any]]:
+        sql = """
+        SELECT 
+            op.outpatient_record_id,
+            pi.patient_id,
+            pi.patient_name,
+            pi.gender,
+            pi.age,
+            op.visit_time,
+            op.dept_name,
+            op.clinic_diagnosis,
+            op.chief_complaint,
+            op.present_illness,
+            op.physical_examination
+        FROM 
+            emr_back.emr_outpatient_record op
+        JOIN 
+            emr_back.emr_patient_info pi ON op.patient_id = pi.patient_id
+        """
+
+        params: Dict[str, Any] = {}
+        if patient_id:
+            sql += " WHERE pi.patient_id = :patient_id"
+            params["patient_id"] = patient_id
+
+        sql += " ORDER BY op.visit_time DESC"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        return sql, params
 
 def generate_database_metadata(
     schema: str = "emr_back",
-    output_file: Optional[str] = None
+    output_file: Optional[str] = None,
+    db_manager: Optional[DatabaseManager] = None
 ) -> Dict[str, Any]:
     """Generate database metadata using direct SQLAlchemy queries."""
     try:
-        db_manager = DatabaseManager()
-        query_executor = QueryExecutor(db_manager)
+        query_executor = QueryExecutor(db_manager or DatabaseManager())
 
         # Tables query
         tables_query = """
@@ -0,0 +1,101 @@
+"""
+Per-organization drill-down.
+Runs the missing-item and missing-patient detail for a single org_code through
+server-side prepared statements, prepared once per pooled connection and reused by
+every caller, so each drill-down is just an EXECUTE with the org code bound. The
+statements only become index lookups once OrgDrilldown.create_indexes has indexed
+org_code on the parent tables and the join column on the item tables; without those
+indexes each drill-down scans the tables.
+"""
+
+import hashlib
+from typing import List, Dict, Any, Callable, Optional, Sequence, Tuple
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError
+from .queries import LINKAGE_TABLES, org_missing_items_query, org_missing_patients_query
+
+# Drill-down kinds, each a query builder taking the linkage name
+DRILLDOWN_QUERIES: Dict[str, Callable[[str], str]] = {
+    "missing_items": org_missing_items_query,
+    "missing_patients": org_missing_patients_query,
+}
+
+# Key in the pooled connection's info dict holding the names already prepared on it
+_PREPARED_KEY = "shcdc_emr_db.prepared"
+
+
+def run_prepared(conn, query: str, arg_types: Sequence[str], args: Sequence[Any]):
+    """
+    EXECUTE `query` ($1, $2, ... placeholders) on `conn` as a prepared statement,
+    PREPAREing it first if this pooled connection has not seen it yet. Statements
+    are named by a hash of their text and types, so changed SQL gets a fresh
+    statement. Returns the EXECUTE result.
+    """
+    signature = f"{query}\0{','.join(arg_types)}"
+    name = "shcdc_" + hashlib.md5(signature.encode("utf-8")).hexdigest()[:16]
+    prepared = conn.connection.info.setdefault(_PREPARED_KEY, set())
+    if name not in prepared:
+        types = f" ({', '.join(arg_types)})" if arg_types else ""
+        conn.exec_driver_sql(f"PREPARE {name}{types} AS {query}")
+        prepared.add(name)
+    if not args:
+        return conn.execute(text(f"EXECUTE {name}"))
+    placeholders = ", ".join(f":arg{i}" for i in range(len(args)))
+    return conn.execute(text(f"EXECUTE {name} ({placeholders})"), {f"arg{i}": arg for i, arg in enumerate(args)})
+
+
+class OrgDrilldown:
+    """Per-organization detail queries backed by server-side prepared statements"""
+
+    def __init__(self, db_manager: DatabaseManager, limit: int = 1000):
+        self.db_manager = db_manager
+        self.limit = limit
+
+    def indexes(self, linkages: Optional[Sequence[str]] = None) -> List[Tuple[str, str, str]]:
+        """(table, index name, column) the drill-downs of `linkages` (default: all) look rows up by"""
+        indexes = []
+        for linkage in linkages or LINKAGE_TABLES:
+            tables = LINKAGE_TABLES[linkage]
+            for table, column in ((tables["parent_table"], "org_code"), (tables["item_table"], tables["join_field"])):
+                indexes.append((table, f"{table.split('.')[-1]}_{column}_idx", column))
+        return indexes
+
+    def create_indexes(self, linkages: Optional[Sequence[str]] = None) -> List[str]:
+        """Build the drill-down indexes without blocking writes (see DatabaseManager.create_index); returns those created"""
+        return [
+            index for table, index, column in self.indexes(linkages)
+            if self.db_manager.create_index(table, index, [column])
+        ]
+
+    def missing_items(self, linkage: str, org_code: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Parent rows of `org_code` that have no items"""
+        return self.fetch("missing_items", linkage, org_code, limit)
+
+    def missing_patients(self, linkage: str, org_code: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Parent rows of `org_code` whose patient is missing from emr_patient_info"""
+        return self.fetch("missing_patients", linkage, org_code, limit)
+
+    def fetch(self, kind: str, linkage: str, org_code: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Run drill-down `kind` for one organization"""
+        if kind not in DRILLDOWN_QUERIES:
+            raise ValueError(f"Unknown drill-down: {kind!r}")
+        if linkage not in LINKAGE_TABLES:
+            raise ValueError(f"Unknown linkage: {linkage!r}")
+        return self.execute_prepared(
+            DRILLDOWN_QUERIES[kind](linkage),
+            ["text", "integer"],
+            [org_code, self.limit if limit is None else limit],
+        )
+
+    def execute_prepared(self, query: str, arg_types: Sequence[str], args: Sequence[Any]) -> List[Dict[str, Any]]:
+        """EXECUTE `query` ($1, $2, ... placeholders) as a prepared statement; see run_prepared"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                return [dict(row._mapping) for row in run_prepared(conn, query, arg_types, args)]
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        except Exception as e:
+            raise DatabaseError(f"Unexpected error: {str(e)}")
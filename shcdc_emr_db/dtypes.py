@@ -0,0 +1,106 @@
+"""
+Compact result dtypes.
+Query results come back from pandas as object strings and int64 counts. This
+stage maps them to smaller dtypes using the column types of
+generate_database_metadata: repetitive code and name columns become categoricals,
+other text Arrow-backed strings, and integers the smallest width that holds them.
+Aliased columns (p.org_name AS 机构名称) are traced back to their source column in
+the query.
+"""
+
+import re
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# Text columns kept as categoricals when at most this share of their values is distinct
+MAX_CATEGORY_RATIO = 0.5
+# Categoricals only pay off once values repeat
+MIN_CATEGORY_ROWS = 20
+# Code and organization columns are the low-cardinality text of the EMR tables
+CATEGORY_SUFFIXES = ("_code", "org_name", "dept_name", "_type_name", "_flag", "_status")
+TEXT_TYPES = ("character varying", "character", "text")
+# Integers are not narrowed below this, so arithmetic such as 100 * count cannot overflow
+MIN_INT_DTYPE = np.int32
+
+# "<alias>.<column> AS <name>" in a select list
+_ALIAS_PATTERN = re.compile(r"\b\w+\.(\w+)\s+AS\s+\"?([^\s,\"]+)\"?", re.IGNORECASE)
+
+
+def _arrow_strings() -> Optional[str]:
+    try:
+        import pyarrow  # noqa: F401
+        return "string[pyarrow]"
+    except ImportError:
+        return None
+
+
+STRING_DTYPE = _arrow_strings()
+
+
+def column_types(metadata: Dict[str, Any]) -> Dict[str, str]:
+    """Column name -> data type over all tables of generate_database_metadata output"""
+    types: Dict[str, str] = {}
+    for table in metadata.get("tables", {}).values():
+        for column in table.get("columns", []):
+            types.setdefault(str(column.get("column_name")), str(column.get("data_type")))
+    return types
+
+
+def source_columns(query: str) -> Dict[str, str]:
+    """Result column -> table column it selects, for the aliased columns of `query`"""
+    return {alias: column for column, alias in _ALIAS_PATTERN.findall(query)}
+
+
+def _is_category_column(column: str) -> bool:
+    return column.endswith(CATEGORY_SUFFIXES)
+
+
+def _is_text(series: pd.Series) -> bool:
+    values = series.dropna()
+    return len(values) > 0 and all(isinstance(value, str) for value in values)
+
+
+def compact_frame(
+    frame: pd.DataFrame,
+    query: Optional[str] = None,
+    types: Optional[Dict[str, str]] = None,
+    max_category_ratio: float = MAX_CATEGORY_RATIO
+) -> pd.DataFrame:
+    """
+    Return `frame` with compact dtypes. `types` (see column_types) says which
+    columns are text in the database; with `query` aliased columns use their
+    source column's type and name. Text columns whose source is a code or
+    organization column and whose values repeat enough become categoricals.
+    Text without metadata only becomes Arrow strings, and integers are
+    narrowed to int32 when they fit.
+    """
+    if frame.empty:
+        return frame
+    types = types or {}
+    sources = source_columns(query) if query else {}
+    columns = {}
+    for name in frame.columns:
+        series = frame[name]
+        source = sources.get(name, name)
+        if pd.api.types.is_integer_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            info = np.iinfo(MIN_INT_DTYPE)
+            if series.dtype.itemsize > info.bits // 8 and series.between(info.min, info.max).all():
+                columns[name] = series.astype(MIN_INT_DTYPE)
+        elif series.dtype == object and _is_text(series):
+            declared = types.get(source)
+            repeats = (
+                len(series) >= MIN_CATEGORY_ROWS
+                and series.nunique() <= max_category_ratio * len(series)
+            )
+            if declared in TEXT_TYPES and _is_category_column(source) and repeats:
+                columns[name] = series.astype("category")
+            elif STRING_DTYPE:
+                columns[name] = series.astype(STRING_DTYPE)
+    if not columns:
+        return frame
+    frame = frame.copy()
+    for name, series in columns.items():
+        frame[name] = series
+    return frame
@@ -0,0 +1,186 @@
+"""
+Federated queries across several EMR databases.
+Runs the same statement against every configured source (one INI section per
+district database) concurrently and merges the partial aggregates: counts are
+summed per key, rate columns are re-derived as record-weighted means, and row
+listings are stacked with their source.
+"""
+
+import fnmatch
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Literal, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError
+from .queries import LINKAGE_TABLES, dashboard_query_catalog
+
+MergeMode = Literal["sum", "stack"]
+
+# Numeric columns with this suffix are percentages (缺失率, 完整率) and are averaged, not summed
+RATE_SUFFIX = "率"
+SOURCE_COLUMN = "source"
+
+# Catalog queries listing rows rather than aggregating them
+STACKED_QUERIES = tuple(
+    f"{linkage}.{listing}" for linkage in LINKAGE_TABLES for listing in ("orphaned_items", "missing_items")
+)
+
+
+def merge_frames(
+    frames: Sequence[pd.DataFrame],
+    keys: Optional[Sequence[str]] = None,
+    weight: Optional[str] = None,
+    averaged: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """
+    Combine partial aggregates of the same query. Rows are grouped by `keys` (default:
+    the non-numeric columns); numeric columns are summed except `averaged` ones
+    (default: names ending in 率), which become means weighted by `weight` (default:
+    the first summed column, e.g. 记录总数), so per-source rates combine exactly.
+    """
+    frames = [frame for frame in frames if frame is not None and len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    stacked = pd.concat(frames, ignore_index=True)
+    numeric = list(stacked.select_dtypes("number").columns)
+    keys = list(keys) if keys is not None else [c for c in stacked.columns if c not in numeric]
+    if averaged is None:
+        averaged = [c for c in numeric if c not in keys and str(c).endswith(RATE_SUFFIX)]
+    averaged = list(averaged)
+    summed = [c for c in numeric if c not in keys and c not in averaged]
+
+    work = stacked[keys + summed].copy()
+    if averaged:
+        weight = weight or (summed[0] if summed else None)
+        if weight is None:
+            raise ValueError(f"No count column to weight {', '.join(averaged)} by")
+        for column in averaged:
+            work[column] = stacked[column] * stacked[weight]
+
+    if keys:
+        merged = work.groupby(keys, sort=False, dropna=False).sum(min_count=1).reset_index()
+    else:
+        merged = work.sum(min_count=1).to_frame().T
+    for column in averaged:
+        merged[column] = (merged[column] / merged[weight].where(merged[weight] != 0)).round(2)
+    for column in summed:
+        if pd.api.types.is_integer_dtype(stacked[column]):
+            merged[column] = merged[column].astype(stacked[column].dtype)
+    return merged[list(stacked.columns)]
+
+
+@dataclass
+class SourceResult:
+    """One source's part of a federated query"""
+
+    source: str
+    frame: pd.DataFrame = field(default_factory=pd.DataFrame)
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class FederatedResult:
+    """Combined result of one query with the per-source parts and timings"""
+
+    name: str
+    combined: pd.DataFrame
+    sources: List[SourceResult]
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        return {part.source: part.seconds for part in self.sources}
+
+    @property
+    def failed(self) -> Dict[str, str]:
+        return {part.source: part.error for part in self.sources if part.error}
+
+    def stacked(self) -> pd.DataFrame:
+        """Every source's rows with a source column, unmerged"""
+        frames = [part.frame.assign(**{SOURCE_COLUMN: part.source}) for part in self.sources if not part.error]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+class FederatedExecutor:
+    """Runs queries against several databases concurrently and merges the results"""
+
+    def __init__(self, db_managers: Dict[str, DatabaseManager], workers: int = 8):
+        if not db_managers:
+            raise ValueError("A federated executor needs at least one source")
+        self.db_managers = dict(db_managers)
+        self.workers = workers
+
+    @classmethod
+    def from_sections(
+        cls,
+        sections: Sequence[str],
+        config_file: str = "config/database.ini",
+        workers: int = 8
+    ) -> "FederatedExecutor":
+        """One source per INI section of `config_file`, named after the section"""
+        return cls({section: DatabaseManager(config_file, section) for section in sections}, workers)
+
+    def _fetch(self, source: str, query: str, params: Dict[str, Any]) -> SourceResult:
+        started = time.time()
+        try:
+            with self.db_managers[source].get_connection("analytics") as conn:
+                frame = pd.read_sql_query(text(query), conn, params=params)
+            return SourceResult(source, frame, time.time() - started)
+        except sa_exc.SQLAlchemyError as e:
+            return SourceResult(source, seconds=time.time() - started, error=f"Database error: {str(e)}")
+        except DatabaseError as e:
+            return SourceResult(source, seconds=time.time() - started, error=str(e))
+
+    def run_many(
+        self,
+        queries: Dict[str, str],
+        params: Optional[Dict[str, Any]] = None,
+        merge: Optional[Dict[str, MergeMode]] = None
+    ) -> Dict[str, FederatedResult]:
+        """
+        Run every query on every source, all (source, query) pairs sharing one pool,
+        and merge each query's parts: "sum" (default) aggregates them with
+        merge_frames, "stack" concatenates the rows with a source column. Failed
+        sources are reported in the result and left out of the combination.
+        """
+        merge = merge or {}
+        sources = list(self.db_managers)
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            futures = {
+                (name, source): pool.submit(self._fetch, source, query, dict(params or {}))
+                for name, query in queries.items()
+                for source in sources
+            }
+            parts = {key: future.result() for key, future in futures.items()}
+
+        results = {}
+        for name in queries:
+            result = FederatedResult(name, pd.DataFrame(), [parts[(name, source)] for source in sources])
+            if merge.get(name, "sum") == "stack":
+                result.combined = result.stacked()
+            else:
+                result.combined = merge_frames([part.frame for part in result.sources if not part.error])
+            results[name] = result
+        return results
+
+    def run(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        merge: MergeMode = "sum"
+    ) -> FederatedResult:
+        """Run one query on every source; see run_many"""
+        return self.run_many({"query": query}, params, {"query": merge})["query"]
+
+    def run_catalog(self, patterns: Sequence[str] = ()) -> Dict[str, FederatedResult]:
+        """The dashboard catalog (or the queries matching the glob `patterns`) across all sources"""
+        queries = {
+            name: query for name, query in dashboard_query_catalog().items()
+            if not patterns or any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+        }
+        merge: Dict[str, MergeMode] = {name: "stack" for name in queries if name in STACKED_QUERIES}
+        return self.run_many(queries, merge=merge)
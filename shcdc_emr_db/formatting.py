@@ -0,0 +1,134 @@
+"""
+Batch EMR text formatting.
+Renders prompt texts for LLM analysis from columnar results or row streams with a
+template compiled once, instead of building a dict and an f-string per record.
+"""
+
+import math
+import re
+from itertools import islice, repeat
+from string import Formatter
+from typing import List, Dict, Any, Iterable, Iterator, Mapping, Optional, Sequence, Union
+
+import pandas as pd
+
+EMR_ANALYSIS_TEMPLATE = """
+PATIENT INFORMATION:
+- ID: {patient_id}
+- Name: {patient_name}
+- Gender: {gender}
+- Age: {age}
+- Visit Time: {visit_time}
+- Department: {dept_name}
+
+CLINICAL INFORMATION:
+- Diagnosis: {clinic_diagnosis}
+- Chief Complaint: {chief_complaint}
+- Present Illness: {present_illness}
+- Physical Examination: {physical_examination}
+"""
+
+# Rough LLM token boundaries: one per CJK character, word or punctuation mark
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+|[^\w\s]")
+
+
+def truncate_tokens(value: str, max_tokens: int, ellipsis: str = "…") -> str:
+    """Cut `value` after `max_tokens` approximate tokens, appending `ellipsis` if cut"""
+    # Every token spans at least one character, so short values never need scanning
+    if len(value) <= max_tokens:
+        return value
+    tokens = _TOKEN_RE.finditer(value)
+    cut = next(islice(tokens, max_tokens, None), None)
+    if cut is None:
+        return value
+    return value[:cut.start()].rstrip() + ellipsis
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value))
+
+
+class EMRTextFormatter:
+    """Renders EMR records into analysis texts in bulk"""
+
+    def __init__(
+        self,
+        template: str = EMR_ANALYSIS_TEMPLATE,
+        max_field_tokens: Union[int, Dict[str, int], None] = None,
+        missing: str = "N/A",
+        ellipsis: str = "…"
+    ):
+        self.template = template
+        self.missing = missing
+        self.ellipsis = ellipsis
+        self.fields: List[str] = []
+
+        # Named fields become positional ones so each text is a single str.format call
+        parts = []
+        for literal, name, spec, conversion in Formatter().parse(template):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if name is None:
+                continue
+            if name not in self.fields:
+                self.fields.append(name)
+            parts.append("{%d%s%s}" % (
+                self.fields.index(name),
+                f"!{conversion}" if conversion else "",
+                f":{spec}" if spec else "",
+            ))
+        self._render = "".join(parts).format
+
+        if isinstance(max_field_tokens, int):
+            max_field_tokens = dict.fromkeys(self.fields, max_field_tokens)
+        self.max_field_tokens: Dict[str, int] = max_field_tokens or {}
+
+    def format_record(self, record: Mapping[str, Any]) -> str:
+        """Format a single record"""
+        return self.format_columns({name: [record.get(name)] for name in self.fields})[0]
+
+    def format_columns(self, columns: Union[pd.DataFrame, Mapping[str, Sequence[Any]]]) -> List[str]:
+        """Format a columnar result (DataFrame or column name -> values) into one text per row"""
+        if isinstance(columns, pd.DataFrame):
+            n_rows = len(columns.index)
+        else:
+            n_rows = max((len(values) for values in columns.values()), default=0)
+        prepared = [
+            self._prepare(name, columns[name]) if name in columns else repeat(self.missing, n_rows)
+            for name in self.fields
+        ]
+        return list(map(self._render, *prepared)) if prepared else [self.template] * n_rows
+
+    def iter_format(
+        self,
+        rows: Iterable[Union[Mapping[str, Any], Sequence[Any]]],
+        columns: Optional[Sequence[str]] = None,
+        batch_size: int = 10000
+    ) -> Iterator[str]:
+        """
+        Lazily format a stream of rows, `batch_size` rows at a time.
+        Rows are mappings, or tuples in the order given by `columns`.
+        """
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            if columns is None:
+                yield from self.format_columns(
+                    {name: [row.get(name) for row in batch] for name in self.fields}
+                )
+            else:
+                yield from self.format_columns(dict(zip(columns, zip(*batch))))
+
+    def _prepare(self, name: str, values: Union[pd.Series, Sequence[Any]]) -> List[str]:
+        """Stringify a column, filling missing values and truncating long ones"""
+        if isinstance(values, pd.Series):
+            texts = values.astype(str).where(values.notna(), self.missing).tolist()
+        else:
+            texts = [self.missing if _is_missing(value) else str(value) for value in values]
+
+        max_tokens = self.max_field_tokens.get(name)
+        if max_tokens is not None:
+            texts = [truncate_tokens(value, max_tokens, self.ellipsis) for value in texts]
+        return texts
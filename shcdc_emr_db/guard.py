@@ -0,0 +1,218 @@
+"""
+Guarded execution of ad-hoc SQL.
+Validates that a statement is a single read-only query and runs it in a read-only
+transaction with a statement timeout, a row cap and a memory budget, paging results
+so callers can "load more" without ever pulling a whole table into memory.
+"""
+
+import re
+import sys
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError, QueryRejectedError
+
+ALLOWED_LEADING_KEYWORDS = ("SELECT", "WITH", "VALUES", "TABLE")
+
+FORBIDDEN_KEYWORDS = (
+    "INSERT", "UPDATE", "DELETE", "MERGE", "TRUNCATE", "DROP", "ALTER",
+    "CREATE", "GRANT", "REVOKE", "COPY", "INTO", "LOCK", "VACUUM", "CALL",
+)
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*")
+_DOLLAR_TAG_RE = re.compile(r"\$[A-Za-z_0-9]*\$")
+
+
+def mask_sql(query: str) -> str:
+    """
+    Replace comments, string literals, quoted identifiers and dollar-quoted bodies
+    with spaces so keywords and semicolons can be inspected safely.
+    """
+    out = []
+    i = 0
+    n = len(query)
+    while i < n:
+        ch = query[i]
+        if query.startswith("--", i):
+            end = query.find("\n", i)
+            end = n if end == -1 else end
+            out.append(" " * (end - i))
+            i = end
+        elif query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            out.append(" " * (end - i))
+            i = end
+        elif ch in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if query[end] == ch:
+                    if end + 1 < n and query[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            end = min(end + 1, n)
+            out.append(" " * (end - i))
+            i = end
+        elif ch == "$" and _DOLLAR_TAG_RE.match(query, i):
+            tag = _DOLLAR_TAG_RE.match(query, i).group(0)
+            end = query.find(tag, i + len(tag))
+            end = n if end == -1 else end + len(tag)
+            out.append(" " * (end - i))
+            i = end
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def validate_read_only_query(query: str) -> str:
+    """
+    Check that `query` is exactly one read-only statement and return it without
+    the trailing semicolon. Raises QueryRejectedError otherwise.
+    """
+    statement = query.strip()
+    masked = mask_sql(statement)
+
+    # Drop trailing semicolons (and whitespace) from both versions in step
+    while masked.rstrip().endswith(";"):
+        cut = len(masked.rstrip()) - 1
+        masked, statement = masked[:cut], statement[:cut]
+    statement, masked = statement.rstrip(), masked.rstrip()
+
+    if not masked.strip():
+        raise QueryRejectedError("Empty query")
+    if ";" in masked:
+        raise QueryRejectedError("Only a single SQL statement is allowed")
+
+    words = [word.upper() for word in _WORD_RE.findall(masked)]
+    if not words:
+        raise QueryRejectedError("Only read-only queries are allowed")
+    if words[0] not in ALLOWED_LEADING_KEYWORDS:
+        raise QueryRejectedError(f"Only read-only queries are allowed, got {words[0]}")
+
+    forbidden = sorted(set(words) & set(FORBIDDEN_KEYWORDS))
+    if forbidden:
+        raise QueryRejectedError(f"Forbidden keyword(s) in query: {', '.join(forbidden)}")
+
+    return statement
+
+
+@dataclass
+class GuardedResult:
+    """One page of rows returned by a guarded query"""
+
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    offset: int
+    has_more: bool
+    truncated_by_memory: bool = False
+    approx_bytes: int = 0
+
+    @property
+    def next_offset(self) -> int:
+        return self.offset + len(self.rows)
+
+
+class GuardedQueryExecutor:
+    """Runs ad-hoc SQL under read-only, timeout, row and memory budgets"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        max_rows: int = 1000,
+        statement_timeout_ms: int = 30000,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        batch_size: int = 500
+    ):
+        self.db_manager = db_manager
+        self.max_rows = max_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_memory_bytes = max_memory_bytes
+        self.batch_size = batch_size
+
+    def execute(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        offset: int = 0,
+        max_rows: Optional[int] = None
+    ) -> GuardedResult:
+        """
+        Fetch one page of at most `max_rows` rows starting at `offset`.
+        Rows are streamed from a server-side cursor in batches, and fetching stops
+        early once the memory budget is exhausted.
+
+        Each page re-runs the query and skips `offset` rows, so later pages cost
+        more, and page boundaries are only stable when the query ends with an
+        ORDER BY over a unique key; otherwise rows may repeat or be skipped.
+        """
+        statement = validate_read_only_query(query)
+        limit = max_rows or self.max_rows
+        # The newline ends a trailing -- comment of the statement
+        paged = (
+            f"SELECT * FROM ({statement}\n) AS guarded_query "
+            "LIMIT :_guard_limit OFFSET :_guard_offset"
+        )
+        bind = dict(params or {})
+        # Ask for one extra row to learn whether another page exists
+        bind.update({"_guard_limit": limit + 1, "_guard_offset": offset})
+
+        rows: List[Dict[str, Any]] = []
+        approx_bytes = 0
+        truncated_by_memory = False
+        has_more = False
+
+        try:
+            with self.db_manager.get_connection("analytics") as conn:
+                try:
+                    conn.execute(text("SET TRANSACTION READ ONLY"))
+                    conn.execute(
+                        text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}")
+                    )
+                    result = conn.execute(
+                        text(paged),
+                        parameters=bind,
+                        execution_options={"stream_results": True, "max_row_buffer": self.batch_size},
+                    )
+                    columns = list(result.keys())
+
+                    for partition in result.partitions(self.batch_size):
+                        for row in partition:
+                            if len(rows) >= limit:
+                                has_more = True
+                                break
+                            record = dict(row._mapping)
+                            approx_bytes += _approx_row_size(record)
+                            if approx_bytes > self.max_memory_bytes:
+                                truncated_by_memory = True
+                                has_more = True
+                                break
+                            rows.append(record)
+                        if has_more:
+                            break
+                    result.close()
+                finally:
+                    conn.rollback()
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        except Exception as e:
+            raise DatabaseError(f"Unexpected error: {str(e)}")
+
+        return GuardedResult(
+            columns=columns,
+            rows=rows,
+            offset=offset,
+            has_more=has_more,
+            truncated_by_memory=truncated_by_memory,
+            approx_bytes=approx_bytes,
+        )
+
+
+def _approx_row_size(record: Dict[str, Any]) -> int:
+    """Cheap estimate of the in-memory size of one fetched row"""
+    return sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
@@ -0,0 +1,247 @@
+"""
+Background query jobs.
+Runs long queries on a worker pool so callers can poll for progress and results,
+and cancels abandoned queries on the server with pg_cancel_backend. Finished jobs
+that nobody collects are dropped after finished_ttl seconds.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Optional, Literal
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError, Workload
+
+JobStatus = Literal["pending", "running", "done", "failed", "cancelled"]
+
+
+@dataclass
+class QueryJob:
+    """State of one background query"""
+
+    job_id: str
+    query: str
+    params: Dict[str, Any]
+    owner: Optional[str] = None
+    status: JobStatus = "pending"
+    backend_pid: Optional[int] = None
+    endpoint: Optional[str] = None
+    rows_fetched: int = 0
+    columns: List[str] = field(default_factory=list)
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds spent running so far, or in total once finished"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class QueryJobManager:
+    """Submits queries to a worker pool and tracks, polls and cancels them"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        max_workers: int = 4,
+        batch_size: int = 1000,
+        workload: Workload = "analytics",
+        finished_ttl: float = 600.0
+    ):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.workload = workload
+        # Seconds a finished job and its rows are kept for the caller to collect
+        self.finished_ttl = finished_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="emr-query-job")
+        self._jobs: Dict[str, QueryJob] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # Held while a backend is signalled; jobs finish under it before their connection
+        # goes back to the pool, so a cancel never reaches a backend reused by another query
+        self._cancel_lock = threading.Lock()
+
+    def submit(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        owner: Optional[str] = None
+    ) -> str:
+        """Queue a query and return its job id"""
+        job = QueryJob(job_id=uuid.uuid4().hex, query=query, params=dict(params or {}), owner=owner)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+            self._futures[job.job_id] = self._pool.submit(self._run, job.job_id)
+        return job.job_id
+
+    def get(self, job_id: str) -> QueryJob:
+        """Return a snapshot of the job state, safe to read while it runs"""
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError(f"Unknown job {job_id}")
+            job = self._jobs[job_id]
+            return replace(job, rows=list(job.rows), columns=list(job.columns))
+
+    def progress(self, job_id: str) -> QueryJob:
+        """Snapshot of the job state without its rows, cheap enough to poll"""
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError(f"Unknown job {job_id}")
+            job = self._jobs[job_id]
+            return replace(job, rows=[], columns=list(job.columns))
+
+    def jobs(self, owner: Optional[str] = None) -> List[QueryJob]:
+        """Progress snapshots (without rows) of all jobs, optionally only those of one owner"""
+        with self._lock:
+            self._prune()
+            return [
+                replace(job, rows=[], columns=list(job.columns))
+                for job in self._jobs.values() if owner is None or job.owner == owner
+            ]
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> QueryJob:
+        """Block until the job finishes (or the timeout passes) and return its state"""
+        future = self._futures.get(job_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. Pending jobs are dropped from the queue; running jobs are
+        cancelled on the server via pg_cancel_backend. Returns False if already finished.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_requested = True
+            if job.status == "pending" and self._futures[job_id].cancel():
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                return True
+
+        with self._cancel_lock:
+            with self._lock:
+                if job.finished:
+                    return False
+                pid, endpoint = job.backend_pid, job.endpoint
+            if pid is not None:
+                self._cancel_backend(pid, endpoint)
+        return True
+
+    def cancel_owner(self, owner: str, keep: Optional[List[str]] = None) -> int:
+        """Cancel every unfinished job of `owner` except those in `keep`"""
+        keep = keep or []
+        cancelled = 0
+        for job in self.jobs(owner):
+            if job.job_id not in keep and self.cancel(job.job_id):
+                cancelled += 1
+        return cancelled
+
+    def forget(self, job_id: str) -> None:
+        """Drop a finished job and its result from memory"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished:
+                del self._jobs[job_id]
+                del self._futures[job_id]
+
+    def shutdown(self) -> None:
+        """Cancel all unfinished jobs and stop the worker pool"""
+        for job in self.jobs():
+            self.cancel(job.job_id)
+        self._pool.shutdown(wait=False)
+
+    def _prune(self) -> None:
+        """Drop jobs finished more than finished_ttl seconds ago; call with the lock held"""
+        expired = time.time() - self.finished_ttl
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at is not None and job.finished_at <= expired
+        ]:
+            del self._jobs[job_id]
+            del self._futures[job_id]
+
+    def _cancel_backend(self, pid: int, endpoint: Optional[str] = None) -> None:
+        """Ask PostgreSQL to cancel the statement running on backend `pid` of `endpoint`"""
+        try:
+            with self.db_manager.get_connection(endpoint=endpoint) as conn:
+                conn.execute(text("SELECT pg_cancel_backend(:pid)"), parameters={"pid": pid})
+        except sa_exc.SQLAlchemyError as e:
+            print(f"Error cancelling backend {pid}: {e}")
+
+    def _update(self, job_id: str, **changes: Any) -> QueryJob:
+        with self._lock:
+            job = self._jobs[job_id]
+            for key, value in changes.items():
+                setattr(job, key, value)
+            return job
+
+    def _finish(self, job_id: str, error: Optional[Exception] = None) -> None:
+        """Record how the job ended, unless it already has"""
+        with self._cancel_lock, self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            if error is None:
+                job.status = "done"
+            elif isinstance(error, (sa_exc.SQLAlchemyError, DatabaseError)):
+                job.status = "cancelled" if job.cancel_requested else "failed"
+                job.error = str(error)
+            else:
+                job.status = "failed"
+                job.error = f"Unexpected error: {str(error)}"
+            job.finished_at = time.time()
+
+    def _run(self, job_id: str) -> None:
+        """Worker body: execute the query, streaming rows so progress can be polled"""
+        job = self._update(job_id, status="running", started_at=time.time())
+        try:
+            # Pin the endpoint so a cancel reaches the server running the query
+            endpoint = self.db_manager.route(self.workload)
+            with self.db_manager.get_connection(endpoint=endpoint) as conn:
+                # Finish while the connection is still ours, before it returns to the pool
+                try:
+                    pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+                    job = self._update(job_id, backend_pid=pid, endpoint=endpoint)
+                    if job.cancel_requested:
+                        raise QueryError("Job cancelled before start")
+
+                    result = conn.execute(
+                        text(job.query),
+                        parameters=job.params,
+                        execution_options={"stream_results": True, "max_row_buffer": self.batch_size},
+                    )
+                    self._update(job_id, columns=list(result.keys()))
+                    for partition in result.partitions(self.batch_size):
+                        records = [dict(row._mapping) for row in partition]
+                        with self._lock:
+                            job.rows.extend(records)
+                            job.rows_fetched += len(records)
+                except Exception as e:
+                    self._finish(job_id, e)
+                else:
+                    self._finish(job_id)
+
+        except Exception as e:
+            # Routing or connecting failed before the job could finish
+            self._finish(job_id, e)
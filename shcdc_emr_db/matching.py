@@ -0,0 +1,310 @@
+"""
+Fuzzy patient matching.
+Finds the same person recorded under different emr_patient_info ids. The database
+groups rows into candidate blocks by normalized keys (ID number, name plus birth
+date); block-aligned batches are scored on a process pool with vectorized name and
+ID similarity, and matched pairs are merged into clusters for review.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import exc as sa_exc
+
+from .db import QueryExecutor, QueryError
+from .checks import _char_matrix
+
+_NORMALIZED_ID_CARD = r"upper(regexp_replace(id_card, '[\s-]', '', 'g'))"
+_NORMALIZED_NAME = r"regexp_replace(patient_name, '[\s·•.]', '', 'g')"
+
+# Candidate blocks: rows sharing one of these keys are compared pairwise.
+# 15-digit IDs are widened to 18 digits and the check character is dropped, so
+# old/new forms of a number and check-digit typos land in the same block.
+BLOCKING_KEYS: Dict[str, str] = {
+    "id_card": f"""
+        CASE
+            WHEN length({_NORMALIZED_ID_CARD}) = 15
+                THEN left({_NORMALIZED_ID_CARD}, 6) || '19' || right({_NORMALIZED_ID_CARD}, 9)
+            WHEN length({_NORMALIZED_ID_CARD}) = 18 THEN left({_NORMALIZED_ID_CARD}, 17)
+            ELSE NULLIF({_NORMALIZED_ID_CARD}, '')
+        END""",
+    "name_birth": f"NULLIF({_NORMALIZED_NAME}, '') || '|' || birth_date",
+}
+
+# Feature weights; a pair's score is the weighted mean over the features both rows have
+MATCH_WEIGHTS: Dict[str, float] = {"id_card": 0.5, "name": 0.3, "birth_date": 0.15, "gender": 0.05}
+
+MATCH_COLUMNS = ("id", "patient_name", "id_card", "birth_date", "gender_code", "org_code")
+
+# Names are compared on at most this many characters
+MAX_NAME_LENGTH = 16
+
+
+def normalize_id_card(id_card: pd.Series) -> pd.Series:
+    """Pandas equivalent of the id_card blocking key"""
+    cleaned = id_card.str.replace(r"[\s-]", "", regex=True).str.upper()
+    lengths = cleaned.str.len()
+    widened = cleaned.str[:6] + "19" + cleaned.str[6:]
+    return (
+        cleaned.where(lengths != 18, cleaned.str[:17])
+        .where(lengths != 15, widened)
+        .mask(lambda normalized: normalized == "")
+    )
+
+
+def normalize_name(names: pd.Series) -> pd.Series:
+    return names.str.replace(r"[\s·•.]", "", regex=True).mask(lambda normalized: normalized == "")
+
+
+def name_similarity(a: pd.Series, b: pd.Series) -> np.ndarray:
+    """1 - Levenshtein distance / longer length, computed for all pairs at once"""
+    width = MAX_NAME_LENGTH
+    left, left_len = _char_matrix(a, width)
+    right, right_len = _char_matrix(b, width)
+    left_len, right_len = np.minimum(left_len, width), np.minimum(right_len, width)
+    width = int(max(left_len.max(initial=0), right_len.max(initial=0)))
+    rows = np.arange(len(left))
+
+    # Dynamic programming over prefixes of `a`, one matrix row per character, all pairs at once
+    previous = np.tile(np.arange(width + 1), (len(left), 1))
+    final = previous.copy()
+    for i in range(1, width + 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        cost = left[:, i - 1:i] != right[:, :width]
+        for j in range(1, width + 1):
+            current[:, j] = np.minimum(
+                np.minimum(previous[:, j], current[:, j - 1]) + 1,
+                previous[:, j - 1] + cost[:, j - 1],
+            )
+        final = np.where((left_len == i)[:, None], current, final)
+        previous = current
+
+    longest = np.maximum(left_len, right_len)
+    distance = final[rows, right_len]
+    return np.where(longest > 0, 1 - distance / np.maximum(longest, 1), 1.0)
+
+
+def id_card_similarity(a: pd.Series, b: pd.Series) -> np.ndarray:
+    """1 for equal normalized IDs, the share of equal characters for one-character typos, else 0"""
+    left, left_len = _char_matrix(a, 17)
+    right, right_len = _char_matrix(b, 17)
+    same_length = left_len == right_len
+    matches = ((left == right) & (left != 0)).sum(axis=1)
+    length = np.maximum(left_len, 1)
+    return np.where(same_length & (matches >= length - 1), matches / length, 0.0)
+
+
+def block_pairs(block_keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions (i, j), i < j, of every pair of rows sharing a key; keys must be sorted"""
+    starts = np.flatnonzero(np.r_[True, block_keys[1:] != block_keys[:-1]])
+    ends = np.r_[starts[1:], len(block_keys)]
+    block_end = np.repeat(ends, ends - starts)
+    partners = block_end - np.arange(len(block_keys)) - 1
+    left = np.repeat(np.arange(len(block_keys)), partners)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+    return left, left + offsets + 1
+
+
+def score_block_batch(batch: pd.DataFrame) -> pd.DataFrame:
+    """Score every candidate pair in a batch of whole blocks sorted by block_key"""
+    left, right = block_pairs(batch["block_key"].to_numpy())
+    a = batch.iloc[left].reset_index(drop=True)
+    b = batch.iloc[right].reset_index(drop=True)
+
+    id_a, id_b = normalize_id_card(a["id_card"]), normalize_id_card(b["id_card"])
+    name_a, name_b = normalize_name(a["patient_name"]), normalize_name(b["patient_name"])
+    features = {
+        "id_card": (id_a.notna() & id_b.notna(), id_card_similarity(id_a, id_b)),
+        "name": (name_a.notna() & name_b.notna(), name_similarity(name_a, name_b)),
+        "birth_date": (
+            a["birth_date"].notna() & b["birth_date"].notna(),
+            (a["birth_date"] == b["birth_date"]).to_numpy(dtype=float),
+        ),
+        "gender": (
+            a["gender_code"].notna() & b["gender_code"].notna(),
+            (a["gender_code"] == b["gender_code"]).to_numpy(dtype=float),
+        ),
+    }
+
+    weighted = np.zeros(len(a))
+    available = np.zeros(len(a))
+    pairs = pd.DataFrame({"id_a": a["id"], "id_b": b["id"]})
+    for name, (present, similarity) in features.items():
+        present = present.to_numpy(dtype=bool)
+        weighted += np.where(present, MATCH_WEIGHTS[name] * similarity, 0)
+        available += np.where(present, MATCH_WEIGHTS[name], 0)
+        pairs[f"{name}_similarity"] = np.where(present, similarity, np.nan)
+    pairs["score"] = np.where(available > 0, weighted / np.maximum(available, 1e-9), 0.0)
+
+    # Keep each pair once, smaller id first
+    swap = pairs["id_a"] > pairs["id_b"]
+    pairs.loc[swap, ["id_a", "id_b"]] = pairs.loc[swap, ["id_b", "id_a"]].to_numpy()
+    return pairs
+
+
+def cluster_pairs(pairs: pd.DataFrame) -> pd.DataFrame:
+    """Connected components of matched pairs as (id, cluster_id), cluster_id being the smallest id"""
+    if pairs.empty:
+        return pd.DataFrame(columns=["id", "cluster_id"])
+    codes, ids = pd.factorize(pd.concat([pairs["id_a"], pairs["id_b"]], ignore_index=True), sort=True)
+    a, b = codes[:len(pairs)], codes[len(pairs):]
+    labels = np.arange(len(ids))
+    while True:
+        # Pull both ends of every edge to the smaller label, then compress label chains
+        smaller = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        for ends in (a, b, labels[a], labels[b]):
+            np.minimum.at(updated, ends, smaller)
+        while not np.array_equal(updated[updated], updated):
+            updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return pd.DataFrame({"id": ids, "cluster_id": ids[labels]})
+
+
+def _bounded_map(pool: ProcessPoolExecutor, func, items, window: int) -> Iterator:
+    """pool.map that keeps at most `window` items in flight, so batches are not all read up front"""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+@dataclass
+class MatchResult:
+    """Scored candidate pairs and the clusters formed by pairs at or above the threshold"""
+
+    pairs: pd.DataFrame
+    clusters: pd.DataFrame
+    threshold: float
+    blocks_skipped: Dict[str, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def matches(self) -> pd.DataFrame:
+        return self.pairs[self.pairs["score"] >= self.threshold]
+
+
+class PatientMatcher:
+    """Blocks, scores and clusters emr_patient_info rows that likely belong to the same person"""
+
+    def __init__(
+        self,
+        query_executor: QueryExecutor,
+        threshold: float = 0.85,
+        workers: int = 4,
+        batch_rows: int = 200000,
+        max_block_size: int = 100,
+        schema: str = "emr_back"
+    ):
+        self.query_executor = query_executor
+        self.threshold = threshold
+        self.workers = workers
+        self.batch_rows = batch_rows
+        self.max_block_size = max_block_size
+        self.schema = schema
+
+    def candidates_query(self, blocking_key: str) -> str:
+        """
+        Rows sharing `blocking_key` with at least one other row, ordered by block.
+        Blocks larger than max_block_size (placeholder IDs, names like 未知) are left out.
+        """
+        return f"""
+            SELECT {', '.join(MATCH_COLUMNS)}, block_key
+            FROM (
+                SELECT {', '.join(MATCH_COLUMNS)}, block_key,
+                       COUNT(*) OVER (PARTITION BY block_key) AS block_size
+                FROM (
+                    SELECT {', '.join(MATCH_COLUMNS)}, {BLOCKING_KEYS[blocking_key]} AS block_key
+                    FROM {self.schema}.emr_patient_info
+                ) keyed
+                WHERE block_key IS NOT NULL
+            ) blocked
+            WHERE block_size BETWEEN 2 AND {int(self.max_block_size)}
+            ORDER BY block_key, id
+        """
+
+    def skipped_blocks_query(self, blocking_key: str) -> str:
+        return f"""
+            SELECT COUNT(*) AS blocks FROM (
+                SELECT block_key FROM (
+                    SELECT {BLOCKING_KEYS[blocking_key]} AS block_key
+                    FROM {self.schema}.emr_patient_info
+                ) keyed
+                WHERE block_key IS NOT NULL
+                GROUP BY block_key
+                HAVING COUNT(*) > {int(self.max_block_size)}
+            ) oversized
+        """
+
+    def iter_batches(self, blocking_key: str) -> Iterator[pd.DataFrame]:
+        """Stream candidate rows in batches of about batch_rows that never split a block"""
+        pending: Optional[pd.DataFrame] = None
+        for frame in self.query_executor.iter_frames(self.candidates_query(blocking_key), chunk_size=self.batch_rows):
+            frame = frame if pending is None else pd.concat([pending, frame], ignore_index=True)
+            last_block = frame["block_key"].to_numpy() == frame["block_key"].iloc[-1]
+            pending = frame[last_block]
+            if not last_block.all():
+                yield frame[~last_block].reset_index(drop=True)
+        if pending is not None and not pending.empty:
+            yield pending.reset_index(drop=True)
+
+    def match(self) -> MatchResult:
+        """Score all candidate pairs under every blocking key and cluster the matches"""
+        started = time.time()
+        batches = (batch for key in BLOCKING_KEYS for batch in self.iter_batches(key))
+        if self.workers <= 1:
+            scored = [score_block_batch(batch) for batch in batches]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                scored = list(_bounded_map(pool, score_block_batch, batches, 2 * self.workers))
+
+        pairs = pd.concat(scored, ignore_index=True) if scored else score_block_batch(
+            pd.DataFrame(columns=[*MATCH_COLUMNS, "block_key"])
+        )
+        # A pair found under several keys is kept once, with its best score
+        pairs = (
+            pairs.sort_values("score", ascending=False)
+            .drop_duplicates(["id_a", "id_b"])
+            .sort_values(["id_a", "id_b"], ignore_index=True)
+        )
+        clusters = cluster_pairs(pairs[pairs["score"] >= self.threshold])
+        skipped = {
+            key: self.query_executor.execute(self.skipped_blocks_query(key), fetch="one", workload="analytics")[0]["blocks"]
+            for key in BLOCKING_KEYS
+        }
+        return MatchResult(pairs, clusters, self.threshold, skipped, time.time() - started)
+
+    def cluster_table(self, result: MatchResult) -> pd.DataFrame:
+        """Clustered rows with their identifying fields, one cluster after another, for review"""
+        if result.clusters.empty:
+            return pd.DataFrame(columns=["cluster_id", "cluster_size", *MATCH_COLUMNS])
+        ids = result.clusters["id"].tolist()
+        rows = pd.DataFrame(self.query_executor.execute(
+            f"SELECT {', '.join(MATCH_COLUMNS)} FROM {self.schema}.emr_patient_info WHERE id = ANY(:ids)",
+            {"ids": ids},
+        ), columns=list(MATCH_COLUMNS))
+        table = result.clusters.merge(rows, on="id", how="left")
+        table.insert(1, "cluster_size", table.groupby("cluster_id")["id"].transform("size"))
+        return table.sort_values(["cluster_size", "cluster_id", "id"], ascending=[False, True, True], ignore_index=True)
+
+    def save(self, table: pd.DataFrame, name: str = "patient_match_clusters", schema: str = "emr_ref") -> int:
+        """Replace <schema>.<name> with a cluster table; returns rows written"""
+        try:
+            with self.query_executor.db_manager.engine.begin() as conn:
+                conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+                table.to_sql(name, conn, schema=schema, if_exists="replace", index=False, chunksize=10000)
+            return len(table)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
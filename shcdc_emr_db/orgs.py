@@ -0,0 +1,245 @@
+"""
+Organization dimension.
+One row per org_code found in any emr_back table, with the name most of its records
+use, the other names recorded for it (see check 14 of sql/patient_info.sql) and the
+tables it appears in. The dimension is kept in <dimension_schema>.org_dimension and
+cached in memory, so aggregates can group by the short org_code and names are only
+attached when results are shown.
+"""
+
+import threading
+import time
+from typing import List, Dict, Any, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError
+
+# Result code column -> name column attached by label_orgs
+ORG_NAME_COLUMNS = {"机构代码": "机构名称", "医疗机构代码": "医疗机构名称"}
+
+# Copies PartitionManager keeps of tables it partitioned
+BACKUP_SUFFIX = "_unpartitioned"
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def label_orgs(frame: pd.DataFrame, names: Dict[str, str]) -> pd.DataFrame:
+    """
+    Insert the name column after each org code column of `frame` (see
+    ORG_NAME_COLUMNS) that has none; codes without a name are shown as is.
+    """
+    for code_column, name_column in ORG_NAME_COLUMNS.items():
+        if code_column not in frame.columns or name_column in frame.columns:
+            continue
+        codes = frame[code_column].astype(object)
+        frame = frame.copy()
+        frame.insert(
+            frame.columns.get_loc(code_column) + 1,
+            name_column,
+            codes.map(names).fillna(codes),
+        )
+    return frame
+
+
+class OrgDimension:
+    """Canonical organization codes and names, stored in a small table and cached in memory"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        schema: str = "emr_back",
+        dimension_schema: str = "emr_ref",
+        max_age_seconds: Optional[float] = None
+    ):
+        self.db_manager = db_manager
+        self.schema = schema
+        self.dimension_schema = dimension_schema
+        self.max_age_seconds = max_age_seconds
+        self._orgs: Optional[Dict[str, Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def tables(self) -> List[str]:
+        """Tables of the schema with an org_code column; partitions are covered by their parent"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                result = conn.execute(text("""
+                    SELECT c.relname
+                    FROM pg_class c
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = 'org_code' AND NOT a.attisdropped
+                    WHERE n.nspname = :schema AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+                    ORDER BY c.relname
+                """), {"schema": self.schema})
+                return [table for table, in result if not table.endswith(BACKUP_SUFFIX)]
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def build_query(self, tables: Sequence[str]) -> str:
+        """
+        One statement over `tables` returning org_code, org_name (the most used
+        name), aliases (other names, most used first), tables and records
+        """
+        if not tables:
+            raise ValueError("No tables with an org_code column")
+        seen = "\n                UNION ALL".join(f"""
+                SELECT {_literal(table)} AS table_name, org_code, NULLIF(TRIM(org_name), '') AS org_name,
+                       COUNT(*) AS records
+                FROM {self.schema}.{table}
+                WHERE org_code IS NOT NULL AND org_code <> ''
+                GROUP BY org_code, org_name""" for table in tables)
+        return f"""
+            WITH seen AS ({seen}
+            ), names AS (
+                SELECT org_code, org_name, SUM(records) AS records
+                FROM seen GROUP BY org_code, org_name
+            ), ranked AS (
+                SELECT org_code,
+                       array_agg(org_name ORDER BY records DESC, org_name) FILTER (WHERE org_name IS NOT NULL) AS names,
+                       SUM(records) AS records
+                FROM names GROUP BY org_code
+            )
+            SELECT r.org_code, r.names[1] AS org_name, COALESCE(r.names[2:], '{{}}') AS aliases,
+                   (SELECT array_agg(DISTINCT s.table_name ORDER BY s.table_name)
+                    FROM seen s WHERE s.org_code = r.org_code) AS tables,
+                   r.records
+            FROM ranked r
+        """
+
+    def refresh(self) -> int:
+        """Rebuild the dimension table from all tables and reload the cache; returns organizations"""
+        count = self._build()
+        self.invalidate()
+        return count
+
+    def invalidate(self) -> None:
+        """Drop the in-memory copy; the next lookup reads the table again"""
+        with self._lock:
+            self._orgs = None
+
+    def orgs(self) -> Dict[str, Dict[str, Any]]:
+        """org_code -> {org_name, aliases, tables, records}; the table is built on first use"""
+        orgs = self._orgs
+        if orgs is not None and not self._stale():
+            return orgs
+        with self._lock:
+            if self._orgs is None or self._stale():
+                orgs = self._load()
+                if orgs is None:
+                    self._build()
+                    orgs = self._load() or {}
+                self._orgs, self._loaded_at = orgs, time.monotonic()
+            return self._orgs
+
+    def names(self) -> Dict[str, str]:
+        """org_code -> canonical name (the code itself when no name was ever recorded)"""
+        return {code: org["org_name"] or code for code, org in self.orgs().items()}
+
+    def name(self, org_code: str) -> str:
+        return self.names().get(org_code, org_code)
+
+    def label(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Attach canonical names to the org code columns of a result, see label_orgs"""
+        return label_orgs(frame, self.names())
+
+    def options(self, table: Optional[str] = None) -> pd.DataFrame:
+        """org_code, org_name of the organizations present in `table` (all by default), ordered by code"""
+        table = table.split(".")[-1] if table else None
+        rows = [
+            {"org_code": code, "org_name": org["org_name"] or code}
+            for code, org in sorted(self.orgs().items())
+            if table is None or table in (org["tables"] or ())
+        ]
+        return pd.DataFrame(rows, columns=["org_code", "org_name"])
+
+    def find(self, keyword: str) -> List[str]:
+        """Codes whose code, canonical name or any alias contains `keyword` (case-insensitive)"""
+        keyword = keyword.strip().lower()
+        return [
+            code for code, org in self.orgs().items()
+            if any(keyword in value.lower() for value in (code, org["org_name"] or "", *org["aliases"]))
+        ]
+
+    def conflicts(self) -> pd.DataFrame:
+        """Codes recorded under more than one name, with the canonical name and its aliases"""
+        rows = [
+            {"org_code": code, "org_name": org["org_name"], "aliases": list(org["aliases"]), "records": org["records"]}
+            for code, org in sorted(self.orgs().items())
+            if org["aliases"]
+        ]
+        return pd.DataFrame(rows, columns=["org_code", "org_name", "aliases", "records"])
+
+    def create_indexes(self, tables: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        Index org_code on `tables` (default: all dimension tables) so organization
+        filters are index lookups. Each table is indexed on its own, concurrently
+        where possible (see DatabaseManager.create_index), so writes are not blocked
+        for the whole run. Returns the index names.
+        """
+        indexes = []
+        for table in tables or self.tables():
+            index = f"{table}_org_code_idx"
+            self.db_manager.create_index(f"{self.schema}.{table}", index, ["org_code"])
+            indexes.append(index)
+        return indexes
+
+    def _stale(self) -> bool:
+        return self.max_age_seconds is not None and time.monotonic() - self._loaded_at > self.max_age_seconds
+
+    def _build(self) -> int:
+        query = self.build_query(self.tables())
+        try:
+            with self.db_manager.engine.begin() as conn:
+                self._create_tables(conn)
+                conn.execute(text(f"DELETE FROM {self.dimension_schema}.org_dimension"))
+                result = conn.exec_driver_sql(
+                    f"INSERT INTO {self.dimension_schema}.org_dimension "
+                    f"(org_code, org_name, aliases, tables, records) {query}"
+                )
+                return result.rowcount
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def _load(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """The stored dimension, or None when it was never built"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                exists = conn.execute(
+                    text("SELECT to_regclass(:name) IS NOT NULL"),
+                    {"name": f"{self.dimension_schema}.org_dimension"},
+                ).scalar()
+                if not exists:
+                    return None
+                result = conn.execute(text(
+                    f"SELECT org_code, org_name, aliases, tables, records FROM {self.dimension_schema}.org_dimension"
+                ))
+                orgs = {row.org_code: {
+                    "org_name": row.org_name,
+                    "aliases": list(row.aliases or ()),
+                    "tables": list(row.tables or ()),
+                    "records": row.records,
+                } for row in result}
+                return orgs or None
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        except DatabaseError:
+            raise
+        except Exception as e:
+            raise DatabaseError(f"Unexpected error: {str(e)}")
+
+    def _create_tables(self, conn) -> None:
+        conn.execute(text(f"""
+            CREATE SCHEMA IF NOT EXISTS {self.dimension_schema};
+            CREATE TABLE IF NOT EXISTS {self.dimension_schema}.org_dimension (
+                org_code varchar(50) PRIMARY KEY, org_name varchar(200),
+                aliases text[] NOT NULL DEFAULT '{{}}', tables text[], records bigint,
+                refreshed_at timestamptz DEFAULT now()
+            )
+        """))
@@ -0,0 +1,351 @@
+"""
+Declarative partitioning for the large emr_back tables.
+Migrates a heap table online to LIST (e.g. org_code) or monthly RANGE (e.g.
+operation_time) partitioning, keeps future and newly seen partitions in place, and
+lists partitions so queries filtering on the key can be checked for pruning.
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Dict, Any, Optional, Literal, Tuple
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError
+
+PartitionStrategy = Literal["list", "range"]
+
+_IDENTIFIER_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+_RANGE_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+_INDEX_DEF_RE = re.compile(r"^CREATE (?:UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ ")
+
+
+@dataclass
+class PartitionInfo:
+    """One partition of a partitioned table"""
+
+    name: str
+    bound: str
+    estimated_rows: int
+
+    @property
+    def is_default(self) -> bool:
+        return self.bound == "DEFAULT"
+
+
+def _identifier(name: str) -> str:
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return name
+
+
+def _literal(value: Any) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+class PartitionManager:
+    """Migrates emr_back tables to declarative partitioning and maintains their partitions"""
+
+    def __init__(self, db_manager: DatabaseManager, schema: str = "emr_back"):
+        self.db_manager = db_manager
+        self.schema = _identifier(schema)
+
+    def is_partitioned(self, table: str) -> bool:
+        """Whether `table` is already a partitioned table"""
+        return self.partition_key(table) is not None
+
+    def partition_key(self, table: str) -> Optional[Tuple[PartitionStrategy, str]]:
+        """(strategy, column) of a partitioned table, or None for a plain table"""
+        rows = self._fetch(
+            """
+            SELECT pg_get_partkeydef(c.oid) AS keydef
+            FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = :table
+            """,
+            {"schema": self.schema, "table": table},
+        )
+        if not rows:
+            return None
+        strategy, column = re.match(r"(\w+) \((\w+)\)", rows[0]["keydef"]).groups()
+        return strategy.lower(), column
+
+    def partitions(self, table: str) -> List[PartitionInfo]:
+        """Partitions of `table` with their bounds and estimated row counts"""
+        rows = self._fetch(
+            """
+            SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound,
+                GREATEST(c.reltuples, 0)::bigint AS estimated_rows
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            JOIN pg_namespace n ON n.oid = p.relnamespace
+            WHERE n.nspname = :schema AND p.relname = :table
+            ORDER BY c.relname
+            """,
+            {"schema": self.schema, "table": table},
+        )
+        return [PartitionInfo(**row) for row in rows]
+
+    def migrate(
+        self,
+        table: str,
+        strategy: PartitionStrategy = "range",
+        column: str = "operation_time",
+        key: str = "id",
+        months_ahead: int = 3,
+        batch_pages: int = 10000,
+        lock_timeout_ms: int = 5000,
+        verify: bool = True,
+    ) -> str:
+        """
+        Migrate `table` to a partitioned table while it stays readable and writable.
+
+        A partitioned copy is created with one partition per month (range) or per
+        value (list) plus a DEFAULT partition, and existing rows are copied in short
+        transactions of `batch_pages` heap pages. A trigger logs the `key` of every
+        row written meanwhile; under the exclusive lock taken for the final rename
+        those keys are re-copied from the source, so the copy is exact however the
+        writes interleaved with the backfill. `verify` also compares row counts
+        under that lock, which costs a scan of both tables.
+
+        The original table is kept as `<table>_unpartitioned`, which is returned.
+        Unique indexes become plain indexes, since PostgreSQL requires the partition
+        key in unique constraints on partitioned tables.
+        """
+        table, column, key = _identifier(table), _identifier(column), _identifier(key)
+        if strategy not in ("list", "range"):
+            raise ValueError(f"Unknown partition strategy: {strategy!r}")
+        if self.is_partitioned(table):
+            raise ValueError(f"{self.schema}.{table} is already partitioned")
+
+        columns = self._columns(table)
+        for name in (column, key):
+            if name not in columns:
+                raise ValueError(f"{self.schema}.{table} has no column {name!r}")
+        if self._referencing_constraints(table):
+            raise ValueError(f"{self.schema}.{table} is referenced by foreign keys and cannot be partitioned")
+
+        source = f"{self.schema}.{table}"
+        staging = f"{self.schema}.{table}_partitioned"
+        changes = f"{self.schema}.{table}_partition_changes"
+        try:
+            with self.db_manager.engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE TABLE {staging} (LIKE {source} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                    f"PARTITION BY {strategy.upper()} ({column})"
+                ))
+                for name, bound in self._initial_bounds(conn, table, strategy, column, months_ahead):
+                    conn.exec_driver_sql(f"CREATE TABLE {self.schema}.{name} PARTITION OF {staging} {bound}")
+                conn.execute(text(f"CREATE TABLE {self.schema}.{table}_default PARTITION OF {staging} DEFAULT"))
+                self._copy_indexes(conn, table, key)
+                self._copy_foreign_keys(conn, table)
+                conn.execute(text(f"CREATE UNLOGGED TABLE {changes} AS SELECT {key} FROM {source} WITH NO DATA"))
+                conn.execute(text(f"""
+                    CREATE FUNCTION {changes}() RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                            INSERT INTO {changes} VALUES (OLD.{key});
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                            INSERT INTO {changes} VALUES (NEW.{key});
+                        END IF;
+                        RETURN NULL;
+                    END $$
+                """))
+                conn.execute(text(
+                    f"CREATE TRIGGER {table}_partition_changes AFTER INSERT OR UPDATE OR DELETE "
+                    f"ON {source} FOR EACH ROW EXECUTE FUNCTION {changes}()"
+                ))
+
+            # Backfill page ranges in separate transactions so writers are never blocked for long
+            with self.db_manager.get_connection() as conn:
+                pages = conn.execute(text(
+                    "SELECT pg_relation_size(CAST(:rel AS regclass)) / current_setting('block_size')::int"
+                ), {"rel": source}).scalar()
+            for start in range(0, pages + 1, batch_pages):
+                with self.db_manager.engine.begin() as conn:
+                    conn.execute(text(f"""
+                        INSERT INTO {staging}
+                        SELECT * FROM {source}
+                        WHERE ctid >= CAST(:start AS tid) AND ctid < CAST(:end AS tid)
+                    """), {"start": f"({start},0)", "end": f"({start + batch_pages},0)"})
+
+            with self.db_manager.engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}"))
+                conn.execute(text(f"LOCK TABLE {source} IN ACCESS EXCLUSIVE MODE"))
+                conn.execute(text(f"DELETE FROM {staging} WHERE {key} IN (SELECT {key} FROM {changes})"))
+                conn.execute(text(
+                    f"INSERT INTO {staging} SELECT * FROM {source} WHERE {key} IN (SELECT {key} FROM {changes})"
+                ))
+                if verify:
+                    source_rows = conn.execute(text(f"SELECT count(*) FROM {source}")).scalar()
+                    staging_rows = conn.execute(text(f"SELECT count(*) FROM {staging}")).scalar()
+                    if source_rows != staging_rows:
+                        raise DatabaseError(
+                            f"Row count mismatch after copying {source}: {source_rows} vs {staging_rows}"
+                        )
+                conn.execute(text(f"DROP TRIGGER {table}_partition_changes ON {source}"))
+                conn.execute(text(f"DROP FUNCTION {changes}()"))
+                conn.execute(text(f"DROP TABLE {changes}"))
+                conn.execute(text(f"ALTER TABLE {source} RENAME TO {table}_unpartitioned"))
+                conn.execute(text(f"ALTER TABLE {staging} RENAME TO {table}"))
+            with self.db_manager.engine.begin() as conn:
+                conn.execute(text(f"ANALYZE {source}"))
+            return f"{table}_unpartitioned"
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def maintain(self, table: str, months_ahead: int = 3) -> List[str]:
+        """
+        Create upcoming monthly partitions (range) or partitions for values that have
+        landed in the DEFAULT partition (list), moving any matching default rows.
+        Returns the names of the partitions created.
+        """
+        table = _identifier(table)
+        partition_key = self.partition_key(table)
+        if partition_key is None:
+            raise ValueError(f"{self.schema}.{table} is not partitioned")
+        strategy, column = partition_key
+
+        try:
+            with self.db_manager.engine.begin() as conn:
+                if strategy == "range":
+                    uppers = [
+                        date.fromisoformat(match.group(2)[:10])
+                        for match in (_RANGE_BOUND_RE.search(p.bound) for p in self.partitions(table))
+                        if match
+                    ]
+                    start = max(uppers) if uppers else date.today().replace(day=1)
+                    until = _add_months(date.today().replace(day=1), months_ahead + 1)
+                    bounds = self._month_bounds(table, start, until)
+                else:
+                    values = conn.execute(text(
+                        f"SELECT DISTINCT {column} FROM {self.schema}.{table}_default WHERE {column} IS NOT NULL"
+                    )).scalars().all()
+                    bounds = [self._list_bound(table, value) for value in values]
+
+                for name, bound in bounds:
+                    self._create_partition(conn, table, column, name, bound)
+            return [name for name, _ in bounds]
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def _create_partition(self, conn, table: str, column: str, name: str, bound: str) -> None:
+        """Create a partition, first moving rows it would own out of the DEFAULT partition"""
+        parent = f"{self.schema}.{table}"
+        default = f"{self.schema}.{table}_default"
+        condition = self._bound_condition(column, bound)
+        if not conn.exec_driver_sql(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {condition})").scalar():
+            conn.exec_driver_sql(f"CREATE TABLE {self.schema}.{name} PARTITION OF {parent} {bound}")
+            return
+        conn.exec_driver_sql(f"ALTER TABLE {parent} DETACH PARTITION {default}")
+        conn.exec_driver_sql(f"CREATE TABLE {self.schema}.{name} PARTITION OF {parent} {bound}")
+        conn.exec_driver_sql(f"INSERT INTO {parent} SELECT * FROM {default} WHERE {condition}")
+        conn.exec_driver_sql(f"DELETE FROM {default} WHERE {condition}")
+        conn.exec_driver_sql(f"ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT")
+
+    @staticmethod
+    def _bound_condition(column: str, bound: str) -> str:
+        match = _RANGE_BOUND_RE.search(bound)
+        if match:
+            return f"{column} >= {_literal(match.group(1))} AND {column} < {_literal(match.group(2))}"
+        return f"{column} IN {bound[len('FOR VALUES IN '):]}"
+
+    def _initial_bounds(
+        self, conn, table: str, strategy: PartitionStrategy, column: str, months_ahead: int
+    ) -> List[Tuple[str, str]]:
+        source = f"{self.schema}.{table}"
+        if strategy == "list":
+            values = conn.execute(text(
+                f"SELECT DISTINCT {column} FROM {source} WHERE {column} IS NOT NULL"
+            )).scalars().all()
+            return [self._list_bound(table, value) for value in values]
+
+        low, high = conn.execute(text(f"SELECT min({column})::date, max({column})::date FROM {source}")).one()
+        this_month = date.today().replace(day=1)
+        start = (low or this_month).replace(day=1)
+        until = _add_months(max(high or this_month, this_month).replace(day=1), months_ahead + 1)
+        return self._month_bounds(table, start, until)
+
+    @staticmethod
+    def _month_bounds(table: str, start: date, until: date) -> List[Tuple[str, str]]:
+        bounds = []
+        month = start
+        while month < until:
+            following = _add_months(month, 1)
+            bounds.append((
+                f"{table}_p{month:%Y_%m}",
+                f"FOR VALUES FROM ({_literal(month.isoformat())}) TO ({_literal(following.isoformat())})",
+            ))
+            month = following
+        return bounds
+
+    @staticmethod
+    def _list_bound(table: str, value: Any) -> Tuple[str, str]:
+        slug = re.sub(r"[^a-z0-9]+", "_", str(value).lower()).strip("_")
+        digest = hashlib.md5(str(value).encode("utf-8")).hexdigest()[:8]
+        # Keep names unique (different values can share a slug) and within 63 bytes
+        return f"{table[:40]}_{slug[:12]}_{digest}", f"FOR VALUES IN ({_literal(value)})"
+
+    def _copy_indexes(self, conn, table: str, key: str) -> None:
+        """Recreate the source table's indexes, as plain indexes, on the staging table"""
+        definitions = conn.execute(text(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = :schema AND tablename = :table"
+        ), {"schema": self.schema, "table": table}).scalars().all()
+        has_key_index = False
+        for definition in definitions:
+            match = _INDEX_DEF_RE.match(definition)
+            if not match:
+                continue
+            columns = definition[match.end():]
+            has_key_index = has_key_index or re.match(rf"USING \w+ \({key}\b", columns) is not None
+            conn.exec_driver_sql(
+                f"CREATE INDEX {match.group(1)[:55]}_part ON {self.schema}.{table}_partitioned {columns}"
+            )
+        if not has_key_index:
+            conn.execute(text(f"CREATE INDEX {table[:50]}_{key}_part ON {self.schema}.{table}_partitioned ({key})"))
+
+    def _copy_foreign_keys(self, conn, table: str) -> None:
+        """Carry validated outgoing foreign keys over to the staging table"""
+        definitions = conn.execute(text("""
+            SELECT conname, pg_get_constraintdef(oid) AS definition
+            FROM pg_constraint
+            WHERE conrelid = CAST(:rel AS regclass) AND contype = 'f' AND convalidated
+        """), {"rel": f"{self.schema}.{table}"}).all()
+        for name, definition in definitions:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {self.schema}.{table}_partitioned ADD CONSTRAINT {name[:55]}_part {definition}"
+            )
+
+    def _referencing_constraints(self, table: str) -> List[Dict[str, Any]]:
+        return self._fetch(
+            "SELECT conname FROM pg_constraint WHERE confrelid = CAST(:rel AS regclass) AND contype = 'f'",
+            {"rel": f"{self.schema}.{table}"},
+        )
+
+    def _columns(self, table: str) -> List[str]:
+        rows = self._fetch(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema = :schema AND table_name = :table",
+            {"schema": self.schema, "table": table},
+        )
+        if not rows:
+            raise ValueError(f"Table {self.schema}.{table} does not exist")
+        return [row["column_name"] for row in rows]
+
+    def _fetch(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        try:
+            with self.db_manager.get_connection() as conn:
+                return [dict(row._mapping) for row in conn.execute(text(query), params)]
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
@@ -0,0 +1,133 @@
+"""
+Query profiling helpers.
+Parses PostgreSQL `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` output into a plan tree
+with per-node timings, row estimates vs actuals and buffer usage.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+
+
+@dataclass
+class PlanNode:
+    """A single node of an executed query plan"""
+
+    node_type: str
+    relation_name: Optional[str] = None
+    index_name: Optional[str] = None
+    startup_time: float = 0.0
+    total_time: float = 0.0
+    plan_rows: int = 0
+    actual_rows: int = 0
+    loops: int = 1
+    shared_hit_blocks: int = 0
+    shared_read_blocks: int = 0
+    filter: Optional[str] = None
+    rows_removed_by_filter: int = 0
+    children: List["PlanNode"] = field(default_factory=list)
+
+    @property
+    def inclusive_time(self) -> float:
+        """Total time spent in this node and its children, across all loops (ms)"""
+        return self.total_time * self.loops
+
+    @property
+    def exclusive_time(self) -> float:
+        """Time spent in this node alone, across all loops (ms)"""
+        child_time = sum(child.inclusive_time for child in self.children)
+        return max(self.inclusive_time - child_time, 0.0)
+
+    @property
+    def row_estimate_ratio(self) -> Optional[float]:
+        """Ratio of actual to estimated rows per loop, None when nothing was estimated"""
+        if not self.plan_rows:
+            return None
+        return self.actual_rows / self.plan_rows
+
+    @property
+    def is_seq_scan(self) -> bool:
+        return self.node_type in ("Seq Scan", "Parallel Seq Scan")
+
+    def walk(self, depth: int = 0) -> Iterator[Tuple[int, "PlanNode"]]:
+        """Yield (depth, node) pairs in depth-first order"""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+@dataclass
+class QueryProfile:
+    """Result of profiling a query with EXPLAIN ANALYZE"""
+
+    root: PlanNode
+    planning_time: float = 0.0
+    execution_time: float = 0.0
+
+    def nodes(self) -> List[PlanNode]:
+        return [node for _, node in self.root.walk()]
+
+    def seq_scans(self) -> List[PlanNode]:
+        """Sequential scans in the plan, slowest first"""
+        scans = [node for node in self.nodes() if node.is_seq_scan]
+        return sorted(scans, key=lambda node: node.exclusive_time, reverse=True)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Flatten the plan tree into one dict per node, suitable for a DataFrame"""
+        rows = []
+        for depth, node in self.root.walk():
+            rows.append({
+                "depth": depth,
+                "node_type": node.node_type,
+                "relation_name": node.relation_name,
+                "index_name": node.index_name,
+                "exclusive_time_ms": round(node.exclusive_time, 3),
+                "inclusive_time_ms": round(node.inclusive_time, 3),
+                "plan_rows": node.plan_rows,
+                "actual_rows": node.actual_rows,
+                "loops": node.loops,
+                "row_estimate_ratio": node.row_estimate_ratio,
+                "shared_hit_blocks": node.shared_hit_blocks,
+                "shared_read_blocks": node.shared_read_blocks,
+                "filter": node.filter,
+                "rows_removed_by_filter": node.rows_removed_by_filter,
+            })
+        return rows
+
+
+def _parse_plan_node(plan: Dict[str, Any]) -> PlanNode:
+    """Recursively convert one JSON plan node into a PlanNode"""
+    return PlanNode(
+        node_type=str(plan.get("Node Type", "")),
+        relation_name=plan.get("Relation Name"),
+        index_name=plan.get("Index Name"),
+        startup_time=float(plan.get("Actual Startup Time", 0.0)),
+        total_time=float(plan.get("Actual Total Time", 0.0)),
+        plan_rows=int(plan.get("Plan Rows", 0)),
+        actual_rows=int(plan.get("Actual Rows", 0)),
+        loops=int(plan.get("Actual Loops", 1)),
+        shared_hit_blocks=int(plan.get("Shared Hit Blocks", 0)),
+        shared_read_blocks=int(plan.get("Shared Read Blocks", 0)),
+        filter=plan.get("Filter"),
+        rows_removed_by_filter=int(plan.get("Rows Removed by Filter", 0)),
+        children=[_parse_plan_node(child) for child in plan.get("Plans", [])],
+    )
+
+
+def parse_explain_json(explain_output: Union[str, List[Dict[str, Any]], Dict[str, Any]]) -> QueryProfile:
+    """
+    Parse the output of `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`.
+    Accepts the raw JSON text or the already decoded list returned by psycopg2.
+    """
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    if isinstance(explain_output, list):
+        if not explain_output:
+            raise ValueError("Empty EXPLAIN output")
+        explain_output = explain_output[0]
+
+    return QueryProfile(
+        root=_parse_plan_node(explain_output["Plan"]),
+        planning_time=float(explain_output.get("Planning Time", 0.0)),
+        execution_time=float(explain_output.get("Execution Time", 0.0)),
+    )
@@ -0,0 +1,550 @@
+"""
+Dashboard query catalog.
+The SQL behind the quality dashboard, kept in the package so the Streamlit app,
+benchmarks and batch jobs all run exactly the same statements.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SCHEMA = "emr_back"
+
+# Parent/item table pairs checked for linkage, keyed by a short name
+LINKAGE_TABLES: Dict[str, Dict[str, str]] = {
+    "order": {
+        "item_table": "emr_back.emr_order_item",
+        "parent_table": "emr_back.emr_order",
+        "join_field": "order_id",
+    },
+    "ex_lab": {
+        "item_table": "emr_back.emr_ex_lab_item",
+        "parent_table": "emr_back.emr_ex_lab",
+        "join_field": "ex_lab_id",
+    },
+    "ex_clinical": {
+        "item_table": "emr_back.emr_ex_clinical_item",
+        "parent_table": "emr_back.emr_ex_clinical",
+        "join_field": "ex_clinical_id",
+    },
+}
+
+# Dashboard display names of each pair's (items, parents)
+LINKAGE_LABELS: Dict[str, Tuple[str, str]] = {
+    "order": ("医嘱处方项", "医嘱处方"),
+    "ex_lab": ("检验项目", "检验工作单"),
+    "ex_clinical": ("临床检验项目", "临床检验单"),
+}
+
+# ---------- emr_patient_info quality ----------
+
+PATIENT_TOTAL_RECORDS_QUERY = """
+SELECT COUNT(*) AS 总记录数 FROM emr_back.emr_patient_info;
+"""
+
+PATIENT_MANDATORY_FIELDS_QUERY = """
+SELECT
+    SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) AS id空值数,
+    SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) AS 患者姓名空值数,
+    SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) AS 身份证件类别代码空值数,
+    SUM(CASE WHEN id_card_type_name IS NULL OR TRIM(id_card_type_name) = '' THEN 1 ELSE 0 END) AS 身份证件类别名称空值数,
+    SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) AS 身份证件号码空值数,
+    SUM(CASE WHEN org_code IS NULL OR TRIM(org_code) = '' THEN 1 ELSE 0 END) AS 医疗机构代码空值数,
+    SUM(CASE WHEN org_name IS NULL OR TRIM(org_name) = '' THEN 1 ELSE 0 END) AS 医疗机构名称空值数,
+    SUM(CASE WHEN operation_time IS NULL THEN 1 ELSE 0 END) AS 操作时间空值数
+FROM emr_back.emr_patient_info;
+"""
+
+PATIENT_SUGGESTED_FIELDS_QUERY = """
+SELECT
+    SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) AS 性别代码空值数,
+    SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) AS 出生日期空值数,
+    SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) AS 患者电话空值数,
+    SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) AS 婚姻状况代码空值数,
+    SUM(CASE WHEN current_addr_detail IS NULL OR TRIM(current_addr_detail) = '' THEN 1 ELSE 0 END) AS 现住详细地址空值数
+FROM emr_back.emr_patient_info;
+"""
+
+# Per-organization aggregates group by org_code; OrgDimension.label attaches the names
+PATIENT_MANDATORY_BY_ORG_QUERY = """
+SELECT
+    org_code AS 医疗机构代码,
+    COUNT(*) AS 记录总数,
+
+    -- 必填字段缺失统计
+    SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) AS ID缺失数,
+    ROUND(100.0 * SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS ID缺失率,
+    SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) AS 患者姓名缺失数,
+    ROUND(100.0 * SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 患者姓名缺失率,
+    SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) AS 证件类型代码缺失数,
+    ROUND(100.0 * SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 证件类型代码缺失率,
+    SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) AS 证件号码缺失数,
+    ROUND(100.0 * SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 证件号码缺失率,
+
+    -- 综合质量评分（必填字段填写完整率）
+    ROUND(100.0 - (
+        100.0 * (
+            SUM(CASE WHEN id IS NULL OR TRIM(id) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN patient_name IS NULL OR TRIM(patient_name) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN id_card_type_code IS NULL OR TRIM(id_card_type_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN id_card_type_name IS NULL OR TRIM(id_card_type_name) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN id_card IS NULL OR TRIM(id_card) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN org_code IS NULL OR TRIM(org_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN operation_time IS NULL THEN 1 ELSE 0 END)
+        ) / (COUNT(*) * 7)
+    ), 2) AS 必填字段完整率
+FROM
+    emr_back.emr_patient_info
+GROUP BY
+    org_code
+ORDER BY
+    必填字段完整率 DESC, 记录总数 DESC;
+"""
+
+PATIENT_SUGGESTED_BY_ORG_QUERY = """
+SELECT
+    org_code AS 医疗机构代码,
+    COUNT(*) AS 记录总数,
+
+    -- 核心建议填写字段统计
+    SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) AS 性别代码缺失数,
+    ROUND(100.0 * SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 性别代码缺失率,
+
+    SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) AS 出生日期缺失数,
+    ROUND(100.0 * SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) / COUNT(*), 2) AS 出生日期缺失率,
+
+    SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) AS 电话号码缺失数,
+    ROUND(100.0 * SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 电话号码缺失率,
+
+    SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) AS 婚姻状况缺失数,
+    ROUND(100.0 * SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) / COUNT(*), 2) AS 婚姻状况缺失率,
+
+    -- 建议填写字段综合完整率（选取10个重要的建议字段）
+    ROUND(100.0 - (
+        100.0 * (
+            SUM(CASE WHEN gender_code IS NULL OR TRIM(gender_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN birth_date IS NULL THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN nation_code IS NULL OR TRIM(nation_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN current_addr_code IS NULL OR TRIM(current_addr_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN current_addr_detail IS NULL OR TRIM(current_addr_detail) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN marital_status_code IS NULL OR TRIM(marital_status_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN education_code IS NULL OR TRIM(education_code) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN tel IS NULL OR TRIM(tel) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN contacts IS NULL OR TRIM(contacts) = '' THEN 1 ELSE 0 END) +
+            SUM(CASE WHEN contacts_tel IS NULL OR TRIM(contacts_tel) = '' THEN 1 ELSE 0 END)
+        ) / (COUNT(*) * 10)
+    ), 2) AS 建议字段完整率
+FROM
+    emr_back.emr_patient_info
+GROUP BY
+    org_code
+ORDER BY
+    建议字段完整率 DESC, 记录总数 DESC;
+"""
+
+# ---------- parent/item linkage ----------
+
+# Select lists for orphaned items (items whose parent row is missing)
+ORPHANED_ITEM_COLUMNS: Dict[str, str] = {
+    "order": """
+    i.id AS 项目ID,
+    i.order_id AS 医嘱处方ID,
+    i.drug_code AS 药品代码,
+    i.drug_name AS 药品名称,
+    i.drug_specifications AS 药品规格,
+    i.drug_dosage_code AS 剂量代码,
+    i.drug_dosage_unit_code AS 剂量单位代码,
+    i.drug_dosage_unit_name AS 剂量单位名称,
+    i.drug_dosage_total AS 总剂量,
+    i.tcm_prescription AS 中药处方,
+    i.tcm_number AS 中药编号,
+    i.tcm_decoction_method AS 中药煎煮方法,
+    i.tcm_use_method AS 中药使用方法,
+    i.operator_id AS 操作员ID,
+    i.operation_time AS 操作时间,
+    i.invalid_flag AS 无效标志,
+    i.data_status AS 数据状态,
+    i.create_date AS 创建日期""",
+    "ex_lab": """
+    i.id AS 项目ID,
+    i.ex_lab_id AS 检验工作单ID,
+    i.lab_item_code AS 检验项目代码,
+    i.lab_item_name AS 检验项目名称,
+    i.item_result AS 检验结果,
+    i.item_unit AS 结果单位,
+    i.item_result_flag AS 结果标志,
+    i.reference_range AS 参考范围,
+    i.critical_value_flag AS 危急值标志,
+    i.operator_id AS 操作员ID,
+    i.operation_time AS 操作时间,
+    i.invalid_flag AS 无效标志,
+    i.data_status AS 数据状态,
+    i.create_date AS 创建日期""",
+    "ex_clinical": """
+    i.id AS 项目ID,
+    i.ex_clinical_id AS 临床检验单ID,
+    i.clinical_item_code AS 检验项目代码,
+    i.clinical_item_name AS 临床检验项目名称,
+    i.item_result AS 检验结果值,
+    i.item_unit AS 检验单位,
+    i.item_method AS 检验方法,
+    i.item_device AS 检验设备,
+    i.item_result_flag AS 结果标志,
+    i.operator_id AS 操作员ID,
+    i.operation_time AS 操作时间,
+    i.invalid_flag AS 无效标志,
+    i.data_status AS 数据状态,
+    i.create_date AS 创建日期""",
+}
+
+# Select lists for parents that have no items
+MISSING_ITEM_PARENT_COLUMNS: Dict[str, str] = {
+    "order": """
+    p.id AS 医嘱处方ID,
+    p.patient_id AS 患者ID,
+    p.patient_name AS 患者姓名,
+    p.activity_type_name AS 活动类型,
+    p.prescription_no AS 处方号,
+    p.prescription_type_code AS 处方类型,
+    p.prescription_issuance_date AS 处方开具日期,
+    p.org_code AS 机构代码,
+    p.org_name AS 机构名称,
+    p.dept_name AS 科室名称,
+    p.create_date AS 创建日期""",
+    "ex_lab": """
+    p.id AS 检验工作单ID,
+    p.patient_id AS 患者ID,
+    p.patient_name AS 患者姓名,
+    p.apply_dept_name AS 申请科室,
+    p.sample_type_name AS 标本类型,
+    p.lab_apply_no AS 检验申请单号,
+    p.apply_time AS 申请时间,
+    p.report_time AS 报告时间,
+    p.org_code AS 机构代码,
+    p.org_name AS 机构名称,
+    p.create_date AS 创建日期""",
+    "ex_clinical": """
+    p.id AS 临床检验单ID,
+    p.patient_id AS 患者ID,
+    p.patient_name AS 患者姓名,
+    p.clinical_type_name AS 检验类型,
+    p.application_date AS 申请日期,
+    p.clinical_apply_no AS 检验申请单号,
+    p.apply_dept_name AS 申请科室,
+    p.result_date AS 结果日期,
+    p.org_code AS 机构代码,
+    p.org_name AS 机构名称,
+    p.create_date AS 创建日期""",
+}
+
+# Select lists for the default custom query shown in the SQL editor
+DEFAULT_CUSTOM_COLUMNS: Dict[str, str] = {
+    "order": """
+    i.id AS 项目ID,
+    i.order_id AS 医嘱处方ID,
+    i.drug_name AS 药品名称,
+    p.patient_name AS 患者姓名,
+    p.org_name AS 机构名称""",
+    "ex_lab": """
+    i.id AS 项目ID,
+    i.ex_lab_id AS 医嘱处方ID,
+    i.lab_item_name AS 检验项目名称,
+    p.patient_name AS 患者姓名,
+    p.org_name AS 机构名称""",
+    "ex_clinical": """
+    i.id AS 项目ID,
+    i.ex_clinical_id AS 临床检验单ID,
+    i.clinical_item_name AS 临床检验项目名称,
+    p.patient_name AS 患者姓名,
+    p.org_name AS 机构名称""",
+}
+
+
+@dataclass(frozen=True)
+class QueryScope:
+    """
+    Organization and time filters pushed down into the linkage queries, so tables
+    partitioned by org_code or operation_time only scan the matching partitions.
+    Organizations filter parent rows; the time window (since inclusive, until
+    exclusive) filters items by operation_time. With `bind` the conditions use the
+    :org_codes, :since and :until parameters of params() instead of literals, so the
+    SQL only depends on which filters are set.
+    """
+
+    org_codes: Tuple[str, ...] = ()
+    since: Optional[date] = None
+    until: Optional[date] = None
+    bind: bool = False
+
+    def parent_conditions(self, alias: str = "p") -> List[str]:
+        if not self.org_codes:
+            return []
+        if self.bind:
+            return [f"{alias}.org_code = ANY(:org_codes)"]
+        return [f"{alias}.org_code IN ({', '.join(_literal(code) for code in self.org_codes)})"]
+
+    def item_conditions(self, alias: str = "i") -> List[str]:
+        conditions = []
+        if self.since is not None:
+            since = ":since" if self.bind else _literal(self.since.isoformat())
+            conditions.append(f"{alias}.operation_time >= {since}")
+        if self.until is not None:
+            until = ":until" if self.bind else _literal(self.until.isoformat())
+            conditions.append(f"{alias}.operation_time < {until}")
+        return conditions
+
+    def params(self) -> Dict[str, object]:
+        """Values of the filters that are set, for the binds of a `bind` scope"""
+        params: Dict[str, object] = {}
+        if self.org_codes:
+            params["org_codes"] = list(self.org_codes)
+        if self.since is not None:
+            params["since"] = self.since
+        if self.until is not None:
+            params["until"] = self.until
+        return params
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _where(conditions: Sequence[str]) -> str:
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _join_on(tables: Dict[str, str], conditions: Sequence[str]) -> str:
+    return " AND ".join([f"p.id = i.{tables['join_field']}", *conditions])
+
+
+def linkage_overview_labels(item_label: str, parent_label: str) -> Dict[str, str]:
+    """Display names of the overview metrics, by linkage_overview_queries key"""
+    return {
+        "total_items": f"{item_label}总数",
+        "parent_with_items": f"有{item_label}的{parent_label}",
+        "parent_without_items": f"无{item_label}的{parent_label}",
+        "valid_items": f"有效{item_label}",
+        "orphaned_items": f"孤立{item_label}",
+    }
+
+
+def linkage_overview_queries(
+    linkage: str,
+    item_label: str,
+    parent_label: str,
+    scope: Optional[QueryScope] = None
+) -> Dict[str, str]:
+    """
+    Overview counts for one parent/item pair, each returning a ("Metric", "Count") row.
+    `item_label` and `parent_label` are the display names used in the metric labels.
+    """
+    tables = LINKAGE_TABLES[linkage]
+    item_table, parent_table, join_field = tables["item_table"], tables["parent_table"], tables["join_field"]
+    scope = scope or QueryScope()
+    items, parents = scope.item_conditions(), scope.parent_conditions()
+    if parents:
+        # Within an organization filter only items of matching parents are counted
+        items_of_parents = [f"i.{join_field} IN (SELECT p.id FROM {parent_table} p {_where(parents)})"]
+    else:
+        items_of_parents = []
+    labels = {key: _literal(label) for key, label in linkage_overview_labels(item_label, parent_label).items()}
+    return {
+        "total_items": f"""
+        SELECT {labels["total_items"]} as "Metric", COUNT(*) as "Count"
+        FROM {item_table} i
+        {_where(items + items_of_parents)}
+        """,
+        "parent_with_items": f"""
+        SELECT {labels["parent_with_items"]} as "Metric", COUNT(*) as "Count"
+        FROM {parent_table} p
+        INNER JOIN {item_table} i ON p.id = i.{join_field}
+        {_where(items + parents)}
+        """,
+        "parent_without_items": f"""
+        SELECT {labels["parent_without_items"]} as "Metric", COUNT(*) as "Count"
+        FROM {parent_table} p
+        LEFT JOIN {item_table} i ON {_join_on(tables, items)}
+        {_where(["i.id IS NULL"] + parents)}
+        """,
+        "valid_items": f"""
+        SELECT {labels["valid_items"]} as "Metric", COUNT(*) as "Count"
+        FROM {item_table} i
+        INNER JOIN {parent_table} p ON i.{join_field} = p.id
+        {_where(items + parents)}
+        """,
+        "orphaned_items": f"""
+        SELECT {labels["orphaned_items"]} as "Metric", COUNT(*) as "Count"
+        FROM {item_table} i
+        LEFT JOIN {parent_table} p ON i.{join_field} = p.id
+        {_where(["p.id IS NULL"] + items)}
+        """,
+    }
+
+
+def orphaned_items_query(linkage: str, limit: int = 1000, scope: Optional[QueryScope] = None) -> str:
+    """Items whose parent row does not exist; orphans have no organization, so only the time window applies"""
+    tables = LINKAGE_TABLES[linkage]
+    items = (scope or QueryScope()).item_conditions()
+    return f"""
+    SELECT {ORPHANED_ITEM_COLUMNS[linkage]}
+    FROM {tables["item_table"]} i
+    LEFT JOIN {tables["parent_table"]} p ON i.{tables["join_field"]} = p.id
+    {_where(["p.id IS NULL"] + items)}
+    LIMIT {int(limit)}
+    """
+
+
+def missing_items_query(linkage: str, limit: int = 1000, scope: Optional[QueryScope] = None) -> str:
+    """Parent rows that have no items"""
+    tables = LINKAGE_TABLES[linkage]
+    scope = scope or QueryScope()
+    return f"""
+    SELECT {MISSING_ITEM_PARENT_COLUMNS[linkage]}
+    FROM {tables["parent_table"]} p
+    LEFT JOIN {tables["item_table"]} i ON {_join_on(tables, scope.item_conditions())}
+    {_where(["i.id IS NULL"] + scope.parent_conditions())}
+    LIMIT {int(limit)}
+    """
+
+
+def missing_by_org_query(linkage: str, scope: Optional[QueryScope] = None) -> str:
+    """Number of parent rows without items, per organization code"""
+    tables = LINKAGE_TABLES[linkage]
+    scope = scope or QueryScope()
+    return f"""
+    SELECT p.org_code as "机构代码", COUNT(*) as "缺失数量"
+    FROM {tables["parent_table"]} p
+    LEFT JOIN {tables["item_table"]} i ON {_join_on(tables, scope.item_conditions())}
+    {_where(["i.id IS NULL"] + scope.parent_conditions())}
+    GROUP BY p.org_code
+    ORDER BY "缺失数量" DESC
+    """
+
+
+# Per-organization drill-downs take the org code as $1 and the row limit as $2,
+# so they can be PREPAREd once per connection and executed for any organization
+
+def org_missing_items_query(linkage: str) -> str:
+    """Parent rows of organization $1 that have no items"""
+    tables = LINKAGE_TABLES[linkage]
+    return f"""
+    SELECT {MISSING_ITEM_PARENT_COLUMNS[linkage]}
+    FROM {tables["parent_table"]} p
+    LEFT JOIN {tables["item_table"]} i ON p.id = i.{tables["join_field"]}
+    WHERE i.id IS NULL AND p.org_code = $1
+    LIMIT $2
+    """
+
+
+def org_missing_patients_query(linkage: str) -> str:
+    """Parent rows of organization $1 whose patient is missing from emr_patient_info"""
+    tables = LINKAGE_TABLES[linkage]
+    return f"""
+    SELECT {MISSING_ITEM_PARENT_COLUMNS[linkage]}
+    FROM {tables["parent_table"]} p
+    LEFT JOIN {SCHEMA}.emr_patient_info pi ON p.patient_id = pi.id
+    WHERE pi.id IS NULL AND p.org_code = $1
+    LIMIT $2
+    """
+
+
+def default_custom_query(linkage: str, limit: int = 100, scope: Optional[QueryScope] = None) -> str:
+    """Starting query for the custom SQL editor"""
+    tables = LINKAGE_TABLES[linkage]
+    scope = scope or QueryScope()
+    return f"""
+    SELECT {DEFAULT_CUSTOM_COLUMNS[linkage]}
+    FROM {tables["item_table"]} i
+    JOIN {tables["parent_table"]} p ON i.{tables["join_field"]} = p.id
+    {_where(scope.item_conditions() + scope.parent_conditions())}
+    LIMIT {int(limit)}
+    """
+
+# ---------- patient timeline ----------
+
+# Event sources for the patient timeline: table, event time column and payload columns
+TIMELINE_EVENTS: Dict[str, Dict[str, object]] = {
+    "outpatient": {
+        "table": "emr_back.emr_outpatient_record",
+        "time_column": "visit_time",
+        "payload": ["dept_name", "clinic_diagnosis", "chief_complaint", "present_illness", "physical_examination"],
+    },
+    "admission": {
+        "table": "emr_back.emr_admission_record",
+        "time_column": "admission_time",
+        "payload": ["dept_name", "chief_complaint", "present_illness"],
+    },
+    "daily_course": {
+        "table": "emr_back.emr_daily_course",
+        "time_column": "record_time",
+        "payload": ["course_record"],
+    },
+    "discharge": {
+        "table": "emr_back.emr_discharge_info",
+        "time_column": "discharge_time",
+        "payload": ["admission_time", "discharge_diagnosis"],
+    },
+    "order": {
+        "table": "emr_back.emr_order",
+        "time_column": "prescription_issuance_date",
+        "payload": ["activity_type_name", "prescription_no", "prescription_type_code", "dept_name"],
+    },
+    "lab": {
+        "table": "emr_back.emr_ex_lab",
+        "time_column": "apply_time",
+        "payload": ["apply_dept_name", "sample_type_name", "lab_apply_no", "report_time"],
+    },
+    "clinical": {
+        "table": "emr_back.emr_ex_clinical",
+        "time_column": "application_date",
+        "payload": ["clinical_type_name", "clinical_apply_no", "apply_dept_name", "result_date"],
+    },
+    "vital_signs": {
+        "table": "emr_back.emr_vital_signs_record",
+        "time_column": "measure_time",
+        "payload": ["vital_signs_item_code", "vital_signs_item_name", "vital_signs_value"],
+    },
+    "death": {
+        "table": "emr_back.emr_death_info",
+        "time_column": "death_time",
+        "payload": ["death_reason"],
+    },
+}
+
+
+def patient_timeline_query(event_types: Optional[Sequence[str]] = None) -> str:
+    """
+    All events for the patients in :patient_ids as one UNION ALL, ordered by patient
+    and event time. Each branch keeps its own columns in a jsonb payload, so numbers
+    and timestamps stay typed while every branch shares one row shape.
+    """
+    branches: List[str] = []
+    for event_type in event_types or TIMELINE_EVENTS:
+        source = TIMELINE_EVENTS[event_type]
+        payload = ", ".join(f"'{column}', {column}" for column in source["payload"])
+        branches.append(f"""
+        SELECT patient_id, {source["time_column"]} AS event_time, '{event_type}' AS event_type,
+            id AS event_id, org_code, org_name, jsonb_build_object({payload}) AS payload
+        FROM {source["table"]}
+        WHERE patient_id = ANY(:patient_ids)""")
+    return "\n        UNION ALL".join(branches) + """
+        ORDER BY patient_id, event_time NULLS LAST, event_type, event_id
+        """
+
+
+def dashboard_query_catalog() -> Dict[str, str]:
+    """Every query the dashboard runs, by a stable name, for benchmarking and batch runs"""
+    catalog = {
+        "patient_info.total_records": PATIENT_TOTAL_RECORDS_QUERY,
+        "patient_info.mandatory_fields": PATIENT_MANDATORY_FIELDS_QUERY,
+        "patient_info.suggested_fields": PATIENT_SUGGESTED_FIELDS_QUERY,
+        "patient_info.mandatory_by_org": PATIENT_MANDATORY_BY_ORG_QUERY,
+        "patient_info.suggested_by_org": PATIENT_SUGGESTED_BY_ORG_QUERY,
+    }
+    for linkage in LINKAGE_TABLES:
+        for name, query in linkage_overview_queries(linkage, linkage, linkage).items():
+            catalog[f"{linkage}.overview.{name}"] = query
+        catalog[f"{linkage}.orphaned_items"] = orphaned_items_query(linkage)
+        catalog[f"{linkage}.missing_items"] = missing_items_query(linkage)
+        catalog[f"{linkage}.missing_by_org"] = missing_by_org_query(linkage)
+    return catalog
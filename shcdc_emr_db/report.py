@@ -0,0 +1,151 @@
+"""
+Headless quality report.
+Runs the dashboard query catalog (patient completeness, every linkage overview and
+the per-org missing counts) outside Streamlit, several queries at a time, and
+writes each result table to Parquet or JSON next to a manifest, so batch jobs
+produce the dashboard numbers once.
+"""
+
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import List, Dict, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, ConfigError, QueryError
+from .orgs import OrgDimension, label_orgs
+from .queries import dashboard_query_catalog
+from .snapshot import SnapshotExecutor
+
+REPORT_FORMATS = ("parquet", "json")
+MANIFEST_FILE = "manifest.json"
+
+
+@dataclass
+class ReportEntry:
+    """Outcome of one catalog query"""
+
+    name: str
+    rows: int = 0
+    seconds: float = 0.0
+    path: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ReportResult:
+    """All entries of a report run and where they were written"""
+
+    output_dir: str
+    format: str
+    generated_at: str
+    elapsed: float = 0.0
+    entries: List[ReportEntry] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[ReportEntry]:
+        return [entry for entry in self.entries if entry.error]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class QualityReport:
+    """Runs catalog queries on a thread pool and writes their results to files"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        workers: int = 4,
+        queries: Optional[Dict[str, str]] = None,
+        snapshot: Optional[SnapshotExecutor] = None,
+        orgs: Optional[OrgDimension] = None
+    ):
+        self.db_manager = db_manager
+        self.workers = workers
+        # Run the catalog on a local Parquet snapshot instead of the database
+        self.snapshot = snapshot
+        # Names attached to the org codes of per-organization results
+        self.orgs = orgs
+        self.queries = queries if queries is not None else dashboard_query_catalog()
+
+    def select(self, patterns: Sequence[str] = ()) -> Dict[str, str]:
+        """Catalog queries whose names match any of the glob `patterns` (all if none)"""
+        if not patterns:
+            return dict(self.queries)
+        return {
+            name: query for name, query in self.queries.items()
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+        }
+
+    def run_query(self, query: str) -> pd.DataFrame:
+        if self.snapshot is not None:
+            return self.snapshot.frame(query)
+        try:
+            with self.db_manager.get_connection("analytics") as conn:
+                return pd.read_sql_query(text(query), conn)
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def run(self, output_dir: str, fmt: str = "parquet", patterns: Sequence[str] = ()) -> ReportResult:
+        """
+        Run the selected queries and write one `<name>.<fmt>` file per result plus
+        manifest.json. A failing query is recorded in its entry and does not stop
+        the others.
+        """
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format {fmt!r}; expected one of {', '.join(REPORT_FORMATS)}")
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ConfigError("Parquet output needs pyarrow: pip install 'shcdc-emr-db[parquet]' or use json")
+        queries = self.select(patterns)
+        # Create the engine or DuckDB connection (and surface config errors) once, not racing in the workers
+        if self.snapshot is not None:
+            self.snapshot.connection
+        else:
+            self.db_manager.engine
+        names = self.orgs.names() if self.orgs is not None else None
+        os.makedirs(output_dir, exist_ok=True)
+        report = ReportResult(output_dir, fmt, datetime.now().isoformat(timespec="seconds"))
+        started = time.time()
+
+        def timed(query: str):
+            query_started = time.time()
+            return self.run_query(query), time.time() - query_started
+
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            futures = {pool.submit(timed, query): name for name, query in queries.items()}
+            for future in as_completed(futures):
+                entry = ReportEntry(futures[future])
+                try:
+                    frame, entry.seconds = future.result()
+                    if names is not None:
+                        frame = label_orgs(frame, names)
+                    entry.rows = len(frame)
+                    entry.path = self._write(frame, output_dir, entry.name, fmt)
+                except (QueryError, OSError, ValueError) as e:
+                    entry.error = str(e)
+                report.entries.append(entry)
+
+        report.entries.sort(key=lambda entry: list(queries).index(entry.name))
+        report.elapsed = time.time() - started
+        with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+        return report
+
+    @staticmethod
+    def _write(frame: pd.DataFrame, output_dir: str, name: str, fmt: str) -> str:
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_json(path, orient="records", force_ascii=False, date_format="iso", indent=2)
+        return path
@@ -0,0 +1,259 @@
+"""
+Narrative full-text search.
+Finds outpatient visits by the text of their clinical narrative (chief complaint,
+present illness, diagnosis, physical examination). A GIN index over the character
+bigrams of these fields narrows candidates to rows containing every bigram of the
+search terms; an exact substring check then confirms each term. Bigrams need no
+word segmentation and no extension, so Chinese text is indexed in any locale, and
+PostgreSQL maintains the expression index on every insert and update.
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List, Dict, Any, Optional, Sequence
+
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, DatabaseError, QueryError, Workload
+
+# Searchable fields and their weight in the rank: a term found in the chief
+# complaint counts more than one found in the physical examination
+NARRATIVE_FIELDS: Dict[str, int] = {
+    "chief_complaint": 4,
+    "clinic_diagnosis": 3,
+    "present_illness": 2,
+    "physical_examination": 1,
+}
+
+RESULT_COLUMNS = ("id", "patient_id", "patient_name", "org_code", "org_name", "dept_name", "visit_time")
+
+# Lower-cased character bigrams of all arguments, each bigram once. Single
+# characters have none, so a term of one character is only found by the recheck.
+_BIGRAMS_FUNCTION = """
+CREATE OR REPLACE FUNCTION {schema}.text_bigrams(VARIADIC fields text[]) RETURNS text[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT COALESCE(array_agg(DISTINCT substr(lower(f), i, 2)), '{{}}')
+    FROM unnest(fields) AS f, generate_series(1, char_length(f) - 1) AS i
+$$
+"""
+
+
+@dataclass
+class SearchPage:
+    """One page of ranked search results and the total number of matching visits"""
+
+    terms: List[str]
+    page: int
+    page_size: int
+    total: int = 0
+    # The search stopped at max_hits matches: total is a lower bound
+    truncated: bool = False
+    elapsed: float = 0.0
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.total // self.page_size))
+
+
+def search_terms(query: str) -> List[str]:
+    """Whitespace-separated, lower-cased terms of a search, each once"""
+    return list(dict.fromkeys(term.lower() for term in query.split()))
+
+
+class NarrativeSearch:
+    """Ranked, paginated search over the narrative fields of a table, backed by a bigram GIN index"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        schema: str = "emr_back",
+        table: str = "emr_outpatient_record",
+        fields: Optional[Dict[str, int]] = None,
+        function_schema: str = "emr_ref",
+        workload: Workload = "analytics"
+    ):
+        self.db_manager = db_manager
+        self.schema = schema
+        self.table = table
+        self.fields = fields or NARRATIVE_FIELDS
+        self.function_schema = function_schema
+        self.workload = workload
+
+    @property
+    def index_name(self) -> str:
+        return f"{self.table}_narrative_idx"
+
+    def index_expression(self, alias: Optional[str] = None) -> str:
+        """The indexed expression; queries must repeat it exactly for the planner to use the index"""
+        prefix = f"{alias}." if alias else ""
+        columns = ", ".join(f"{prefix}{column}" for column in self.fields)
+        return f"{self.function_schema}.text_bigrams({columns})"
+
+    def installed(self) -> bool:
+        """Whether the index exists and is valid (an interrupted concurrent build leaves it invalid)"""
+        try:
+            with self.db_manager.get_connection() as conn:
+                return bool(conn.execute(text("""
+                    SELECT i.indisvalid FROM pg_index i
+                    WHERE i.indexrelid = to_regclass(:index)
+                """), {"index": f"{self.schema}.{self.index_name}"}).scalar())
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def install(self) -> None:
+        """
+        Create the bigram function and build the GIN index without blocking writes
+        (CREATE INDEX CONCURRENTLY). A partitioned table is indexed in one
+        statement, which PostgreSQL cascades to every partition.
+        """
+        try:
+            with self.db_manager.engine.connect() as conn:
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {self.function_schema}")
+                conn.exec_driver_sql(_BIGRAMS_FUNCTION.format(schema=self.function_schema))
+                partitioned = conn.execute(
+                    text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+                    {"table": f"{self.schema}.{self.table}"},
+                ).scalar()
+                if not self.installed():
+                    conn.exec_driver_sql(f"DROP INDEX IF EXISTS {self.schema}.{self.index_name}")
+                concurrently = "" if partitioned else "CONCURRENTLY "
+                conn.exec_driver_sql(
+                    f"CREATE INDEX {concurrently}IF NOT EXISTS {self.index_name} "
+                    f"ON {self.schema}.{self.table} USING gin ({self.index_expression()})"
+                )
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def uninstall(self) -> None:
+        try:
+            with self.db_manager.engine.begin() as conn:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {self.schema}.{self.index_name}")
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def maintain(self) -> int:
+        """
+        Merge the index's pending list into the main GIN structure. New rows are
+        queued there on write (fastupdate) and every search rechecks the queue, so
+        run this after bulk loads; autovacuum does the same over time. Returns
+        the pending pages merged.
+        """
+        try:
+            with self.db_manager.engine.begin() as conn:
+                return int(conn.execute(
+                    text("SELECT gin_clean_pending_list(to_regclass(:index))"),
+                    {"index": f"{self.schema}.{self.index_name}"},
+                ).scalar() or 0)
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def search_query(
+        self,
+        terms: Sequence[str],
+        org_codes: Sequence[str] = (),
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        max_hits: Optional[int] = None
+    ) -> str:
+        """
+        Statement returning the total of matching rows and one page of them, ranked
+        by the weighted number of term occurrences, then by visit_time. Binds
+        :terms, :limit, :offset and :org_codes / :since / :until / :max_hits when given.
+        """
+        if not terms:
+            raise ValueError("Search needs at least one term")
+        conditions = [
+            f"{self.index_expression('r')} @> {self.function_schema}.text_bigrams(VARIADIC CAST(:terms AS text[]))"
+        ]
+        occurrences = []
+        for position in range(len(terms)):
+            term = f"(CAST(:terms AS text[]))[{position + 1}]"
+            conditions.append("(" + " OR ".join(
+                f"strpos(lower(r.{column}), {term}) > 0" for column in self.fields
+            ) + ")")
+            occurrences.extend(
+                f"{weight} * (char_length(COALESCE(r.{column}, '')) - "
+                f"char_length(replace(lower(COALESCE(r.{column}, '')), {term}, ''))) / char_length({term})"
+                for column, weight in self.fields.items()
+            )
+        if org_codes:
+            conditions.append("r.org_code = ANY(:org_codes)")
+        if since is not None:
+            conditions.append("r.visit_time >= :since")
+        if until is not None:
+            conditions.append("r.visit_time < :until")
+        columns = ", ".join(f"r.{column}" for column in (*RESULT_COLUMNS, *self.fields))
+        where = "\n              AND ".join(conditions)
+        return f"""
+            WITH hits AS (
+                SELECT {columns}, {" + ".join(occurrences)} AS rank
+                FROM {self.schema}.{self.table} r
+                WHERE {where}{" LIMIT :max_hits" if max_hits is not None else ""}
+            )
+            SELECT t.total, p.*
+            FROM (SELECT COUNT(*) AS total FROM hits) t
+            LEFT JOIN LATERAL (
+                SELECT * FROM hits
+                ORDER BY rank DESC, visit_time DESC NULLS LAST, id
+                LIMIT :limit OFFSET :offset
+            ) p ON true
+        """
+
+    def search(
+        self,
+        query: str,
+        page: int = 1,
+        page_size: int = 20,
+        org_codes: Sequence[str] = (),
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        max_hits: Optional[int] = 10000
+    ) -> SearchPage:
+        """
+        Visits whose narrative contains every whitespace-separated term of `query`,
+        best matches first. Broad searches stop collecting after `max_hits`
+        matches, so their total is a lower bound and only those matches are
+        ranked; None counts and ranks every match.
+        """
+        terms = search_terms(query)
+        page, page_size = max(int(page), 1), max(int(page_size), 1)
+        result = SearchPage(terms, page, page_size)
+        if not terms:
+            return result
+        params: Dict[str, Any] = {"terms": terms, "limit": page_size, "offset": (page - 1) * page_size}
+        if org_codes:
+            params["org_codes"] = list(org_codes)
+        if since is not None:
+            params["since"] = since
+        if until is not None:
+            params["until"] = until
+        if max_hits is not None:
+            params["max_hits"] = max_hits + 1
+        started = time.perf_counter()
+        try:
+            with self.db_manager.get_connection(self.workload) as conn:
+                query = self.search_query(terms, org_codes, since, until, max_hits)
+                rows = conn.execute(text(query), params).mappings().all()
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+        except DatabaseError:
+            raise
+        except Exception as e:
+            raise DatabaseError(f"Unexpected error: {str(e)}")
+        result.elapsed = time.perf_counter() - started
+        result.total = int(rows[0]["total"]) if rows else 0
+        if max_hits is not None and result.total > max_hits:
+            result.total, result.truncated = max_hits, True
+        result.rows = [
+            {key: value for key, value in row.items() if key != "total"}
+            for row in rows if row["rank"] is not None
+        ]
+        return result
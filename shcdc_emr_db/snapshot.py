@@ -0,0 +1,310 @@
+"""
+Local analytical snapshots.
+ParquetSnapshot exports the emr_back tables to chunked Parquet files, appending
+only rows with a newer operation_time on later runs. SnapshotExecutor runs the
+dashboard's SQL on an embedded DuckDB over those files, with the QueryExecutor
+interface, so aggregates run vectorized on all local cores without touching the
+source database. Needs the optional `snapshot` extra (duckdb, pyarrow).
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Dict, Any, Iterator, Literal, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .db import QueryExecutor, ConfigError, QueryError, Workload
+
+STATE_FILE = "_snapshot.json"
+WATERMARK_COLUMN = "operation_time"
+
+# Bind parameters written as :name for SQLAlchemy text(), not :: casts
+_BIND_PATTERN = re.compile(r"(?<!:):(?!:)(\w+)")
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ConfigError(f"Snapshot mode needs {module}: pip install 'shcdc-emr-db[snapshot]'")
+
+
+def duckdb_query(query: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Rewrite the :name binds of `params` to DuckDB's $name (other text is left alone)
+    and keep only the parameters the query uses
+    """
+    if not params:
+        return query, None
+    used = {}
+
+    def replace(match):
+        name = match.group(1)
+        if name not in params:
+            return match.group(0)
+        used[name] = params[name]
+        return f"${name}"
+
+    return _BIND_PATTERN.sub(replace, query), used or None
+
+
+def _plain_types(frame: pd.DataFrame) -> pd.DataFrame:
+    """Numeric columns PostgreSQL returned as Decimal become floats, so chunk schemas agree"""
+    for column in frame.columns[frame.dtypes == object]:
+        first = frame[column].dropna().head(1)
+        if len(first) and isinstance(first.iloc[0], Decimal):
+            frame[column] = frame[column].astype(float)
+    return frame
+
+
+class ParquetSnapshot:
+    """Exports tables of a schema to `directory/<table>/*.parquet`, incrementally by operation_time"""
+
+    def __init__(
+        self,
+        query_executor: QueryExecutor,
+        directory: str = "snapshot",
+        schema: str = "emr_back",
+        chunk_size: int = 200000
+    ):
+        self.query_executor = query_executor
+        self.directory = directory
+        self.schema = schema
+        self.chunk_size = chunk_size
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """Exported files, watermark and row count per table"""
+        path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(path):
+            return {"schema": self.schema, "tables": {}}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def tables(self) -> List[Dict[str, Any]]:
+        """Top-level tables of the schema (partitions and *_unpartitioned leftovers excluded)"""
+        return self.query_executor.execute("""
+            SELECT c.relname AS table_name,
+                   EXISTS (SELECT 1 FROM pg_attribute a
+                           WHERE a.attrelid = c.oid AND a.attname = :watermark AND NOT a.attisdropped) AS incremental
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+              AND c.relname NOT LIKE '%\\_unpartitioned'
+            ORDER BY c.relname
+        """, {"schema": self.schema, "watermark": WATERMARK_COLUMN})
+
+    def export(self, tables: Optional[Sequence[str]] = None, full: bool = False) -> Dict[str, int]:
+        """
+        Export `tables` (default: all) and return the rows written per table. Tables
+        with operation_time only fetch rows newer than the last export unless `full`;
+        others, and every table on its first export, are written in full. The state
+        file is updated after each table, so an interrupted run loses nothing.
+        """
+        _require("pyarrow")
+        state = self.state
+        state["schema"] = self.schema
+        written = {}
+        for table in self.tables():
+            name = table["table_name"]
+            if tables is not None and name not in tables:
+                continue
+            previous = state["tables"].get(name)
+            incremental = bool(table["incremental"] and previous and previous.get("watermark") and not full)
+            written[name] = self._export_table(name, state, incremental, bool(table["incremental"]))
+        return written
+
+    def _export_table(self, table: str, state: Dict[str, Any], incremental: bool, has_watermark: bool) -> int:
+        prior = state["tables"].get(table)
+        previous = prior if incremental else None
+        # New file names never collide with files the saved state still refers to
+        generation = prior["generations"] if prior else 0
+        query = f"SELECT * FROM {self.schema}.{table}"
+        params = {}
+        if previous:
+            query += f" WHERE {WATERMARK_COLUMN} > :watermark"
+            params["watermark"] = previous["watermark"]
+
+        table_dir = os.path.join(self.directory, table)
+        os.makedirs(table_dir, exist_ok=True)
+        files, rows, watermark = [], 0, previous["watermark"] if previous else None
+        for index, frame in enumerate(self.query_executor.iter_frames(query, params, chunk_size=self.chunk_size)):
+            if frame.empty:
+                continue
+            name = f"g{generation:05d}-{index:05d}.parquet"
+            _plain_types(frame).to_parquet(os.path.join(table_dir, name + ".tmp"), index=False)
+            os.replace(os.path.join(table_dir, name + ".tmp"), os.path.join(table_dir, name))
+            files.append(name)
+            rows += len(frame)
+            if has_watermark:
+                latest = pd.to_datetime(frame[WATERMARK_COLUMN]).max()
+                if pd.notna(latest) and (watermark is None or latest.isoformat() > watermark):
+                    watermark = latest.isoformat()
+
+        if not files and not previous:
+            # Empty table: a zero-row file keeps its columns queryable
+            columns = [row["column_name"] for row in self.query_executor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = :schema AND table_name = :table ORDER BY ordinal_position
+            """, {"schema": self.schema, "table": table})]
+            name = f"g{generation:05d}-00000.parquet"
+            pd.DataFrame(columns=columns).to_parquet(os.path.join(table_dir, name), index=False)
+            files.append(name)
+
+        state["tables"][table] = {
+            "files": (previous["files"] if previous else []) + files,
+            "rows": (previous["rows"] if previous else 0) + rows,
+            "watermark": watermark,
+            "generations": generation + 1 if files else generation,
+            # Only appended snapshots can hold several versions of a row
+            "appended": bool(previous and (files or previous.get("appended"))),
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._save_state(state)
+        if not previous:
+            for name in os.listdir(table_dir):
+                if name not in files:
+                    os.remove(os.path.join(table_dir, name))
+        return rows
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def drop(self) -> None:
+        """Delete the whole snapshot"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SnapshotExecutor:
+    """
+    QueryExecutor-compatible reader that runs SQL on DuckDB over a ParquetSnapshot.
+    Each table is a view `<schema>.<table>`; tables appended to more than once keep
+    only the latest version of each id. Queries rebuild the views first when the
+    snapshot was re-exported since they were created.
+    """
+
+    def __init__(self, directory: str = "snapshot", threads: Optional[int] = None):
+        self.directory = directory
+        self.threads = threads
+        self._connection = None
+        self._state_signature = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            duckdb = _require("duckdb")
+            # Fold unquoted identifiers to lower case as PostgreSQL does, so result columns
+            # match; set as connection config because cursors don't inherit SET options
+            config = {"preserve_identifier_case": False}
+            if self.threads:
+                config["threads"] = int(self.threads)
+            self._connection = duckdb.connect(":memory:", config=config)
+            self.refresh()
+        return self._connection
+
+    @property
+    def exported_at(self) -> Optional[str]:
+        """Time of the most recent table export, None without a snapshot"""
+        path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            tables = json.load(f)["tables"].values()
+        return max((table["exported_at"] for table in tables), default=None)
+
+    def _signature(self) -> Optional[Tuple[int, int, int]]:
+        # The state file is replaced on every export, so its inode, mtime and size change
+        try:
+            stat = os.stat(os.path.join(self.directory, STATE_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _current_connection(self):
+        """The connection, with its views rebuilt if the snapshot changed since they were created"""
+        conn = self.connection
+        if self._signature() != self._state_signature:
+            with self._lock:
+                if self._signature() != self._state_signature:
+                    self.refresh()
+        return conn
+
+    def refresh(self) -> None:
+        """(Re)create the views from the snapshot state, picking up newly exported files"""
+        path = os.path.join(self.directory, STATE_FILE)
+        signature = self._signature()
+        if signature is None:
+            raise ConfigError(f"No snapshot in {self.directory}; export one with ParquetSnapshot first")
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        conn = self.connection
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {state['schema']}")
+        for table, info in state["tables"].items():
+            files = [os.path.join(self.directory, table, name) for name in info["files"]]
+            if not files:
+                continue
+            source = f"read_parquet({files!r}, union_by_name = true)"
+            if info.get("appended"):
+                source = f"""(SELECT * FROM {source}
+                    QUALIFY row_number() OVER (PARTITION BY id ORDER BY {WATERMARK_COLUMN} DESC NULLS LAST) = 1)"""
+            conn.execute(f"CREATE OR REPLACE VIEW {state['schema']}.{table} AS SELECT * FROM {source}")
+        self._state_signature = signature
+
+    def column_types(self) -> Dict[str, str]:
+        """
+        Column name -> data type over the snapshot's views, in the form of
+        dtypes.column_types (VARCHAR reported as text), read from DuckDB only
+        """
+        types: Dict[str, str] = {}
+        for column, data_type in self.frame(
+            "SELECT column_name, data_type FROM information_schema.columns ORDER BY table_name, ordinal_position"
+        ).itertuples(index=False):
+            types.setdefault(str(column), "text" if data_type == "VARCHAR" else str(data_type).lower())
+        return types
+
+    def frame(self, query: str, params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Run `query` and return the result as a DataFrame"""
+        cursor = self._current_connection().cursor()
+        try:
+            return cursor.execute(*duckdb_query(query, params)).df()
+        except Exception as e:
+            raise QueryError(f"Snapshot query error: {str(e)}")
+        finally:
+            cursor.close()
+
+    def execute(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        fetch: Literal["all", "one", "cursor"] = "all",
+        workload: Workload = "analytics"
+    ) -> List[Dict[str, Any]]:
+        """Same contract as QueryExecutor.execute"""
+        rows = self.frame(query, params).to_dict("records")
+        return rows[:1] if fetch == "one" else rows
+
+    def iter_frames(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 100000,
+        workload: Workload = "analytics"
+    ) -> Iterator[pd.DataFrame]:
+        """Same contract as QueryExecutor.iter_frames, streamed as Arrow record batches"""
+        cursor = self._current_connection().cursor()
+        try:
+            reader = cursor.execute(*duckdb_query(query, params)).fetch_record_batch(chunk_size)
+            for batch in reader:
+                yield batch.to_pandas()
+        except Exception as e:
+            raise QueryError(f"Snapshot query error: {str(e)}")
+        finally:
+            cursor.close()
@@ -0,0 +1,362 @@
+"""
+Quality metric trends.
+Snapshot jobs record every quality metric (per table, org and field) into a compact
+time-series store: a series dimension table plus (series_id, snapshot_at, value)
+points. Additive metrics are updated incrementally from rows newer than the last
+snapshot's operation_time watermark, with a full recomputation at least every
+full_every; deltas and trends are computed in SQL.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import text, exc as sa_exc
+
+from .db import DatabaseManager, QueryError
+from .queries import LINKAGE_TABLES
+from .scan import completeness_aggregates
+
+# org_code of the series aggregated over all organizations
+ALL_ORGS = "*"
+
+# Incremental snapshots turn into full ones once a set's last full snapshot is this old
+DEFAULT_FULL_EVERY = timedelta(days=7)
+
+# SQLSTATE of undefined_table: the store's tables are created by the first snapshot
+UNDEFINED_TABLE = "42P01"
+
+PATIENT_MANDATORY_FIELDS = (
+    "id", "patient_name", "id_card_type_code", "id_card_type_name",
+    "id_card", "org_code", "org_name", "operation_time",
+)
+PATIENT_SUGGESTED_FIELDS = ("gender_code", "birth_date", "tel", "marital_status_code", "current_addr_detail")
+
+
+@dataclass(frozen=True)
+class MetricSet:
+    """
+    Metrics computed together from one table. `metrics` maps (field, metric) to an
+    additive SQL aggregate over alias t. With a `time_column`, snapshots only
+    aggregate rows newer than the previous watermark and add them to the last values,
+    so incremental values are approximate: an updated row gets a new time and is
+    counted again without its old values being removed, deleted rows are never
+    subtracted, and rows without a time or arriving with an older one are missed.
+    Full snapshots (forced every full_every) recompute the set and reset the drift.
+    Without a time_column every snapshot recomputes the set.
+    """
+
+    name: str
+    table: str
+    metrics: Dict[Tuple[str, str], str]
+    time_column: Optional[str] = "operation_time"
+    group_by: Optional[str] = "org_code"
+
+
+def _completeness_set(name: str, table: str, fields: Sequence[str]) -> MetricSet:
+    aggregates = completeness_aggregates(fields)
+    return MetricSet(name, table, {
+        ("", "rows"): "COUNT(*)",
+        **{(field, "missing"): aggregates[f"{field}_missing"] for field in fields},
+    })
+
+
+def _linkage_sets(linkage: str) -> List[MetricSet]:
+    tables = LINKAGE_TABLES[linkage]
+    parent, item, join_field = tables["parent_table"], tables["item_table"], tables["join_field"]
+    # A parent can gain items later and an orphan its parent, so these are recomputed
+    return [
+        MetricSet(f"{linkage}.parents", parent.split(".")[-1], {
+            ("", "parents"): "COUNT(*)",
+            ("", "parents_without_items"):
+                f"SUM(CASE WHEN NOT EXISTS (SELECT 1 FROM {item} i WHERE i.{join_field} = t.id) THEN 1 ELSE 0 END)",
+        }, time_column=None),
+        MetricSet(f"{linkage}.orphans", item.split(".")[-1], {
+            ("", "orphaned_items"):
+                f"SUM(CASE WHEN NOT EXISTS (SELECT 1 FROM {parent} p WHERE p.id = t.{join_field}) THEN 1 ELSE 0 END)",
+        }, time_column=None, group_by=None),
+    ]
+
+
+DEFAULT_METRIC_SETS: List[MetricSet] = [
+    _completeness_set(
+        "patient_info.completeness", "emr_patient_info",
+        PATIENT_MANDATORY_FIELDS + PATIENT_SUGGESTED_FIELDS,
+    ),
+    *(metric_set for linkage in LINKAGE_TABLES for metric_set in _linkage_sets(linkage)),
+]
+
+
+class QualityTrendStore:
+    """Records quality metric snapshots and answers history, delta and trend queries"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        schema: str = "emr_ref",
+        source_schema: str = "emr_back",
+        metric_sets: Optional[Sequence[MetricSet]] = None,
+        full_every: Optional[timedelta] = DEFAULT_FULL_EVERY
+    ):
+        self.db_manager = db_manager
+        self.schema = schema
+        self.source_schema = source_schema
+        # None never forces a full snapshot
+        self.full_every = full_every
+        self.metric_sets = {metric_set.name: metric_set for metric_set in (metric_sets or DEFAULT_METRIC_SETS)}
+
+    def metric_query(self, metric_set: MetricSet, incremental: bool) -> str:
+        """Aggregates of a metric set per org plus an all-orgs (ALL_ORGS) row; binds :watermark if incremental"""
+        columns = "".join(f",\n                {expr} AS m{i}" for i, expr in enumerate(metric_set.metrics.values()))
+        watermark = f"MAX(t.{metric_set.time_column})" if metric_set.time_column else "NULL::timestamp"
+        if metric_set.group_by:
+            # Grouping on the coalesced value sums NULL and '' org codes into one '' row
+            key = f"COALESCE(t.{metric_set.group_by}, '')"
+            org = f"CASE WHEN GROUPING({key}) = 1 THEN '{ALL_ORGS}' ELSE {key} END"
+            group = f"GROUP BY ROLLUP ({key})"
+        else:
+            org, group = f"'{ALL_ORGS}'", ""
+        where = f"WHERE t.{metric_set.time_column} > :watermark" if incremental else ""
+        return f"""
+            SELECT {org} AS org_code, {watermark} AS watermark{columns}
+            FROM {self.source_schema}.{metric_set.table} t
+            {where}
+            {group}
+        """
+
+    def snapshot(self, names: Optional[Sequence[str]] = None, full: bool = False) -> int:
+        """
+        Record one snapshot of the named metric sets (all by default); `full` recomputes
+        incremental sets from scratch, as does any set whose last full snapshot is
+        older than full_every. Returns the number of points written.
+        """
+        written = 0
+        try:
+            with self.db_manager.engine.begin() as conn:
+                self._create_tables(conn)
+                snapshot_at = conn.execute(text("SELECT now()")).scalar()
+                for name in names or list(self.metric_sets):
+                    written += self._snapshot_set(conn, self.metric_sets[name], snapshot_at, full)
+            return written
+
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def series(
+        self,
+        table: Optional[str] = None,
+        metric: Optional[str] = None,
+        org_code: Optional[str] = ALL_ORGS,
+        since: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """Recorded points as (snapshot_at, table_name, org_code, field, metric, value), oldest first"""
+        conditions, params = self._filters(table, metric, org_code, since)
+        return self._frame(f"""
+            SELECT p.snapshot_at, s.table_name, s.org_code, s.field, s.metric, p.value
+            FROM {self.schema}.quality_series s
+            JOIN {self.schema}.quality_points p ON p.series_id = s.series_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY p.snapshot_at, s.org_code, s.field
+        """, params)
+
+    def completeness(
+        self,
+        table: str = "emr_patient_info",
+        org_code: Optional[str] = ALL_ORGS,
+        since: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """Completeness rate (%) per field at every snapshot"""
+        conditions, params = self._filters(table, "missing", org_code, since)
+        return self._frame(f"""
+            {self._rates_cte(conditions)}
+            SELECT snapshot_at, org_code, field, value AS rate FROM rates
+            ORDER BY snapshot_at, org_code, field
+        """, params)
+
+    def deltas(
+        self,
+        table: Optional[str] = None,
+        metric: Optional[str] = None,
+        org_code: Optional[str] = None
+    ) -> pd.DataFrame:
+        """Change of every series between its last two snapshots, largest increase first"""
+        conditions, params = self._filters(table, metric, org_code, None)
+        return self._frame(f"""
+            SELECT table_name, org_code, field, metric,
+                   MAX(value) FILTER (WHERE recency = 2) AS previous,
+                   MAX(value) FILTER (WHERE recency = 1) AS latest,
+                   MAX(value) FILTER (WHERE recency = 1) - MAX(value) FILTER (WHERE recency = 2) AS delta
+            FROM (
+                SELECT s.table_name, s.org_code, s.field, s.metric, p.value,
+                       ROW_NUMBER() OVER (PARTITION BY s.series_id ORDER BY p.snapshot_at DESC) AS recency
+                FROM {self.schema}.quality_series s
+                JOIN {self.schema}.quality_points p ON p.series_id = s.series_id
+                WHERE {' AND '.join(conditions)}
+            ) ranked
+            WHERE recency <= 2
+            GROUP BY table_name, org_code, field, metric
+            ORDER BY delta DESC NULLS LAST
+        """, params)
+
+    def trends(
+        self,
+        table: str = "emr_patient_info",
+        org_code: Optional[str] = None,
+        since: Optional[datetime] = None
+    ) -> pd.DataFrame:
+        """
+        Least-squares slope of each completeness rate in percentage points per day,
+        with first and latest values; orgs with the steepest decline come first.
+        """
+        conditions, params = self._filters(table, "missing", org_code, since)
+        return self._frame(f"""
+            {self._rates_cte(conditions)}
+            SELECT org_code, field, COUNT(*) AS snapshots,
+                   REGR_SLOPE(value, EXTRACT(EPOCH FROM snapshot_at) / 86400) AS slope_per_day,
+                   (ARRAY_AGG(value ORDER BY snapshot_at))[1] AS first_rate,
+                   (ARRAY_AGG(value ORDER BY snapshot_at DESC))[1] AS latest_rate
+            FROM rates
+            GROUP BY org_code, field
+            ORDER BY slope_per_day NULLS LAST
+        """, params)
+
+    def _snapshot_set(self, conn, metric_set: MetricSet, snapshot_at: datetime, full: bool) -> int:
+        state = conn.execute(text(
+            f"SELECT watermark, full_snapshot_at FROM {self.schema}.quality_snapshot_state WHERE metric_set = :name"
+        ), {"name": metric_set.name}).first()
+        full_due = self.full_every is not None and (
+            state is None or state.full_snapshot_at is None or snapshot_at - state.full_snapshot_at >= self.full_every
+        )
+        incremental = (
+            bool(metric_set.time_column) and not full and not full_due
+            and state is not None and state.watermark is not None
+        )
+        params = {"watermark": state.watermark} if incremental else {}
+        result = conn.execute(text(self.metric_query(metric_set, incremental)), params)
+        rows = result.fetchall()
+
+        keys = list(metric_set.metrics)
+        values = {
+            (row.org_code, field, metric): float(row[2 + i] or 0)
+            for row in rows
+            for i, (field, metric) in enumerate(keys)
+        }
+        series_ids = self._series_ids(conn, metric_set, list(values))
+
+        # Series without new rows keep their last value when incremental and drop to 0 on recomputation
+        previous = {}
+        if incremental:
+            previous = dict(conn.execute(text(f"""
+                SELECT DISTINCT ON (p.series_id) p.series_id, p.value
+                FROM {self.schema}.quality_points p
+                JOIN {self.schema}.quality_series s ON s.series_id = p.series_id
+                WHERE s.metric_set = :name
+                ORDER BY p.series_id, p.snapshot_at DESC
+            """), {"name": metric_set.name}).fetchall())
+        points = {
+            series_id: previous.get(series_id, 0.0) + values.get(key, 0.0)
+            for key, series_id in series_ids.items()
+        }
+        conn.execute(text(f"""
+            INSERT INTO {self.schema}.quality_points (series_id, snapshot_at, value)
+            SELECT unnest(CAST(:ids AS int[])), :snapshot_at, unnest(CAST(:values AS float8[]))
+            ON CONFLICT (series_id, snapshot_at) DO UPDATE SET value = EXCLUDED.value
+        """), {"ids": list(points), "values": list(points.values()), "snapshot_at": snapshot_at})
+
+        watermarks = [row.watermark for row in rows if row.watermark is not None]
+        if state is not None and state.watermark is not None and incremental:
+            watermarks.append(state.watermark)
+        conn.execute(text(f"""
+            INSERT INTO {self.schema}.quality_snapshot_state (metric_set, watermark, snapshot_at, full_snapshot_at)
+            VALUES (:name, :watermark, :snapshot_at, :full_snapshot_at)
+            ON CONFLICT (metric_set) DO UPDATE
+            SET watermark = EXCLUDED.watermark, snapshot_at = EXCLUDED.snapshot_at,
+                full_snapshot_at = COALESCE(EXCLUDED.full_snapshot_at, quality_snapshot_state.full_snapshot_at)
+        """), {
+            "name": metric_set.name,
+            "watermark": max(watermarks, default=None),
+            "snapshot_at": snapshot_at,
+            "full_snapshot_at": None if incremental else snapshot_at,
+        })
+        return len(points)
+
+    def _series_ids(self, conn, metric_set: MetricSet, keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], int]:
+        """Ids of every series of the set, registering new (org_code, field, metric) keys"""
+        if keys:
+            orgs, fields, metrics = (list(column) for column in zip(*keys))
+            conn.execute(text(f"""
+                INSERT INTO {self.schema}.quality_series (metric_set, table_name, org_code, field, metric)
+                SELECT :name, :table, unnest(CAST(:orgs AS text[])),
+                       unnest(CAST(:fields AS text[])), unnest(CAST(:metrics AS text[]))
+                ON CONFLICT (metric_set, org_code, field, metric) DO NOTHING
+            """), {"name": metric_set.name, "table": metric_set.table, "orgs": orgs, "fields": fields, "metrics": metrics})
+        rows = conn.execute(text(f"""
+            SELECT series_id, org_code, field, metric FROM {self.schema}.quality_series WHERE metric_set = :name
+        """), {"name": metric_set.name})
+        return {(row.org_code, row.field, row.metric): row.series_id for row in rows}
+
+    def _rates_cte(self, conditions: Sequence[str]) -> str:
+        return f"""
+            WITH rates AS (
+                SELECT p.snapshot_at, s.org_code, s.field,
+                       100.0 * (1 - p.value / NULLIF(r.value, 0)) AS value
+                FROM {self.schema}.quality_series s
+                JOIN {self.schema}.quality_points p ON p.series_id = s.series_id
+                JOIN {self.schema}.quality_series rs
+                  ON rs.metric_set = s.metric_set AND rs.org_code = s.org_code AND rs.metric = 'rows'
+                JOIN {self.schema}.quality_points r ON r.series_id = rs.series_id AND r.snapshot_at = p.snapshot_at
+                WHERE {' AND '.join(conditions)}
+            )"""
+
+    @staticmethod
+    def _filters(
+        table: Optional[str],
+        metric: Optional[str],
+        org_code: Optional[str],
+        since: Optional[datetime]
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        conditions, params = ["TRUE"], {}
+        for column, value in (("table_name", table), ("metric", metric), ("org_code", org_code)):
+            if value is not None:
+                conditions.append(f"s.{column} = :{column}")
+                params[column] = value
+        if since is not None:
+            conditions.append("p.snapshot_at >= :since")
+            params["since"] = since
+        return conditions, params
+
+    def _frame(self, query: str, params: Dict[str, Any]) -> pd.DataFrame:
+        try:
+            with self.db_manager.get_connection() as conn:
+                result = conn.execute(text(query), params)
+                return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+        except sa_exc.ProgrammingError as e:
+            # No snapshot taken yet
+            if getattr(e.orig, "pgcode", None) == UNDEFINED_TABLE:
+                return pd.DataFrame()
+            raise QueryError(f"Database error: {str(e)}")
+        except sa_exc.SQLAlchemyError as e:
+            raise QueryError(f"Database error: {str(e)}")
+
+    def _create_tables(self, conn) -> None:
+        conn.execute(text(f"""
+            CREATE SCHEMA IF NOT EXISTS {self.schema};
+            CREATE TABLE IF NOT EXISTS {self.schema}.quality_series (
+                series_id serial PRIMARY KEY,
+                metric_set varchar(100) NOT NULL, table_name varchar(100) NOT NULL,
+                org_code varchar(50) NOT NULL, field varchar(100) NOT NULL, metric varchar(50) NOT NULL,
+                UNIQUE (metric_set, org_code, field, metric)
+            );
+            CREATE TABLE IF NOT EXISTS {self.schema}.quality_points (
+                series_id int NOT NULL REFERENCES {self.schema}.quality_series,
+                snapshot_at timestamptz NOT NULL,
+                value double precision NOT NULL,
+                PRIMARY KEY (series_id, snapshot_at)
+            );
+            CREATE TABLE IF NOT EXISTS {self.schema}.quality_snapshot_state (
+                metric_set varchar(100) PRIMARY KEY, watermark timestamp, snapshot_at timestamptz
+            );
+            ALTER TABLE {self.schema}.quality_snapshot_state ADD COLUMN IF NOT EXISTS full_snapshot_at timestamptz
+        """))
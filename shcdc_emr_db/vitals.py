@@ -0,0 +1,246 @@
+"""
+Vital-sign series.
+Reads emr_vital_signs_record for a patient or a cohort as time-bucketed series:
+PostgreSQL bins the readings with date_bin and returns count, min, max, avg and the
+last value per (patient, item, bucket), so a multi-year chart fetches a few hundred
+rows per series instead of every reading. Results stream from a server-side cursor
+as DataFrame chunks or Arrow record batches.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from .db import QueryExecutor, ConfigError
+
+# Vital-sign item codes and their names; rows recorded with only a name get its code
+VITAL_SIGN_ITEMS: Dict[str, str] = {
+    "T": "体温",
+    "P": "脉搏",
+    "R": "呼吸",
+    "SBP": "收缩压",
+    "DBP": "舒张压",
+    "SPO2": "血氧饱和度",
+}
+
+# Bucket widths chosen from when the width is derived from max_points
+BUCKET_STEPS: Tuple[timedelta, ...] = (
+    timedelta(minutes=1), timedelta(minutes=5), timedelta(minutes=15), timedelta(minutes=30),
+    timedelta(hours=1), timedelta(hours=3), timedelta(hours=6), timedelta(hours=12),
+    timedelta(days=1), timedelta(days=7), timedelta(days=14), timedelta(days=30),
+    timedelta(days=91), timedelta(days=365),
+)
+
+# Buckets are aligned to this instant (a Monday), so weekly buckets start on Mondays
+BUCKET_ORIGIN = datetime(2000, 1, 3)
+
+SERIES_COLUMNS = ("patient_id", "item", "bucket_start", "readings", "min", "max", "avg", "last")
+
+TimeBound = Union[date, datetime]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ConfigError("Arrow output needs pyarrow: pip install 'shcdc-emr-db[parquet]'")
+
+
+def series_schema():
+    """Arrow schema of the series batches, fixed so empty or all-null chunks keep their types"""
+    pa = _pyarrow()
+    return pa.schema([
+        ("patient_id", pa.string()), ("item", pa.string()), ("bucket_start", pa.timestamp("us")),
+        ("readings", pa.int64()), ("min", pa.float64()), ("max", pa.float64()),
+        ("avg", pa.float64()), ("last", pa.float64()),
+    ])
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _item_expression() -> str:
+    names = " ".join(f"WHEN {_literal(name)} THEN {_literal(code)}" for code, name in VITAL_SIGN_ITEMS.items())
+    return (
+        "COALESCE(NULLIF(upper(TRIM(vital_signs_item_code)), ''), "
+        f"CASE TRIM(vital_signs_item_name) {names} END)"
+    )
+
+
+def bucket_width(start: TimeBound, end: TimeBound, max_points: int) -> timedelta:
+    """The smallest step of BUCKET_STEPS giving at most `max_points` buckets between start and end"""
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for step in BUCKET_STEPS:
+        if span / step <= max_points:
+            return step
+    return BUCKET_STEPS[-1]
+
+
+class VitalSignsSeries:
+    """Time-bucketed vital-sign series for patients, computed in the database and streamed"""
+
+    def __init__(
+        self,
+        query_executor: QueryExecutor,
+        schema: str = "emr_back",
+        chunk_size: int = 50000,
+        include_invalid: bool = False
+    ):
+        self.query_executor = query_executor
+        self.schema = schema
+        self.chunk_size = chunk_size
+        # Readings flagged invalid_flag = '1' are left out unless asked for
+        self.include_invalid = include_invalid
+
+    def _conditions(
+        self,
+        patient_ids: Sequence[str],
+        org_codes: Sequence[str],
+        since: Optional[TimeBound],
+        until: Optional[TimeBound]
+    ) -> Tuple[List[str], Dict[str, Any]]:
+        conditions = ["measure_time IS NOT NULL", "vital_signs_value IS NOT NULL"]
+        params: Dict[str, Any] = {}
+        if patient_ids:
+            conditions.append("patient_id = ANY(:patient_ids)")
+            params["patient_ids"] = list(patient_ids)
+        # The table is partitioned by org_code, so this prunes partitions
+        if org_codes:
+            conditions.append("org_code = ANY(:org_codes)")
+            params["org_codes"] = list(org_codes)
+        if since is not None:
+            conditions.append("measure_time >= :since")
+            params["since"] = since
+        if until is not None:
+            conditions.append("measure_time < :until")
+            params["until"] = until
+        if not self.include_invalid:
+            conditions.append("invalid_flag IS DISTINCT FROM '1'")
+        return conditions, params
+
+    def time_range(
+        self,
+        patient_ids: Sequence[str] = (),
+        org_codes: Sequence[str] = (),
+        since: Optional[TimeBound] = None,
+        until: Optional[TimeBound] = None
+    ) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """First and last measure_time of the selected readings"""
+        conditions, params = self._conditions(patient_ids, org_codes, since, until)
+        rows = self.query_executor.execute(
+            f"SELECT min(measure_time) AS first, max(measure_time) AS last "
+            f"FROM {self.schema}.emr_vital_signs_record WHERE {' AND '.join(conditions)}",
+            params,
+            workload="analytics",
+        )
+        return (rows[0]["first"], rows[0]["last"]) if rows else (None, None)
+
+    def bucket_query(
+        self,
+        bucket: timedelta,
+        patient_ids: Sequence[str] = (),
+        items: Sequence[str] = (),
+        org_codes: Sequence[str] = (),
+        since: Optional[TimeBound] = None,
+        until: Optional[TimeBound] = None,
+        per_patient: bool = True
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        (sql, params) aggregating the readings into `bucket`-wide bins per item, and
+        per patient unless `per_patient` is False (one series per item for the cohort)
+        """
+        if bucket <= timedelta(0):
+            raise ValueError("Bucket width must be positive")
+        conditions, params = self._conditions(patient_ids, org_codes, since, until)
+        params.update({"bucket": bucket, "origin": BUCKET_ORIGIN})
+        item_conditions = ["item IS NOT NULL"]
+        if items:
+            item_conditions.append("item = ANY(:items)")
+            params["items"] = [item.upper() for item in items]
+        patient = "patient_id" if per_patient else "CAST(NULL AS varchar) AS patient_id"
+        keys = "patient_id, item, bucket_start" if per_patient else "item, bucket_start"
+        sql = f"""
+            SELECT {patient}, item,
+                   date_bin(CAST(:bucket AS interval), measure_time, CAST(:origin AS timestamp)) AS bucket_start,
+                   COUNT(*) AS readings,
+                   MIN(value) AS min, MAX(value) AS max, AVG(value) AS avg,
+                   (array_agg(value ORDER BY measure_time DESC))[1] AS last
+            FROM (
+                SELECT patient_id, {_item_expression()} AS item, measure_time,
+                       CAST(vital_signs_value AS double precision) AS value
+                FROM {self.schema}.emr_vital_signs_record
+                WHERE {' AND '.join(conditions)}
+            ) v
+            WHERE {' AND '.join(item_conditions)}
+            GROUP BY {keys}
+            ORDER BY {keys}
+        """
+        return sql, params
+
+    def resolve_bucket(
+        self,
+        bucket: Optional[timedelta],
+        max_points: int,
+        patient_ids: Sequence[str] = (),
+        org_codes: Sequence[str] = (),
+        since: Optional[TimeBound] = None,
+        until: Optional[TimeBound] = None
+    ) -> timedelta:
+        """`bucket`, or a width giving at most `max_points` buckets over the selected time range"""
+        if bucket is not None:
+            return bucket
+        if since is None or until is None:
+            first, last = self.time_range(patient_ids, org_codes, since, until)
+            since = since if since is not None else first
+            until = until if until is not None else last
+        if since is None or until is None:
+            return BUCKET_STEPS[0]
+        return bucket_width(since, until, max_points)
+
+    def iter_series(
+        self,
+        patient_ids: Sequence[str] = (),
+        items: Sequence[str] = (),
+        since: Optional[TimeBound] = None,
+        until: Optional[TimeBound] = None,
+        bucket: Optional[timedelta] = None,
+        max_points: int = 500,
+        org_codes: Sequence[str] = (),
+        per_patient: bool = True
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Stream bucketed series as DataFrames with SERIES_COLUMNS, ordered by
+        patient, item and bucket. Without a `bucket` width one is chosen so that
+        each series has at most `max_points` buckets.
+        """
+        bucket = self.resolve_bucket(bucket, max_points, patient_ids, org_codes, since, until)
+        sql, params = self.bucket_query(bucket, patient_ids, items, org_codes, since, until, per_patient)
+        yield from self.query_executor.iter_frames(sql, params, chunk_size=self.chunk_size)
+
+    def series(self, *args, **kwargs) -> pd.DataFrame:
+        """All chunks of iter_series (same arguments) as one DataFrame"""
+        frames = list(self.iter_series(*args, **kwargs))
+        if not frames:
+            return pd.DataFrame(columns=list(SERIES_COLUMNS))
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_batches(self, *args, **kwargs) -> Iterator[Any]:
+        """iter_series (same arguments) as Arrow record batches with series_schema, for columnar transfer"""
+        pa, schema = _pyarrow(), series_schema()
+        for frame in self.iter_series(*args, **kwargs):
+            yield pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False)
+
+    def write_ipc(self, sink: Any, *args, **kwargs) -> int:
+        """
+        Write iter_series (same arguments after `sink`) to `sink`, a path or binary
+        file, as an Arrow IPC stream; returns the rows written
+        """
+        rows = 0
+        with _pyarrow().ipc.new_stream(sink, series_schema()) as writer:
+            for batch in self.iter_batches(*args, **kwargs):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
@@ -0,0 +1,10 @@
+-- 患者时间轴查询索引: 每个事件表按 patient_id 查找, 按事件时间排序
+CREATE INDEX IF NOT EXISTS emr_outpatient_record_patient_time_idx ON emr_back.emr_outpatient_record (patient_id, visit_time);
+CREATE INDEX IF NOT EXISTS emr_admission_record_patient_time_idx ON emr_back.emr_admission_record (patient_id, admission_time);
+CREATE INDEX IF NOT EXISTS emr_daily_course_patient_time_idx ON emr_back.emr_daily_course (patient_id, record_time);
+CREATE INDEX IF NOT EXISTS emr_discharge_info_patient_time_idx ON emr_back.emr_discharge_info (patient_id, discharge_time);
+CREATE INDEX IF NOT EXISTS emr_order_patient_time_idx ON emr_back.emr_order (patient_id, prescription_issuance_date);
+CREATE INDEX IF NOT EXISTS emr_ex_lab_patient_time_idx ON emr_back.emr_ex_lab (patient_id, apply_time);
+CREATE INDEX IF NOT EXISTS emr_ex_clinical_patient_time_idx ON emr_back.emr_ex_clinical (patient_id, application_date);
+CREATE INDEX IF NOT EXISTS emr_vital_signs_record_patient_time_idx ON emr_back.emr_vital_signs_record (patient_id, measure_time);
+CREATE INDEX IF NOT EXISTS emr_death_info_patient_time_idx ON emr_back.emr_death_info (patient_id, death_time);
@@ -0,0 +1,51 @@
+from datetime import date
+from unittest.mock import MagicMock
+import pytest
+from shcdc_emr_db.catalog import QueryCatalog
+from shcdc_emr_db.queries import QueryScope, dashboard_query_catalog
+
+SCOPE = QueryScope(org_codes=("O1", "O2"), since=date(2024, 1, 1))
+
+def test_scope_binds_replace_literals():
+    """Test a bind scope renders placeholders and params() carries the values."""
+    bound = QueryScope(org_codes=("O1",), until=date(2024, 2, 1), bind=True)
+    assert bound.parent_conditions() == ["p.org_code = ANY(:org_codes)"]
+    assert bound.item_conditions() == ["i.operation_time < :until"]
+    assert bound.params() == {"org_codes": ["O1"], "until": date(2024, 2, 1)}
+    assert SCOPE.parent_conditions() == ["p.org_code IN ('O1', 'O2')"]
+
+def test_compile_once_per_scope_shape(mock_db_manager):
+    """Test variants are compiled to $n statements once per set of filters, whatever their values."""
+    catalog = QueryCatalog(mock_db_manager)
+    assert set(catalog.names()) == set(dashboard_query_catalog())
+    compiled = catalog.compile("order.missing_by_org", SCOPE)
+    assert "ANY($2::VARCHAR[])" in compiled.sql and "i.operation_time >= $1" in compiled.sql
+    assert compiled.arg_names == ("since", "org_codes") and compiled.arg_types == ("DATE", "VARCHAR[]")
+    assert catalog.compile("order.missing_by_org", QueryScope(org_codes=("O9",), since=date(2020, 1, 1))) is compiled
+    assert catalog.compile("order.missing_by_org") is not compiled
+
+    orphans = catalog.compile("order.orphaned_items", SCOPE)
+    assert orphans.arg_names == ("since",)
+    assert "'O1'" in catalog.sql("order.missing_by_org", SCOPE)
+    with pytest.raises(ValueError):
+        catalog.compile("order.unknown")
+
+def test_frame_executes_prepared_statement(mock_db_manager):
+    """Test the statement is PREPAREd once per connection and EXECUTEd with the scope's values."""
+    conn = MagicMock()
+    conn.connection.info = {}
+    conn.execute.return_value.fetchall.return_value = [("O1", "Org 1", 3)]
+    conn.execute.return_value.keys.return_value = ["机构代码", "机构名称", "缺失数量"]
+    context = MagicMock()
+    context.__enter__.return_value = conn
+    mock_db_manager.get_connection.return_value = context
+
+    catalog = QueryCatalog(mock_db_manager)
+    frame = catalog.frame("order.missing_by_org", SCOPE)
+    catalog.frame("order.missing_by_org", SCOPE)
+
+    assert frame.to_dict("records") == [{"机构代码": "O1", "机构名称": "Org 1", "缺失数量": 3}]
+    assert conn.exec_driver_sql.call_count == 1
+    assert conn.exec_driver_sql.call_args[0][0].startswith("PREPARE shcdc_")
+    assert conn.execute.call_args[0][1] == {"arg0": date(2024, 1, 1), "arg1": ["O1", "O2"]}
+    mock_db_manager.get_connection.assert_called_with("analytics")
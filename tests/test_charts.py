@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from shcdc_emr_db.charts import top_n_with_others, bin_scatter, histogram_bins, downsample_line, COUNT_LABEL
+
+def test_top_n_with_others():
+    """Test labels beyond the top n are folded into one others row per color group."""
+    df = pd.DataFrame({"org": [f"O{i}" for i in range(30)], "n": range(30)})
+    reduced = top_n_with_others(df, "org", "n", n=5)
+    assert len(reduced) == 6
+    assert reduced["n"].sum() == df["n"].sum()
+    assert reduced.iloc[-1].tolist() == ["其他", sum(range(25))]
+    assert top_n_with_others(df.head(5), "org", "n", n=5).equals(df.head(5))
+
+    grouped = pd.DataFrame({"org": [f"O{i}" for i in range(10)] * 2, "n": range(20), "kind": ["a"] * 10 + ["b"] * 10})
+    reduced = top_n_with_others(grouped, "org", "n", n=3, color_col="kind", agg="mean")
+    assert len(reduced) == 8
+    assert reduced.loc[reduced["org"] == "其他", "n"].tolist() == [3.0, 13.0]
+
+def test_bin_scatter_bounds_points():
+    """Test scatter points are binned onto a grid whose cell counts cover every point."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"x": rng.random(10000), "y": rng.random(10000), "size": 1})
+    binned = bin_scatter(df, "x", "y", max_points=100, size_col="size")
+    assert len(binned) <= 100
+    assert binned[COUNT_LABEL].sum() == 10000
+    assert (binned["size"] == binned[COUNT_LABEL]).all()
+
+def test_histogram_bins():
+    """Test histograms are counted server-side into labelled bins."""
+    bins = histogram_bins(pd.Series([0, 1, 2, 10, None]), bins=2)
+    assert bins[COUNT_LABEL].tolist() == [3, 1]
+    assert bins["区间"].tolist() == ["0-5", "5-10"]
+
+def test_downsample_line_keeps_extremes():
+    """Test long series are reduced per group while keeping their endpoints and extremes."""
+    x = np.arange(5000)
+    y = np.sin(x / 100.0)
+    y[1234] = 10
+    df = pd.DataFrame({"t": np.concatenate([x, x]), "v": np.concatenate([y, -y]), "g": ["a"] * 5000 + ["b"] * 5000})
+    reduced = downsample_line(df, "t", "v", group_col="g", max_points=200)
+    assert len(reduced) <= 2 * 200
+    a = reduced[reduced["g"] == "a"]
+    assert a["v"].max() == 10 and a["t"].iloc[0] == 0 and a["t"].iloc[-1] == 4999
+    assert reduced[reduced["g"] == "b"]["v"].min() == -10
+    assert downsample_line(df.head(10), "t", "v").equals(df.head(10))
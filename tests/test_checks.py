@@ -0,0 +1,67 @@
+from datetime import date
+import pandas as pd
+from unittest.mock import MagicMock
+from shcdc_emr_db.checks import (
+    PatientInfoChecker, check_patient_frame, id_card_flags, phone_invalid, birth_date_flags
+)
+from shcdc_emr_db.queries import QueryScope
+
+VALID_ID = "11010519491231002X"
+
+def test_id_card_flags():
+    """Test ID number format, GB 11643 checksum and embedded birth date checks."""
+    cards = pd.Series([VALID_ID, "110105194912310021", "110105491231002", "11010519490231002X", "E1234", None, "ABC"])
+    types = pd.Series(["01", "01", "01", "01", "03", "01", None])
+    births = pd.Series([date(1949, 12, 31), None, date(1949, 12, 30), None, None, None, None])
+    flags = id_card_flags(cards, births, types)
+
+    # Feb 31st is not a date; passports and unknown types are not checked
+    assert flags["id_card_format"].tolist() == [False, False, False, True, False, False, False]
+    assert flags["id_card_checksum"].tolist() == [False, True, False, False, False, False, False]
+    assert flags["id_card_birth_date"].tolist() == [False, False, True, False, False, False, False]
+
+def test_phone_invalid():
+    """Test mobile and fixed-line patterns, ignoring separators and country code."""
+    phones = pd.Series(["13812345678", "+86 139 1234 5678", "021-12345678", "(021)12345678",
+                        "12812345678", "12345", "", None])
+    assert phone_invalid(phones).tolist() == [False, False, False, False, True, True, False, False]
+
+def test_birth_date_flags():
+    """Test future, too old and after-visit birth dates, and stated age consistency."""
+    flags = birth_date_flags(
+        pd.Series([date(1990, 1, 1), date(2030, 1, 1), date(1800, 1, 1), date(2021, 1, 1)]),
+        pd.Series(pd.to_datetime(["2020-01-01"] * 4)),
+        pd.Series([30, None, None, 5]),
+        as_of=date(2024, 1, 1),
+    )
+    assert flags["birth_date_implausible"].tolist() == [False, True, True, True]
+    assert flags["age_mismatch"].tolist() == [False, False, False, True]
+
+def test_checker_accumulates_chunks():
+    """Test counts, per-org totals and org name conflicts accumulate across streamed chunks."""
+    first = pd.DataFrame({
+        "id": ["a", "b"], "id_card_type_code": ["01", "01"], "id_card": [VALID_ID, "bad"],
+        "tel": ["13812345678", "1"], "org_code": ["O1", "O1"], "org_name": ["甲医院", "甲医院"],
+    })
+    second = pd.DataFrame({
+        "id": ["c"], "id_card_type_code": ["01"], "id_card": ["bad"],
+        "tel": [None], "org_code": ["O1"], "org_name": ["甲院"],
+    })
+    executor = MagicMock()
+    executor.iter_frames.return_value = iter([first, second])
+
+    checker = PatientInfoChecker(executor, chunk_size=2, max_samples=1)
+    report = checker.run(QueryScope(org_codes=("O1",)))
+
+    assert "p.org_code IN ('O1')" in executor.iter_frames.call_args.args[0]
+    assert report.rows == 3
+    assert report.violations["id_card_format"] == 2
+    assert report.violations["tel_format"] == 1
+    assert report.samples["id_card_format"] == ["b"]
+    assert report.by_org.loc["O1", "id_card_format"] == 2
+    assert report.org_conflicts()["org_name"].tolist() == ["甲医院", "甲院"]
+
+def test_check_frame_skips_absent_columns():
+    """Test only the checks whose columns were fetched are run."""
+    flags = check_patient_frame(pd.DataFrame({"tel": ["13812345678"]}))
+    assert list(flags.columns) == ["tel_format"]
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from shcdc_emr_db.codes import CodeValidator, read_code_systems_csv
+from shcdc_emr_db.db import DatabaseError
+
+FIELDS = {
+    "emr_patient_info": {"gender_code": "GB/T 2261.1", "nation_code": "GB 3304"},
+    "emr_order_item": {"invalid_flag": "FLAG"},
+}
+
+def test_validation_query_scans_each_table_once(mock_db_manager):
+    """Test only existing coded columns are unpivoted, one branch per table."""
+    validator = CodeValidator(mock_db_manager, field_code_systems=FIELDS)
+    columns = {"emr_patient_info": {"gender_code", "org_code"}, "emr_order_item": {"invalid_flag"}}
+    with patch.object(validator, "_existing_columns", return_value=columns):
+        query = validator.validation_query()
+
+    assert query.count("CROSS JOIN LATERAL") == 2
+    assert "('gender_code', 'GB/T 2261.1', NULLIF(t.gender_code::text, ''))" in query
+    assert "nation_code" not in query
+    # Tables without org_code still group, by a NULL org
+    assert "NULL::text AS org_code" in query
+    assert "FROM emr_ref.code_value" in query
+
+def test_validation_query_without_coded_fields(mock_db_manager):
+    """Test a table with none of its coded columns present is rejected."""
+    validator = CodeValidator(mock_db_manager, field_code_systems=FIELDS)
+    with patch.object(validator, "_existing_columns", return_value={}):
+        with pytest.raises(ValueError):
+            validator.validation_query(["emr_patient_info"])
+
+def test_memory_dictionary(mock_db_manager):
+    """Test in-memory dictionaries are inlined and registered codes are included."""
+    validator = CodeValidator(mock_db_manager, code_systems={"FLAG": {"0": "否"}}, source="memory")
+    validator.register({"FLAG": {"1": "是"}, "O'X": {"A": ""}})
+    sql = validator._dictionary_sql()
+    assert "('FLAG', '0'), ('FLAG', '1'), ('O''X', 'A')" in sql
+    # No dictionary table needed
+    validator._check_dictionary(None)
+
+def test_empty_dictionary_table_is_refused(mock_db_manager):
+    """Test validation refuses to run before the reference codes are loaded."""
+    connection = MagicMock()
+    connection.execute.return_value.scalar.return_value = False
+    with pytest.raises(DatabaseError, match="load_code_tables"):
+        CodeValidator(mock_db_manager)._check_dictionary(connection)
+
+def test_read_code_systems_csv(tmp_path):
+    """Test reference code tables are read from CSV."""
+    path = tmp_path / "codes.csv"
+    path.write_text("code_system,code,name\nGB/T 2261.1,1,男性\nGB/T 2261.1, 2 ,女性\nFLAG,0,\n", encoding="utf-8")
+    assert read_code_systems_csv(str(path)) == {
+        "GB/T 2261.1": {"1": "男性", "2": "女性"},
+        "FLAG": {"0": ""},
+    }
@@ -0,0 +1,44 @@
+from datetime import date
+from unittest.mock import MagicMock
+from shcdc_emr_db.counters import LinkageCounters
+from shcdc_emr_db.queries import QueryScope
+
+def connect(mock_db_manager, rows=None, triggers=()):
+    conn = MagicMock()
+    conn.execute.return_value.mappings.return_value.one.return_value = rows or {}
+    conn.execute.return_value.tuples.return_value = list(triggers)
+    context = MagicMock()
+    context.__enter__.return_value = conn
+    mock_db_manager.get_connection.return_value = context
+    return conn
+
+def test_counts_follow_the_overview_queries(mock_db_manager):
+    """Test orphans count towards all items only without an organization filter."""
+    counters = LinkageCounters(mock_db_manager)
+    conn = connect(mock_db_manager, {"linked": 90, "childless": 4, "orphaned": 10})
+    assert counters.counts("order") == {
+        "total_items": 100, "parent_with_items": 90, "parent_without_items": 4, "valid_items": 90, "orphaned_items": 10,
+    }
+    assert counters.counts("order", ["O1"])["total_items"] == 90
+    assert conn.execute.call_args[0][1] == {"linkage": "order", "org_codes": ["O1"]}
+
+def test_overview_only_when_installed_and_untimed(mock_db_manager):
+    """Test counters answer as metric frames, and defer to SQL for time windows or missing triggers."""
+    counters = LinkageCounters(mock_db_manager)
+    connect(mock_db_manager, {"linked": 9, "childless": 1, "orphaned": 1},
+            [(name, table) for name, table, _, _ in counters._triggers("order")])
+    frames = counters.overview("order", "医嘱处方项", "医嘱处方")
+    assert frames["parent_without_items"].to_dict("records") == [{"Metric": "无医嘱处方项的医嘱处方", "Count": 1}]
+    assert counters.overview("order", "医嘱处方项", "医嘱处方", QueryScope(since=date(2024, 1, 1))) is None
+    assert counters.overview("ex_lab", "检验项目", "检验工作单") is None
+
+def test_install_statements(mock_db_manager):
+    """Test every write event of both tables gets a statement trigger with its transition tables."""
+    statements = LinkageCounters(mock_db_manager)._install_statements("ex_lab")
+    triggers = [s for s in statements if "CREATE TRIGGER" in s]
+    assert len(triggers) == 8
+    assert any("AFTER UPDATE ON emr_back.emr_ex_lab_item" in s and "OLD TABLE AS old_rows NEW TABLE AS new_rows" in s
+               for s in triggers)
+    assert all("FOR EACH STATEMENT" in s for s in triggers)
+    items = statements[0]
+    assert "SELECT ex_lab_id::text AS parent_id FROM new_rows" in items and "ELSIF TG_OP = 'UPDATE'" in items
@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import patch, MagicMock
+from sqlalchemy import exc as sa_exc
 from shcdc_emr_db.db import DatabaseManager, DatabaseError, ConfigError
 
 def test_database_manager_initialization(test_config):
@@ -39,4 +40,70 @@ def test_connection_context_manager(mock_db_manager):
 def test_close_connection(mock_db_manager):
     """Test closing database connection."""
     mock_db_manager.close()
-    mock_db_manager.close.assert_called_once() 
\ No newline at end of file
+    mock_db_manager.close.assert_called_once()
+
+def replica_manager(tmp_path):
+    """DatabaseManager of a config listing two replica sections."""
+    config_file = tmp_path / "database.ini"
+    server = "host=localhost\nport=5432\ndatabase=emr\nuser=u\npassword=p\n"
+    config_file.write_text(
+        f"[postgresql]\n{server}replicas = replica_a, replica_b\nmax_replica_lag = 10\n"
+        f"[replica_a]\n{server}[replica_b]\n{server}"
+    )
+    return DatabaseManager(str(config_file))
+
+def test_route_prefers_least_lagged_fresh_replica(tmp_path):
+    """Test analytics go to the least-lagged replica within max_replica_lag and lookups to the primary."""
+    manager = replica_manager(tmp_path)
+    assert manager.replicas == ["replica_a", "replica_b"]
+    lags = {"replica_a": 5.0, "replica_b": 1.0}
+    with patch.object(manager, "replica_lag", side_effect=lambda endpoint: lags[endpoint]):
+        assert manager.route("analytics") == "replica_b"
+        assert manager.route("primary") == "postgresql"
+        lags.update(replica_a=3.0, replica_b=None)
+        assert manager.route("analytics") == "replica_a"
+        lags.update(replica_a=60.0)
+        assert manager.route("analytics") == "postgresql"
+
+def test_replica_lag_is_cached_and_unreachable_is_none(tmp_path):
+    """Test an unreachable replica reports no lag and is not probed again within the check interval."""
+    manager = replica_manager(tmp_path)
+    engine = MagicMock()
+    engine.connect.side_effect = sa_exc.OperationalError("connect", {}, Exception("down"))
+    with patch.object(manager, "endpoint_engine", return_value=engine):
+        assert manager.replica_lag("replica_a") is None
+        assert manager.replica_lag("replica_a") is None
+    engine.connect.assert_called_once()
+
+def test_get_connection_falls_back_to_primary(tmp_path):
+    """Test a routed replica refusing connections is marked down and the primary is used."""
+    manager = replica_manager(tmp_path)
+    replica, primary = MagicMock(), MagicMock()
+    replica.connect.side_effect = sa_exc.OperationalError("connect", {}, Exception("down"))
+    manager._engine = primary
+    with patch.object(manager, "route", return_value="replica_a"), \
+            patch.object(manager, "endpoint_engine", side_effect=lambda e: primary if e == "postgresql" else replica):
+        with manager.get_connection("analytics") as conn:
+            assert conn is primary.connect.return_value
+        with pytest.raises(sa_exc.OperationalError):
+            with manager.get_connection(endpoint="replica_a"):
+                pass
+    assert manager._replica_status["replica_a"][1] is None
+
+def test_create_index_concurrently(tmp_path):
+    """Test plain tables are indexed concurrently after dropping an invalid leftover."""
+    manager = replica_manager(tmp_path)
+    manager._engine = MagicMock()
+    conn = manager._engine.connect.return_value.__enter__.return_value.execution_options.return_value
+    conn.execute.return_value.mappings.return_value.first.return_value = {"partitioned": False, "valid": False}
+    assert manager.create_index("emr_back.emr_order", "emr_order_org_code_idx", ["org_code"])
+    statements = [call[0][0] for call in conn.exec_driver_sql.call_args_list]
+    assert statements == [
+        "DROP INDEX CONCURRENTLY IF EXISTS emr_back.emr_order_org_code_idx",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS emr_order_org_code_idx ON emr_back.emr_order (org_code)",
+    ]
+    conn.execute.return_value.mappings.return_value.first.return_value = {"partitioned": True, "valid": None}
+    assert manager.create_index("emr_back.emr_order_item", "emr_order_item_order_id_idx", ["order_id"])
+    assert conn.exec_driver_sql.call_args[0][0].startswith("CREATE INDEX IF NOT EXISTS")
+    conn.execute.return_value.mappings.return_value.first.return_value = {"partitioned": False, "valid": True}
+    assert not manager.create_index("emr_back.emr_order", "emr_order_org_code_idx", ["org_code"])
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import exc as sa_exc
+from shcdc_emr_db.db import QueryError
+from shcdc_emr_db.drilldown import OrgDrilldown
+from shcdc_emr_db.queries import org_missing_items_query, org_missing_patients_query
+
+class FakeRow:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+@pytest.fixture
+def connection(mock_db_manager):
+    mock_connection = MagicMock()
+    mock_connection.connection.info = {}
+    mock_connection.execute.return_value = [FakeRow({"机构代码": "ORG1"})]
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    mock_db_manager.get_connection.return_value = context
+    return mock_connection
+
+def test_statement_prepared_once_per_connection(mock_db_manager, connection):
+    """Test the drill-down is prepared on first use and only executed afterwards."""
+    drilldown = OrgDrilldown(mock_db_manager, limit=50)
+
+    assert drilldown.missing_items("order", "ORG1") == [{"机构代码": "ORG1"}]
+    drilldown.missing_items("order", "ORG2", limit=10)
+
+    connection.exec_driver_sql.assert_called_once()
+    prepare = connection.exec_driver_sql.call_args.args[0]
+    assert prepare.startswith("PREPARE shcdc_")
+    assert "(text, integer) AS" in prepare
+    assert "p.org_code = $1" in prepare
+    execute_calls = connection.execute.call_args_list
+    assert str(execute_calls[0].args[0]).startswith("EXECUTE shcdc_")
+    assert execute_calls[0].args[1] == {"arg0": "ORG1", "arg1": 50}
+    assert execute_calls[1].args[1] == {"arg0": "ORG2", "arg1": 10}
+
+def test_each_query_gets_its_own_statement(mock_db_manager, connection):
+    """Test different drill-downs are prepared under different names."""
+    drilldown = OrgDrilldown(mock_db_manager)
+    drilldown.missing_items("order", "ORG1")
+    drilldown.missing_patients("order", "ORG1")
+    drilldown.missing_items("ex_lab", "ORG1")
+    assert connection.exec_driver_sql.call_count == 3
+    assert len(connection.connection.info["shcdc_emr_db.prepared"]) == 3
+
+def test_drilldown_queries_filter_on_org():
+    """Test the drill-down SQL binds the org code and limit as parameters."""
+    for query in (org_missing_items_query("ex_clinical"), org_missing_patients_query("ex_clinical")):
+        assert "p.org_code = $1" in query
+        assert "LIMIT $2" in query
+    assert "emr_back.emr_patient_info pi ON p.patient_id = pi.id" in org_missing_patients_query("order")
+
+def test_invalid_drilldown(mock_db_manager):
+    """Test unknown drill-downs and linkages are rejected."""
+    drilldown = OrgDrilldown(mock_db_manager)
+    with pytest.raises(ValueError):
+        drilldown.fetch("everything", "order", "ORG1")
+    with pytest.raises(ValueError):
+        drilldown.missing_items("vital_signs", "ORG1")
+
+def test_drilldown_failure(mock_db_manager, connection):
+    """Test database errors surface as QueryError and leave the statement unregistered."""
+    connection.exec_driver_sql.side_effect = sa_exc.SQLAlchemyError("boom")
+    with pytest.raises(QueryError):
+        OrgDrilldown(mock_db_manager).missing_items("order", "ORG1")
+    assert connection.connection.info["shcdc_emr_db.prepared"] == set()
+
+def test_drilldown_indexes(mock_db_manager):
+    """Test the drill-down indexes org_code on parents and the join column on items."""
+    mock_db_manager.create_index.side_effect = [True, False]
+    drilldown = OrgDrilldown(mock_db_manager)
+    assert drilldown.indexes(["order"]) == [
+        ("emr_back.emr_order", "emr_order_org_code_idx", "org_code"),
+        ("emr_back.emr_order_item", "emr_order_item_order_id_idx", "order_id"),
+    ]
+    assert drilldown.create_indexes(["order"]) == ["emr_order_org_code_idx"]
+    mock_db_manager.create_index.assert_any_call("emr_back.emr_order", "emr_order_org_code_idx", ["org_code"])
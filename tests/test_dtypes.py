@@ -0,0 +1,36 @@
+import pandas as pd
+from shcdc_emr_db.dtypes import column_types, compact_frame, source_columns
+
+QUERY = "SELECT p.org_code AS 机构代码, p.org_name AS 机构名称, p.patient_name AS 患者姓名, COUNT(*) AS 数量 FROM t p"
+TYPES = {"org_code": "character varying", "org_name": "character varying", "patient_name": "character varying"}
+
+def test_column_types_and_sources():
+    """Test metadata is flattened to column types and aliases are traced to their source column."""
+    metadata = {"tables": {"a": {"columns": [{"column_name": "org_code", "data_type": "character varying"}]},
+                           "b": {"columns": [{"column_name": "id", "data_type": "bigint"}]}}}
+    assert column_types(metadata) == {"org_code": "character varying", "id": "bigint"}
+    assert source_columns(QUERY) == {"机构代码": "org_code", "机构名称": "org_name", "患者姓名": "patient_name"}
+
+def test_compact_frame_keeps_values():
+    """Test repeated organization columns become categoricals, other text strings and counts int32."""
+    frame = pd.DataFrame({
+        "机构代码": ["O1", "O2"] * 20,
+        "机构名称": ["Org 1", "Org 2"] * 20,
+        "患者姓名": [f"P{i}" for i in range(39)] + [None],
+        "数量": range(40),
+        "比例": [0.5] * 40,
+    })
+    compact = compact_frame(frame, QUERY, TYPES)
+    assert str(compact["机构代码"].dtype) == "category" and str(compact["机构名称"].dtype) == "category"
+    assert str(compact["患者姓名"].dtype) == "string"
+    assert compact["数量"].dtype == "int32" and compact["比例"].dtype == "float64"
+    assert compact.astype(object).where(compact.notna(), None).equals(frame.astype(object).where(frame.notna(), None))
+    assert frame["数量"].dtype == "int64"
+
+def test_compact_frame_without_metadata():
+    """Test unknown text is never made categorical and large integers stay int64."""
+    frame = pd.DataFrame({"机构代码": ["O1"] * 40, "数量": [2 ** 40] * 40})
+    compact = compact_frame(frame, QUERY)
+    assert str(compact["机构代码"].dtype) == "string"
+    assert compact["数量"].dtype == "int64"
+    assert compact_frame(frame.iloc[:0]).empty
@@ -0,0 +1,52 @@
+from unittest.mock import MagicMock
+import pandas as pd
+import pytest
+from sqlalchemy import exc as sa_exc
+from shcdc_emr_db.db import DatabaseManager
+from shcdc_emr_db.federation import FederatedExecutor, merge_frames, STACKED_QUERIES
+
+def test_merge_frames_sums_counts_and_weights_rates():
+    """Test counts are summed per key and rate columns are re-derived as record-weighted means."""
+    a = pd.DataFrame({"医疗机构名称": ["A", "B"], "记录总数": [10, 30], "电话缺失数": [1, 3], "电话缺失率": [10.0, 10.0]})
+    b = pd.DataFrame({"医疗机构名称": ["A"], "记录总数": [30], "电话缺失数": [9], "电话缺失率": [30.0]})
+    merged = merge_frames([a, b])
+    assert merged.to_dict("list") == {
+        "医疗机构名称": ["A", "B"], "记录总数": [40, 30], "电话缺失数": [10, 3], "电话缺失率": [25.0, 10.0],
+    }
+    assert merged["记录总数"].dtype == "int64"
+
+    totals = merge_frames([pd.DataFrame({"总记录数": [5]}), pd.DataFrame({"总记录数": [7]})])
+    assert totals["总记录数"].tolist() == [12]
+    assert merge_frames([]).empty
+
+def test_merge_frames_needs_a_weight_for_rates():
+    """Test rates without any count column to weight them are refused."""
+    with pytest.raises(ValueError):
+        merge_frames([pd.DataFrame({"k": ["A"], "完整率": [50.0]})])
+
+def source(mocker, frame=None, error=None):
+    manager = mocker.Mock(spec=DatabaseManager)
+    context = MagicMock()
+    # The "connection" handed to read_sql_query is the source's result frame
+    context.__enter__.return_value = frame
+    context.__enter__.side_effect = error
+    manager.get_connection.return_value = context
+    return manager
+
+def test_run_many_merges_sources_and_reports_failures(mocker):
+    """Test each query runs on every source, parts are merged or stacked, and a failing source is reported."""
+    down = sa_exc.OperationalError("connect", {}, Exception("refused"))
+    executor = FederatedExecutor({
+        "north": source(mocker, pd.DataFrame({"Metric": ["孤立order"], "Count": [3]})),
+        "south": source(mocker, pd.DataFrame({"Metric": ["孤立order"], "Count": [4]})),
+        "east": source(mocker, error=down),
+    }, workers=2)
+
+    mocker.patch("shcdc_emr_db.federation.pd.read_sql_query", side_effect=lambda query, conn, params=None: conn)
+    results = executor.run_many({"count": "SELECT 1", "rows": "SELECT 2"}, merge={"rows": "stack"})
+
+    assert results["count"].combined.to_dict("records") == [{"Metric": "孤立order", "Count": 7}]
+    assert results["rows"].combined["source"].tolist() == ["north", "south"]
+    assert list(results["count"].failed) == ["east"]
+    assert set(results["count"].timings) == {"north", "south", "east"}
+    assert "order.orphaned_items" in STACKED_QUERIES and "order.overview.orphaned_items" not in STACKED_QUERIES
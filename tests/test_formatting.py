@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock
+from shcdc_emr_db.db import EMRRecordManager
+from shcdc_emr_db.formatting import EMRTextFormatter, truncate_tokens
+
+RECORD = {
+    "patient_id": "P1",
+    "patient_name": "张三",
+    "gender": "男",
+    "age": 42,
+    "visit_time": "2024-03-24 09:00:00",
+    "dept_name": "内科",
+    "clinic_diagnosis": "上呼吸道感染",
+    "chief_complaint": "咳嗽三天",
+    "present_illness": None,
+    "physical_examination": "咽部充血",
+}
+
+def test_format_columns_matches_single_record():
+    """Test bulk formatting of a DataFrame matches per-record formatting."""
+    formatter = EMRTextFormatter()
+    frame = pd.DataFrame([RECORD, {**RECORD, "patient_id": "P2", "dept_name": None}])
+    texts = formatter.format_columns(frame)
+
+    assert texts[0] == formatter.format_record(RECORD)
+    assert "- ID: P2" in texts[1]
+    assert "- Department: N/A" in texts[1]
+    assert "- Present Illness: N/A" in texts[0]
+
+def test_missing_columns_use_placeholder():
+    """Test fields absent from the result render as the missing placeholder."""
+    formatter = EMRTextFormatter(template="{patient_id}|{dept_name}", missing="-")
+    assert formatter.format_columns({"patient_id": ["P1", "P2"]}) == ["P1|-", "P2|-"]
+
+def test_iter_format_streams_tuples_in_batches():
+    """Test the generator interface over tuple rows with column names."""
+    formatter = EMRTextFormatter(template="{patient_id}:{age}")
+    rows = ((f"P{i}", i) for i in range(5))
+    assert list(formatter.iter_format(rows, ["patient_id", "age"], batch_size=2)) == [
+        "P0:0", "P1:1", "P2:2", "P3:3", "P4:4"
+    ]
+
+def test_truncate_tokens():
+    """Test approximate token truncation for CJK and latin text."""
+    assert truncate_tokens("发热伴咳嗽", 10) == "发热伴咳嗽"
+    assert truncate_tokens("发热伴咳嗽三天", 3) == "发热伴…"
+    assert truncate_tokens("fever and cough for three days", 3) == "fever and cough…"
+
+def test_max_field_tokens_per_field():
+    """Test truncation applies only to the configured fields."""
+    formatter = EMRTextFormatter(
+        template="{chief_complaint}/{dept_name}",
+        max_field_tokens={"chief_complaint": 2}
+    )
+    assert formatter.format_record({"chief_complaint": "咳嗽三天", "dept_name": "呼吸内科"}) == "咳嗽…/呼吸内科"
+
+def test_iter_emr_texts_streams_from_cursor(mock_db_manager):
+    """Test EMR texts are formatted from streamed partitions."""
+    columns = list(RECORD)
+    mock_result = MagicMock()
+    mock_result.keys.return_value = columns
+    mock_result.partitions.return_value = iter([[tuple(RECORD.values())]])
+    mock_connection = MagicMock()
+    mock_connection.execution_options.return_value.execute.return_value = mock_result
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    mock_db_manager.get_connection.return_value = context
+
+    manager = EMRRecordManager(MagicMock(db_manager=mock_db_manager))
+    texts = list(manager.iter_emr_texts(patient_id="P1"))
+
+    assert texts == [manager.format_emr_for_analysis(RECORD)]
+    mock_connection.execution_options.assert_called_once_with(stream_results=True, max_row_buffer=10000)
+    params = mock_connection.execution_options.return_value.execute.call_args.kwargs["parameters"]
+    assert params == {"patient_id": "P1"}
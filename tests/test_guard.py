@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock
+from shcdc_emr_db.db import QueryRejectedError
+from shcdc_emr_db.guard import GuardedQueryExecutor, validate_read_only_query
+
+class FakeRow:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+def _mock_connection(mock_db_manager, rows):
+    mock_connection = MagicMock()
+    result = MagicMock()
+    result.keys.return_value = ["id"]
+    result.partitions.return_value = iter([[FakeRow(row) for row in rows]])
+    mock_connection.execute.return_value = result
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    mock_db_manager.get_connection.return_value = context
+    return mock_connection
+
+def test_validate_accepts_single_select():
+    """Test a plain SELECT with trailing semicolon and comments is accepted."""
+    statement = validate_read_only_query("-- top orgs\nSELECT 'a;b' AS x FROM t;  ")
+    assert statement == "-- top orgs\nSELECT 'a;b' AS x FROM t"
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM emr_back.emr_order_item",
+    "SELECT 1; DROP TABLE emr_back.emr_order",
+    "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+    "SELECT * INTO new_table FROM t",
+    "   ",
+    "123",
+    "( )",
+    "1+1",
+])
+def test_validate_rejects_unsafe_queries(query):
+    """Test write statements and multiple statements are rejected."""
+    with pytest.raises(QueryRejectedError):
+        validate_read_only_query(query)
+
+def test_validate_ignores_keywords_in_literals():
+    """Test forbidden keywords inside strings or identifiers do not trigger."""
+    assert validate_read_only_query("SELECT 'delete' AS \"update\", update_time FROM t")
+
+def test_execute_caps_rows(mock_db_manager):
+    """Test guarded execution applies read-only settings and the row cap."""
+    mock_connection = _mock_connection(mock_db_manager, [{"id": i} for i in range(3)])
+    executor = GuardedQueryExecutor(mock_db_manager, max_rows=2, statement_timeout_ms=5000)
+
+    result = executor.execute("SELECT id FROM emr_back.emr_order_item;")
+
+    statements = [str(call[0][0]) for call in mock_connection.execute.call_args_list]
+    assert statements[0] == "SET TRANSACTION READ ONLY"
+    assert statements[1] == "SET LOCAL statement_timeout = 5000"
+    assert "LIMIT :_guard_limit OFFSET :_guard_offset" in statements[2]
+    assert mock_connection.execute.call_args_list[2][1]["parameters"]["_guard_limit"] == 3
+    assert result.rows == [{"id": 0}, {"id": 1}]
+    assert result.has_more
+    assert result.next_offset == 2
+    mock_connection.rollback.assert_called_once()
+
+def test_execute_memory_budget(mock_db_manager):
+    """Test fetching stops once the memory budget is exceeded."""
+    _mock_connection(mock_db_manager, [{"id": "x" * 100} for _ in range(10)])
+    executor = GuardedQueryExecutor(mock_db_manager, max_rows=10, max_memory_bytes=1000)
+
+    result = executor.execute("SELECT id FROM t")
+    assert result.truncated_by_memory
+    assert 0 < len(result.rows) < 10
+
+def test_execute_ends_trailing_comment(mock_db_manager):
+    """Test a trailing -- comment does not swallow the paging clause."""
+    mock_connection = _mock_connection(mock_db_manager, [{"id": 1}])
+    GuardedQueryExecutor(mock_db_manager).execute("SELECT 1 -- note")
+    paged = str(mock_connection.execute.call_args_list[2][0][0])
+    assert "-- note\n) AS guarded_query LIMIT" in paged
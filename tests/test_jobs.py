@@ -0,0 +1,128 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import exc as sa_exc
+from shcdc_emr_db.jobs import QueryJobManager
+
+class FakeRow:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+def _make_connection(partitions, pid=4242):
+    """Connection whose first execute returns the backend pid, then a streamed result."""
+    mock_connection = MagicMock()
+    pid_result = MagicMock()
+    pid_result.scalar.return_value = pid
+    result = MagicMock()
+    result.keys.return_value = ["org_name", "cnt"]
+    result.partitions.return_value = partitions
+    mock_connection.execute.side_effect = [pid_result, result]
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    return context, result
+
+def test_submit_and_wait(mock_db_manager):
+    """Test a job runs in the background and exposes its rows."""
+    context, _ = _make_connection(iter([[FakeRow({"org_name": "A", "cnt": 1})], [FakeRow({"org_name": "B", "cnt": 2})]]))
+    mock_db_manager.get_connection.return_value = context
+    manager = QueryJobManager(mock_db_manager, max_workers=1)
+
+    job_id = manager.submit("SELECT org_name, COUNT(*) AS cnt FROM t GROUP BY 1", owner="s1")
+    job = manager.wait(job_id, timeout=5)
+
+    assert job.status == "done"
+    assert job.backend_pid == 4242
+    assert job.rows_fetched == 2
+    assert job.columns == ["org_name", "cnt"]
+    manager.forget(job_id)
+    with pytest.raises(KeyError):
+        manager.get(job_id)
+    manager.shutdown()
+
+def test_cancel_running_job_calls_pg_cancel_backend(mock_db_manager):
+    """Test cancelling a running job cancels its backend on the server."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_partitions(_size):
+        started.set()
+        release.wait(5)
+        raise sa_exc.OperationalError("SELECT", {}, Exception("canceling statement due to user request"))
+
+    job_context, result = _make_connection(None)
+    result.partitions.side_effect = blocking_partitions
+    cancel_context = MagicMock()
+    cancel_connection = cancel_context.__enter__.return_value
+    mock_db_manager.get_connection.side_effect = [job_context, cancel_context]
+
+    manager = QueryJobManager(mock_db_manager, max_workers=1)
+    job_id = manager.submit("SELECT pg_sleep(60)", owner="s1")
+    assert started.wait(5)
+
+    assert manager.cancel_owner("s1") == 1
+    release.set()
+    job = manager.wait(job_id, timeout=5)
+
+    assert job.status == "cancelled"
+    assert "pg_cancel_backend" in str(cancel_connection.execute.call_args[0][0])
+    assert cancel_connection.execute.call_args[1]["parameters"] == {"pid": 4242}
+    manager.shutdown()
+
+def test_cancel_after_query_does_not_signal_released_backend(mock_db_manager):
+    """Test a cancel arriving while the connection goes back to the pool does not signal its backend."""
+    context, _ = _make_connection(iter([[FakeRow({"org_name": "A", "cnt": 1})]]))
+    manager = QueryJobManager(mock_db_manager, max_workers=1)
+    cancelled = []
+
+    def release_connection(*_exc):
+        cancelled.append(manager.cancel(manager.jobs()[0].job_id))
+        return False
+    context.__exit__.side_effect = release_connection
+    mock_db_manager.get_connection.return_value = context
+
+    job_id = manager.submit("SELECT 1")
+    job = manager.wait(job_id, timeout=5)
+
+    assert job.status == "done"
+    assert cancelled == [False]
+    assert mock_db_manager.get_connection.call_count == 1
+    manager.shutdown()
+
+def test_cancel_finished_job_is_noop(mock_db_manager):
+    """Test cancelling a finished job returns False."""
+    context, _ = _make_connection(iter([]))
+    mock_db_manager.get_connection.return_value = context
+    manager = QueryJobManager(mock_db_manager, max_workers=1)
+
+    job_id = manager.submit("SELECT 1")
+    manager.wait(job_id, timeout=5)
+    assert not manager.cancel(job_id)
+    manager.shutdown()
+
+def test_progress_omits_rows(mock_db_manager):
+    """Test progress snapshots report the row count without copying rows."""
+    context, _ = _make_connection(iter([[FakeRow({"org_name": "A", "cnt": 1})]]))
+    mock_db_manager.get_connection.return_value = context
+    manager = QueryJobManager(mock_db_manager, max_workers=1)
+
+    job_id = manager.submit("SELECT 1")
+    manager.wait(job_id, timeout=5)
+    progress = manager.progress(job_id)
+    assert progress.finished
+    assert progress.rows_fetched == 1
+    assert progress.rows == []
+    assert len(manager.get(job_id).rows) == 1
+    manager.shutdown()
+
+def test_finished_jobs_expire(mock_db_manager):
+    """Test jobs finished longer than finished_ttl ago are dropped."""
+    context, _ = _make_connection(iter([]))
+    mock_db_manager.get_connection.return_value = context
+    manager = QueryJobManager(mock_db_manager, max_workers=1, finished_ttl=0)
+
+    job_id = manager.submit("SELECT 1")
+    manager.wait(job_id, timeout=5)
+    assert manager.jobs() == []
+    with pytest.raises(KeyError):
+        manager.get(job_id)
+    manager.shutdown()
@@ -0,0 +1,67 @@
+from datetime import date
+import numpy as np
+import pytest
+import pandas as pd
+from unittest.mock import MagicMock
+from shcdc_emr_db.matching import (
+    PatientMatcher, block_pairs, cluster_pairs, id_card_similarity, name_similarity,
+    normalize_id_card, score_block_batch,
+)
+
+def test_normalize_id_card():
+    """Test old 15-digit and new 18-digit forms of a number share a key."""
+    cards = pd.Series(["110105491231002", "11010519491231002x", " 1101-0519491231002X", "", None])
+    normalized = normalize_id_card(cards)
+    assert normalized[:3].tolist() == ["11010519491231002"] * 3
+    assert normalized[3:].isna().all()
+
+def test_name_similarity():
+    """Test vectorized edit-distance similarity of names."""
+    a = pd.Series(["张三", "张三", "欧阳娜娜", "", "李四"])
+    b = pd.Series(["张三", "张叁", "欧阳娜", "", "王五六"])
+    assert np.allclose(name_similarity(a, b), [1.0, 0.5, 0.75, 1.0, 0.0])
+
+def test_id_card_similarity():
+    """Test IDs are equal, one character apart, or unrelated."""
+    a = pd.Series(["11010519491231002", "11010519491231002", "11010519491231002"])
+    b = pd.Series(["11010519491231002", "11010519491231003", "21010519491231003"])
+    assert np.allclose(id_card_similarity(a, b), [1.0, 16 / 17, 0.0])
+
+def test_block_pairs():
+    """Test every pair within each block is generated once."""
+    left, right = block_pairs(np.array(["a", "a", "a", "b", "c", "c"]))
+    assert list(zip(left, right)) == [(0, 1), (0, 2), (1, 2), (4, 5)]
+
+def test_score_uses_available_features():
+    """Test scores average only the features both rows have."""
+    batch = pd.DataFrame({
+        "id": ["P2", "P1", "P3"],
+        "patient_name": ["张三", "张 三", "张三丰"],
+        "id_card": ["110105491231002", "11010519491231002X", None],
+        "birth_date": [date(1949, 12, 31), date(1949, 12, 31), None],
+        "gender_code": ["1", "1", None],
+        "org_code": ["A", "B", "C"],
+        "block_key": ["k", "k", "k"],
+    })
+    pairs = score_block_batch(batch).set_index(["id_a", "id_b"])
+    assert pairs.loc[("P1", "P2"), "score"] == 1.0
+    # Only the names can be compared with P3
+    assert pairs.loc[("P1", "P3"), "score"] == pytest.approx(2 / 3)
+
+def test_cluster_pairs():
+    """Test matched pairs are merged transitively into clusters."""
+    pairs = pd.DataFrame({"id_a": ["P3", "P1", "P7"], "id_b": ["P4", "P3", "P8"]})
+    clusters = cluster_pairs(pairs).set_index("id")["cluster_id"]
+    assert clusters.to_dict() == {"P1": "P1", "P3": "P1", "P4": "P1", "P7": "P7", "P8": "P7"}
+
+def test_batches_never_split_blocks():
+    """Test streamed chunks are regrouped so each batch holds whole blocks."""
+    executor = MagicMock()
+    executor.iter_frames.return_value = iter([
+        pd.DataFrame({"id": ["1", "2", "3"], "block_key": ["a", "a", "b"]}),
+        pd.DataFrame({"id": ["4", "5"], "block_key": ["b", "c"]}),
+    ])
+    matcher = PatientMatcher(executor, batch_rows=3)
+    batches = [batch["block_key"].tolist() for batch in matcher.iter_batches("id_card")]
+    assert batches == [["a", "a"], ["b", "b"], ["c"]]
+    assert "block_size BETWEEN 2 AND 100" in executor.iter_frames.call_args.args[0]
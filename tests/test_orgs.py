@@ -0,0 +1,42 @@
+import pandas as pd
+from shcdc_emr_db.orgs import OrgDimension, label_orgs
+
+ORGS = {
+    "O1": {"org_name": "甲医院", "aliases": ["甲院"], "tables": ["emr_order", "emr_patient_info"], "records": 30},
+    "O2": {"org_name": None, "aliases": [], "tables": ["emr_patient_info"], "records": 5},
+}
+
+def test_label_orgs_inserts_names_after_codes():
+    """Test names are attached next to the code column, unknown codes shown as is."""
+    frame = pd.DataFrame({"机构代码": ["O1", "O9"], "缺失数量": [3, 1]})
+    labelled = label_orgs(frame, {"O1": "甲医院"})
+    assert list(labelled.columns) == ["机构代码", "机构名称", "缺失数量"]
+    assert labelled["机构名称"].tolist() == ["甲医院", "O9"]
+    assert "机构名称" not in frame.columns
+
+def test_build_query_ranks_names(mock_db_manager):
+    """Test one scan per table, with the most used name canonical and the rest aliases."""
+    query = OrgDimension(mock_db_manager).build_query(["emr_order", "emr_patient_info"])
+    assert query.count("FROM emr_back.") == 2 and "UNION ALL" in query
+    assert "ORDER BY records DESC, org_name" in query
+    assert "r.names[1] AS org_name, COALESCE(r.names[2:], '{}') AS aliases" in query
+
+def test_lookups_build_dimension_once(mocker, mock_db_manager):
+    """Test the dimension is built when missing, then served from memory."""
+    orgs = OrgDimension(mock_db_manager)
+    load = mocker.patch.object(orgs, "_load", side_effect=[None, ORGS])
+    build = mocker.patch.object(orgs, "_build", return_value=2)
+    assert orgs.names() == {"O1": "甲医院", "O2": "O2"}
+    assert orgs.options("emr_back.emr_order").to_dict("records") == [{"org_code": "O1", "org_name": "甲医院"}]
+    assert orgs.find("甲院") == ["O1"] and orgs.find("o2") == ["O2"]
+    assert orgs.conflicts()["aliases"].tolist() == [["甲院"]]
+    assert load.call_count == 2 and build.call_count == 1
+
+def test_create_indexes_one_table_at_a_time(mock_db_manager):
+    """Test org_code is indexed per table through the non-blocking index builder."""
+    orgs = OrgDimension(mock_db_manager)
+    assert orgs.create_indexes(["emr_order", "emr_ex_lab"]) == ["emr_order_org_code_idx", "emr_ex_lab_org_code_idx"]
+    assert [call.args for call in mock_db_manager.create_index.call_args_list] == [
+        ("emr_back.emr_order", "emr_order_org_code_idx", ["org_code"]),
+        ("emr_back.emr_ex_lab", "emr_ex_lab_org_code_idx", ["org_code"]),
+    ]
@@ -0,0 +1,74 @@
+from datetime import date
+import pytest
+from unittest.mock import patch
+from shcdc_emr_db.partitioning import PartitionManager, PartitionInfo
+from shcdc_emr_db.queries import QueryScope, linkage_overview_queries, missing_items_query, orphaned_items_query
+
+def test_month_bounds_cover_range():
+    """Test monthly range partitions across a year boundary."""
+    bounds = PartitionManager._month_bounds("emr_order_item", date(2023, 11, 1), date(2024, 2, 1))
+    assert [name for name, _ in bounds] == [
+        "emr_order_item_p2023_11", "emr_order_item_p2023_12", "emr_order_item_p2024_01"
+    ]
+    assert bounds[1][1] == "FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')"
+
+def test_list_bound_names_are_unique_and_quoted():
+    """Test list partition names stay distinct for values sharing a slug, and values are escaped."""
+    first, bound = PartitionManager._list_bound("emr_vital_signs_record", "ORG-1")
+    second, _ = PartitionManager._list_bound("emr_vital_signs_record", "ORG_1")
+    assert first != second
+    assert len(first) <= 63
+    assert bound == "FOR VALUES IN ('ORG-1')"
+    assert PartitionManager._list_bound("t", "O'X")[1] == "FOR VALUES IN ('O''X')"
+
+def test_bound_condition():
+    """Test partition bounds translate into row filters for moving default rows."""
+    assert PartitionManager._bound_condition(
+        "operation_time", "FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-02-01 00:00:00')"
+    ) == "operation_time >= '2024-01-01 00:00:00' AND operation_time < '2024-02-01 00:00:00'"
+    assert PartitionManager._bound_condition("org_code", "FOR VALUES IN ('ORG1')") == "org_code IN ('ORG1')"
+
+def test_migrate_validates_arguments(mock_db_manager):
+    """Test invalid migrations are rejected before touching the database."""
+    manager = PartitionManager(mock_db_manager)
+    with pytest.raises(ValueError):
+        manager.migrate("emr_order_item", strategy="hash")
+    with pytest.raises(ValueError):
+        manager.migrate("emr_order_item; DROP TABLE x")
+
+    with patch.object(manager, "_fetch", side_effect=[[{"keydef": "RANGE (operation_time)"}]]):
+        with pytest.raises(ValueError, match="already partitioned"):
+            manager.migrate("emr_order_item")
+
+    with patch.object(manager, "_fetch", side_effect=[[], [{"column_name": "id"}]]):
+        with pytest.raises(ValueError, match="no column"):
+            manager.migrate("emr_order_item", column="org_code")
+    mock_db_manager.engine.begin.assert_not_called()
+
+def test_partition_key_and_partitions(mock_db_manager):
+    """Test partition metadata is read from the catalog."""
+    manager = PartitionManager(mock_db_manager)
+    with patch.object(manager, "_fetch", return_value=[{"keydef": "LIST (org_code)"}]):
+        assert manager.partition_key("emr_vital_signs_record") == ("list", "org_code")
+    with patch.object(manager, "_fetch", return_value=[{"name": "t_default", "bound": "DEFAULT", "estimated_rows": 3}]):
+        assert manager.partitions("t") == [PartitionInfo("t_default", "DEFAULT", 3)]
+        assert manager.partitions("t")[0].is_default
+
+def test_query_scope_pushdown():
+    """Test org and time filters are pushed into the linkage queries."""
+    scope = QueryScope(org_codes=("ORG1", "O'2"), since=date(2024, 1, 1), until=date(2024, 2, 1))
+    overview = linkage_overview_queries("order", "项", "单", scope)
+
+    assert "i.operation_time >= '2024-01-01'" in overview["total_items"]
+    assert "p.org_code IN ('ORG1', 'O''2')" in overview["valid_items"]
+    # Item filters go in the join so parents without items in the window still count
+    assert "ON p.id = i.order_id AND i.operation_time >= '2024-01-01'" in overview["parent_without_items"]
+    # Orphans have no parent organization, only the time window applies
+    assert "org_code" not in orphaned_items_query("order", scope=scope)
+    assert "i.operation_time < '2024-02-01'" in orphaned_items_query("order", scope=scope)
+    assert "p.org_code IN" in missing_items_query("order", scope=scope)
+
+def test_empty_scope_leaves_queries_unfiltered():
+    """Test the default scope adds no filters."""
+    assert "operation_time >=" not in linkage_overview_queries("order", "a", "b")["total_items"]
+    assert "WHERE p.id IS NULL\n" in orphaned_items_query("order")
@@ -0,0 +1,101 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from shcdc_emr_db.db import QueryError
+from shcdc_emr_db.profiler import parse_explain_json
+from sqlalchemy import exc as sa_exc
+
+SAMPLE_PLAN = [
+    {
+        "Plan": {
+            "Node Type": "Hash Join",
+            "Actual Startup Time": 1.0,
+            "Actual Total Time": 12.0,
+            "Plan Rows": 100,
+            "Actual Rows": 400,
+            "Actual Loops": 1,
+            "Shared Hit Blocks": 10,
+            "Shared Read Blocks": 5,
+            "Plans": [
+                {
+                    "Node Type": "Seq Scan",
+                    "Relation Name": "emr_order_item",
+                    "Actual Total Time": 8.0,
+                    "Plan Rows": 1000,
+                    "Actual Rows": 1000,
+                    "Actual Loops": 1,
+                    "Filter": "(order_id IS NOT NULL)",
+                    "Rows Removed by Filter": 3,
+                },
+                {
+                    "Node Type": "Index Scan",
+                    "Relation Name": "emr_order",
+                    "Index Name": "emr_order_pkey",
+                    "Actual Total Time": 0.5,
+                    "Plan Rows": 1,
+                    "Actual Rows": 1,
+                    "Actual Loops": 4,
+                },
+            ],
+        },
+        "Planning Time": 0.3,
+        "Execution Time": 12.5,
+    }
+]
+
+def _mock_connection(query_executor, scalar=None, side_effect=None):
+    mock_connection = MagicMock()
+    mock_connection.execute.return_value.scalar.return_value = scalar
+    mock_connection.execute.side_effect = side_effect
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    query_executor.db_manager.get_connection.return_value = context
+    return mock_connection
+
+def test_parse_explain_json_builds_tree():
+    """Test parsing EXPLAIN JSON into a plan tree."""
+    profile = parse_explain_json(SAMPLE_PLAN)
+    assert profile.execution_time == 12.5
+    assert profile.root.node_type == "Hash Join"
+    assert len(profile.root.children) == 2
+    assert profile.root.row_estimate_ratio == 4.0
+    # 12.0 - (8.0 + 0.5 * 4 loops)
+    assert profile.root.exclusive_time == pytest.approx(2.0)
+
+def test_parse_explain_json_from_text():
+    """Test parsing EXPLAIN output passed as raw JSON text."""
+    profile = parse_explain_json(json.dumps(SAMPLE_PLAN))
+    assert profile.planning_time == 0.3
+
+def test_seq_scans_and_rows():
+    """Test seq scan detection and flattening."""
+    profile = parse_explain_json(SAMPLE_PLAN)
+    scans = profile.seq_scans()
+    assert [scan.relation_name for scan in scans] == ["emr_order_item"]
+    rows = profile.to_rows()
+    assert [row["depth"] for row in rows] == [0, 1, 1]
+    assert rows[1]["rows_removed_by_filter"] == 3
+
+def test_explain_rolls_back(query_executor):
+    """Test explain wraps the statement and rolls back."""
+    mock_connection = _mock_connection(query_executor, scalar=SAMPLE_PLAN)
+    profile = query_executor.explain("SELECT * FROM emr_back.emr_order_item;")
+    statement = str(mock_connection.execute.call_args[0][0])
+    assert statement.startswith("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT")
+    assert not statement.endswith(";")
+    mock_connection.rollback.assert_called_once()
+    assert profile.root.node_type == "Hash Join"
+
+def test_explain_failure(query_executor):
+    """Test explain surfaces database errors as QueryError."""
+    _mock_connection(query_executor, side_effect=sa_exc.SQLAlchemyError("boom"))
+    with pytest.raises(QueryError):
+        query_executor.explain("SELECT 1")
+
+def test_explain_is_read_only_with_timeout(query_executor):
+    """Test explain runs read-only, under the timeout, on the analytics workload."""
+    mock_connection = _mock_connection(query_executor, scalar=SAMPLE_PLAN)
+    query_executor.explain("SELECT 1", statement_timeout_ms=5000)
+    statements = [str(call[0][0]) for call in mock_connection.execute.call_args_list]
+    assert statements[:2] == ["SET TRANSACTION READ ONLY", "SET LOCAL statement_timeout = 5000"]
+    query_executor.db_manager.get_connection.assert_called_once_with("analytics")
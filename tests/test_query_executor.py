@@ -56,4 +56,21 @@ def test_execute_query_with_transaction(query_executor, sample_query_result):
         assert result == sample_query_result
     
     mock_connection.begin.assert_called_once()
-    mock_connection.commit.assert_called_once() 
\ No newline at end of file
+    mock_connection.commit.assert_called_once()
+
+def test_iter_frames_streams_partitions(query_executor):
+    """Test results are streamed as one DataFrame per partition."""
+    mock_result = MagicMock()
+    mock_result.keys.return_value = ["id", "org_code"]
+    mock_result.partitions.return_value = iter([[("1", "A"), ("2", "B")], [("3", "A")]])
+    mock_connection = MagicMock()
+    mock_connection.execution_options.return_value.execute.return_value = mock_result
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    query_executor.db_manager.get_connection.return_value = context
+
+    frames = list(query_executor.iter_frames("SELECT id, org_code FROM t", chunk_size=2))
+
+    assert [len(frame) for frame in frames] == [2, 1]
+    assert list(frames[0].columns) == ["id", "org_code"]
+    mock_connection.execution_options.assert_called_once_with(stream_results=True, max_row_buffer=2)
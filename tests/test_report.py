@@ -0,0 +1,40 @@
+import json
+import pandas as pd
+from shcdc_emr_db.db import QueryError
+from shcdc_emr_db.report import QualityReport
+from shcdc_emr_db.cli import main
+
+QUERIES = {"patient_info.total_records": "SELECT 1", "order.missing_by_org": "SELECT 2", "order.orphaned_items": "SELECT 3"}
+
+def test_select_by_glob(mock_db_manager):
+    """Test catalog queries are selected by name globs, all of them without patterns."""
+    report = QualityReport(mock_db_manager, queries=QUERIES)
+    assert list(report.select()) == list(QUERIES)
+    assert list(report.select(["*.missing_by_org", "patient_info.*"])) == ["patient_info.total_records", "order.missing_by_org"]
+    assert "order.missing_by_org" in QualityReport(mock_db_manager).queries
+
+def test_run_writes_results_and_manifest(mock_db_manager, mocker, tmp_path):
+    """Test every result is written as JSON with a manifest, and a failing query does not stop the others."""
+    report = QualityReport(mock_db_manager, workers=2, queries=QUERIES)
+    frames = {"SELECT 1": pd.DataFrame({"总记录数": [10]}), "SELECT 2": pd.DataFrame({"机构代码": ["O1", "O2"], "缺失数量": [3, 1]})}
+
+    def run_query(query):
+        if query not in frames:
+            raise QueryError("Database error: boom")
+        return frames[query]
+
+    mocker.patch.object(report, "run_query", side_effect=run_query)
+    result = report.run(str(tmp_path), "json")
+
+    assert [entry.name for entry in result.entries] == list(QUERIES)
+    assert [entry.rows for entry in result.entries] == [1, 2, 0]
+    assert [entry.name for entry in result.failed] == ["order.orphaned_items"]
+    written = json.loads((tmp_path / "order.missing_by_org.json").read_text(encoding="utf-8"))
+    assert written == [{"机构代码": "O1", "缺失数量": 3}, {"机构代码": "O2", "缺失数量": 1}]
+    manifest = json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["format"] == "json" and manifest["entries"][2]["error"] == "Database error: boom"
+
+def test_cli_list(capsys):
+    """Test the CLI lists catalog query names without a database."""
+    assert main(["list"]) == 0
+    assert "patient_info.mandatory_by_org" in capsys.readouterr().out.split()
@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock, patch
+from shcdc_emr_db.scan import ScanEngine, ScanRange, ScanTask, _scan_range, completeness_aggregates
+
+def test_page_ranges_cover_table():
+    """Test page ranges are contiguous and the last one is open-ended."""
+    ranges = ScanEngine._page_ranges(10, 4)
+    assert [r.params["lo"] for r in ranges] == ["(0,0)", "(3,0)", "(6,0)", "(9,0)"]
+    assert ranges[0].params["hi"] == "(3,0)"
+    assert ranges[-1] == ScanRange("ctid >= CAST(:lo AS tid)", {"lo": "(9,0)"})
+    # Empty tables still get one range
+    assert len(ScanEngine._page_ranges(0, 4)) == 1
+
+def test_key_ranges_from_sample():
+    """Test key boundaries are taken from the ordered sample and deduplicated."""
+    conn = MagicMock()
+    conn.execute.return_value = [("a",), ("b",), ("b",), ("c",), ("d",), ("e",)]
+    ranges = ScanEngine._key_ranges(conn, "emr_back.t", "id", 3, 1e6)
+    assert [r.condition for r in ranges] == ["id < :hi", "id >= :lo AND id < :hi", "id >= :lo"]
+    assert [r.params for r in ranges] == [{"hi": "b"}, {"lo": "b", "hi": "d"}, {"lo": "d"}]
+    assert conn.execute.call_args.args[1] == {"percent": pytest.approx(0.3)}
+
+    conn.execute.return_value = []
+    assert ScanEngine._key_ranges(conn, "emr_back.t", "id", 3, 0) == [ScanRange("TRUE")]
+
+def test_scan_merges_partial_counts(mock_db_manager):
+    """Test partial counts from every range are summed per group."""
+    engine = ScanEngine(mock_db_manager, workers=1)
+    partials = [
+        pd.DataFrame({"rows": [2, 1], "tel_missing": [1, 0]}, index=["O1", "O2"]),
+        pd.DataFrame({"rows": [3], "tel_missing": [2]}, index=["O1"]),
+        pd.DataFrame(),
+    ]
+    ranges = [ScanRange("TRUE")] * 3
+    with patch.object(engine, "ranges", return_value=ranges), \
+         patch("shcdc_emr_db.scan._scan_range", side_effect=partials) as scan_range:
+        result = engine.scan("emr_patient_info", completeness_aggregates(["tel"]), group_by="org_code")
+
+    assert scan_range.call_count == 3
+    assert result.totals == {"rows": 6, "tel_missing": 3}
+    assert result.counts.loc["O1"].tolist() == [5, 3]
+
+def test_scan_counts_null_group(mock_db_manager):
+    """Test rows whose group value is NULL are counted under the '' group, not dropped."""
+    engine = ScanEngine(mock_db_manager, workers=1)
+    partials = [
+        pd.DataFrame({"rows": [2, 1], "org_code_missing": [0, 1]}, index=["O1", ""]),
+        pd.DataFrame({"rows": [3], "org_code_missing": [3]}, index=[""]),
+    ]
+    with patch.object(engine, "ranges", return_value=[ScanRange("TRUE")] * 2), \
+         patch("shcdc_emr_db.scan._scan_range", side_effect=partials):
+        result = engine.scan("emr_patient_info", completeness_aggregates(["org_code"]), group_by="org_code")
+
+    assert result.totals == {"rows": 6, "org_code_missing": 4}
+    assert result.counts.loc[""].tolist() == [4, 4]
+
+def test_scan_range_coalesces_null_group(mock_db_manager):
+    """Test both the SQL aggregates and the frame check put NULL groups under ''."""
+    aggregate = MagicMock()
+    aggregate.fetchall.return_value = [("O1", 2, 0), ("", 1, 1)]
+    aggregate.keys.return_value = ["group_key", "rows", "org_code_missing"]
+    streamed = MagicMock()
+    streamed.keys.return_value = ["tel", "org_code"]
+    streamed.partitions.return_value = iter([[("1", "O1"), ("13812345678", "O1"), ("2", None)]])
+    conn = MagicMock()
+    conn.execute.return_value = aggregate
+    conn.execution_options.return_value.execute.return_value = streamed
+    context = MagicMock()
+    context.__enter__.return_value = conn
+    mock_db_manager.get_connection.return_value = context
+
+    task = ScanTask("emr_back.emr_patient_info", ScanRange("TRUE"), completeness_aggregates(["org_code"]),
+                    _flag_short, ("tel",), "org_code", 100)
+    counts = _scan_range(task, mock_db_manager)
+
+    assert "COALESCE(CAST(org_code AS text), '') AS group_key" in str(conn.execute.call_args.args[0])
+    assert counts.to_dict() == {
+        "rows": {"": 1, "O1": 2}, "org_code_missing": {"": 1, "O1": 0}, "short": {"": 1, "O1": 1},
+    }
+
+def test_scan_requires_work(mock_db_manager):
+    """Test a scan without aggregates or a frame check is rejected."""
+    with pytest.raises(ValueError):
+        ScanEngine(mock_db_manager).scan("emr_patient_info")
+
+def _flag_short(frame):
+    return pd.DataFrame({"short": frame["tel"].str.len() < 11})
+
+def test_scan_range_runs_frame_check(mock_db_manager):
+    """Test a range streams its columns through the frame check and counts flags per group."""
+    result = MagicMock()
+    result.keys.return_value = ["tel", "org_code"]
+    result.partitions.return_value = iter([[("1", "O1"), ("13812345678", "O1")], [("2", "O2")]])
+    conn = MagicMock()
+    conn.execution_options.return_value.execute.return_value = result
+    context = MagicMock()
+    context.__enter__.return_value = conn
+    mock_db_manager.get_connection.return_value = context
+
+    task = ScanTask("emr_back.emr_patient_info", ScanRange("TRUE"), {}, _flag_short, ("tel",), "org_code", 100)
+    counts = _scan_range(task, mock_db_manager)
+
+    assert counts.to_dict() == {"rows": {"O1": 2, "O2": 1}, "short": {"O1": 1, "O2": 1}}
+    assert "SELECT tel, org_code FROM emr_back.emr_patient_info" in str(conn.execution_options.return_value.execute.call_args.args[0])
+    # Transaction-scoped, so the pooled connection keeps parallel query afterwards
+    conn.exec_driver_sql.assert_called_once_with("SET LOCAL max_parallel_workers_per_gather = 0")
@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+from shcdc_emr_db.search import NarrativeSearch, search_terms
+
+def connect(mock_db_manager, rows):
+    conn = MagicMock()
+    conn.execute.return_value.mappings.return_value.all.return_value = rows
+    context = MagicMock()
+    context.__enter__.return_value = conn
+    mock_db_manager.get_connection.return_value = context
+    return conn
+
+def test_search_query_uses_index_expression(mock_db_manager):
+    """Test candidates come from the indexed bigram expression and each term is rechecked as a substring."""
+    search = NarrativeSearch(mock_db_manager)
+    query = search.search_query(["胸痛", "发热"], org_codes=["O1"], max_hits=100)
+    expression = "emr_ref.text_bigrams(r.chief_complaint, r.clinic_diagnosis, r.present_illness, r.physical_examination)"
+    assert f"{expression} @> emr_ref.text_bigrams(VARIADIC CAST(:terms AS text[]))" in query
+    assert "strpos(lower(r.chief_complaint), (CAST(:terms AS text[]))[2]) > 0" in query
+    assert "r.org_code = ANY(:org_codes)" in query and "LIMIT :max_hits" in query
+    assert search.index_expression() == expression.replace("r.", "")
+    assert search_terms(" 胸痛  CT 胸痛 ") == ["胸痛", "ct"]
+
+def test_search_pages_and_truncates(mock_db_manager):
+    """Test the total comes with the page rows, capped at max_hits."""
+    conn = connect(mock_db_manager, [
+        {"total": 3, "id": "V1", "rank": 8}, {"total": 3, "id": "V2", "rank": 4},
+    ])
+    page = NarrativeSearch(mock_db_manager).search("胸痛", page=2, page_size=2, max_hits=2)
+    assert page.rows == [{"id": "V1", "rank": 8}, {"id": "V2", "rank": 4}]
+    assert page.total == 2 and page.truncated and page.pages == 1
+    assert conn.execute.call_args[0][1] == {"terms": ["胸痛"], "limit": 2, "offset": 2, "max_hits": 3}
+    mock_db_manager.get_connection.assert_called_with("analytics")
+
+def test_empty_page_and_blank_query(mock_db_manager):
+    """Test a page past the end still reports the total, and a blank query runs nothing."""
+    connect(mock_db_manager, [{"total": 5, "id": None, "rank": None}])
+    page = NarrativeSearch(mock_db_manager).search("胸痛", page=9, page_size=2)
+    assert page.rows == [] and page.total == 5 and page.pages == 3 and not page.truncated
+    mock_db_manager.get_connection.reset_mock()
+    assert NarrativeSearch(mock_db_manager).search("  ").total == 0
+    mock_db_manager.get_connection.assert_not_called()
@@ -0,0 +1,99 @@
+import json
+import pandas as pd
+import pytest
+from shcdc_emr_db.db import ConfigError
+from shcdc_emr_db.snapshot import ParquetSnapshot, SnapshotExecutor, duckdb_query, STATE_FILE
+
+def test_duckdb_query_rewrites_used_binds():
+    """Test :name binds become $name, casts are left alone and unused parameters are dropped."""
+    query, params = duckdb_query("SELECT x::text FROM t WHERE a = :a AND b > :b", {"a": 1, "b": 2, "c": 3})
+    assert query == "SELECT x::text FROM t WHERE a = $a AND b > $b"
+    assert params == {"a": 1, "b": 2}
+    assert duckdb_query("SELECT :a", None) == ("SELECT :a", None)
+
+def fake_source(mocker, query_executor, rows):
+    """Serve the table listing and one chunk of rows from the query executor"""
+    mocker.patch.object(query_executor, "execute", return_value=[{"table_name": "emr_patient_info", "incremental": True}])
+    seen = []
+
+    def iter_frames(query, params=None, chunk_size=100000):
+        seen.append((query, params))
+        yield rows
+    mocker.patch.object(query_executor, "iter_frames", side_effect=iter_frames)
+    return seen
+
+def test_export_appends_rows_newer_than_the_watermark(query_executor, mocker, tmp_path):
+    """Test the first export is full, the next one only fetches newer rows and the state keeps both files."""
+    pytest.importorskip("pyarrow")
+    snapshot = ParquetSnapshot(query_executor, str(tmp_path))
+    seen = fake_source(mocker, query_executor, pd.DataFrame({
+        "id": ["P1", "P2"], "operation_time": pd.to_datetime(["2024-01-01", "2024-02-01"]),
+    }))
+    assert snapshot.export() == {"emr_patient_info": 2}
+    assert seen[-1] == ("SELECT * FROM emr_back.emr_patient_info", {})
+
+    fake_source(mocker, query_executor, pd.DataFrame({"id": ["P1"], "operation_time": pd.to_datetime(["2024-03-01"])}))
+    assert snapshot.export() == {"emr_patient_info": 1}
+    info = json.loads((tmp_path / STATE_FILE).read_text(encoding="utf-8"))["tables"]["emr_patient_info"]
+    assert info["files"] == ["g00000-00000.parquet", "g00001-00000.parquet"]
+    assert info["rows"] == 3 and info["appended"] and info["watermark"] == "2024-03-01T00:00:00"
+
+    fake_source(mocker, query_executor, pd.DataFrame({"id": ["P1"], "operation_time": pd.to_datetime(["2024-03-01"])}))
+    snapshot.export(full=True)
+    assert sorted(p.name for p in (tmp_path / "emr_patient_info").iterdir()) == ["g00002-00000.parquet"]
+
+def test_snapshot_executor_keeps_latest_version(query_executor, mocker, tmp_path):
+    """Test the DuckDB views answer the same SQL with binds and only see the latest version of a row."""
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pyarrow")
+    snapshot = ParquetSnapshot(query_executor, str(tmp_path))
+    fake_source(mocker, query_executor, pd.DataFrame({
+        "id": ["P1", "P2"], "tel": ["1", None], "operation_time": pd.to_datetime(["2024-01-01", "2024-02-01"]),
+    }))
+    snapshot.export()
+    fake_source(mocker, query_executor, pd.DataFrame({
+        "id": ["P1"], "tel": [None], "operation_time": pd.to_datetime(["2024-03-01"]),
+    }))
+    snapshot.export()
+
+    executor = SnapshotExecutor(str(tmp_path))
+    rows = executor.execute(
+        "SELECT COUNT(*) AS 记录总数, SUM(CASE WHEN tel IS NULL THEN 1 ELSE 0 END) AS TEL缺失数 "
+        "FROM emr_back.emr_patient_info WHERE operation_time >= :since", {"since": "2024-01-01"}
+    )
+    assert rows == [{"记录总数": 2, "tel缺失数": 2}]
+    frames = list(executor.iter_frames("SELECT id FROM emr_back.emr_patient_info ORDER BY id", chunk_size=1))
+    assert pd.concat(frames)["id"].tolist() == ["P1", "P2"]
+    types = executor.column_types()
+    assert types["tel"] == "text" and types["operation_time"].startswith("timestamp")
+
+def test_snapshot_executor_follows_reexports(query_executor, mocker, tmp_path):
+    """Test queries pick up appended rows and the new files of a full re-export without a refresh call."""
+    pytest.importorskip("duckdb")
+    pytest.importorskip("pyarrow")
+    snapshot = ParquetSnapshot(query_executor, str(tmp_path))
+    fake_source(mocker, query_executor, pd.DataFrame({"id": ["P1"], "operation_time": pd.to_datetime(["2024-01-01"])}))
+    snapshot.export()
+    executor = SnapshotExecutor(str(tmp_path))
+    count = "SELECT COUNT(*) AS n FROM emr_back.emr_patient_info"
+    assert executor.execute(count) == [{"n": 1}]
+
+    fake_source(mocker, query_executor, pd.DataFrame({"id": ["P2"], "operation_time": pd.to_datetime(["2024-02-01"])}))
+    snapshot.export()
+    assert executor.execute(count) == [{"n": 2}]
+
+    # A full export deletes the files the old views read
+    fake_source(mocker, query_executor, pd.DataFrame({
+        "id": ["P1", "P2", "P3"], "operation_time": pd.to_datetime(["2024-01-01", "2024-02-01", "2024-03-01"]),
+    }))
+    snapshot.export(full=True)
+    assert executor.execute(count) == [{"n": 3}]
+    assert pd.concat(executor.iter_frames("SELECT id FROM emr_back.emr_patient_info ORDER BY id"))["id"].tolist() == ["P1", "P2", "P3"]
+
+def test_snapshot_executor_without_snapshot(tmp_path):
+    """Test a missing snapshot is reported as a configuration error."""
+    pytest.importorskip("duckdb")
+    executor = SnapshotExecutor(str(tmp_path))
+    assert executor.exported_at is None
+    with pytest.raises(ConfigError):
+        executor.frame("SELECT 1")
@@ -0,0 +1,63 @@
+import pytest
+from shcdc_emr_db.synthetic import SyntheticConfig, SyntheticDataGenerator, TABLE_SPECS, _ChunkStream
+
+@pytest.fixture
+def generator():
+    return SyntheticDataGenerator(SyntheticConfig(scale=10_000, chunk_size=1_000))
+
+def test_chunks_are_deterministic(generator):
+    """Test the same chunk is generated identically regardless of call order."""
+    first = generator.generate_chunk("emr_order_item", 2_000, 500)
+    generator.generate_chunk("emr_order", 0, 100)
+    again = generator.generate_chunk("emr_order_item", 2_000, 500)
+    assert first.equals(again)
+    assert list(first.columns) == [col.name for col in TABLE_SPECS["emr_order_item"].columns]
+
+def test_generate_respects_row_counts(generator):
+    """Test generate yields chunk_size frames covering the configured rows."""
+    frames = list(generator.generate("emr_patient_info"))
+    assert sum(len(frame) for frame in frames) == generator.config.rows("emr_patient_info") == 1_000
+    assert all(len(frame) <= 1_000 for frame in frames)
+
+def test_null_rates_per_field():
+    """Test per-field null rates override the default and key columns stay filled."""
+    config = SyntheticConfig(scale=50_000, default_null_rate=0.0, null_rates={"emr_patient_info.tel": 0.5})
+    frame = SyntheticDataGenerator(config).generate_chunk("emr_patient_info", 0, 5_000)
+    assert 0.45 < frame["tel"].isna().mean() < 0.55
+    assert frame["patient_name"].notna().all()
+    assert frame["id"].notna().all()
+
+def test_orphan_and_duplicate_rates():
+    """Test orphaned parent references and duplicate ids are injected at the configured rates."""
+    config = SyntheticConfig(scale=20_000, orphan_rate=0.1, duplicate_id_rate=0.05)
+    generator = SyntheticDataGenerator(config)
+    frame = generator.generate_chunk("emr_order_item", 0, 20_000)
+
+    parent_numbers = frame["order_id"].str[1:].astype(int)
+    orphan_share = (parent_numbers >= config.rows("emr_order")).mean()
+    assert 0.08 < orphan_share < 0.12
+    assert 0.03 < frame["id"].duplicated().mean() < 0.07
+
+def test_org_skew():
+    """Test organizations follow a skewed distribution."""
+    frame = SyntheticDataGenerator(SyntheticConfig(n_orgs=50, org_skew=1.5)).generate_chunk("emr_order", 0, 10_000)
+    counts = frame["org_code"].value_counts()
+    assert counts.index[0] == "ORG0000"
+    assert counts.iloc[0] > 10 * counts.iloc[-1]
+
+def test_ddl_covers_all_tables(generator):
+    """Test DDL creates every table spec."""
+    ddl = generator.ddl()
+    for name in TABLE_SPECS:
+        assert f"CREATE TABLE emr_back.{name} (" in ddl
+
+def test_chunk_stream_reads_in_pieces():
+    """Test the COPY stream concatenates chunks across reads."""
+    stream = _ChunkStream(iter(["ab", "cde", "f"]))
+    data = b""
+    while True:
+        piece = stream.read(2)
+        if not piece:
+            break
+        data += piece
+    assert data == b"abcdef"
@@ -0,0 +1,64 @@
+from collections import namedtuple
+from unittest.mock import MagicMock
+import pytest
+from sqlalchemy import exc as sa_exc
+from shcdc_emr_db.db import EMRRecordManager, QueryError
+from shcdc_emr_db.queries import TIMELINE_EVENTS, patient_timeline_query
+
+Event = namedtuple("Event", ["patient_id", "event_time", "event_type", "event_id"])
+Event._mapping = property(lambda self: self._asdict())
+
+def _manager(mock_db_manager, partitions=None, error=None):
+    mock_connection = MagicMock()
+    execute = mock_connection.execution_options.return_value.execute
+    if error:
+        execute.side_effect = error
+    else:
+        execute.return_value.partitions.return_value = iter(partitions)
+    context = MagicMock()
+    context.__enter__.return_value = mock_connection
+    mock_db_manager.get_connection.return_value = context
+    return EMRRecordManager(MagicMock(db_manager=mock_db_manager)), execute
+
+def test_timeline_query_unions_selected_sources():
+    """Test the timeline query has one branch per event type, ordered per patient."""
+    query = patient_timeline_query()
+    assert query.count("UNION ALL") == len(TIMELINE_EVENTS) - 1
+    assert query.count("patient_id = ANY(:patient_ids)") == len(TIMELINE_EVENTS)
+    assert "ORDER BY patient_id, event_time" in query
+
+    query = patient_timeline_query(["lab", "vital_signs"])
+    assert "emr_back.emr_ex_lab" in query
+    assert "emr_back.emr_vital_signs_record" in query
+    assert "emr_back.emr_order" not in query
+
+def test_iter_patient_timelines_groups_across_partitions(mock_db_manager):
+    """Test events are grouped per patient even when a patient spans partitions."""
+    partitions = [
+        [Event("P1", 1, "lab", "L1"), Event("P1", 2, "order", "O1")],
+        [Event("P1", 3, "vital_signs", "V1"), Event("P2", 1, "admission", "A1")],
+    ]
+    manager, execute = _manager(mock_db_manager, partitions)
+
+    timelines = list(manager.iter_patient_timelines(["P1", "P2"]))
+
+    assert [(patient_id, len(events)) for patient_id, events in timelines] == [("P1", 3), ("P2", 1)]
+    assert timelines[0][1][2]["event_type"] == "vital_signs"
+    assert execute.call_args.kwargs["parameters"] == {"patient_ids": ["P1", "P2"]}
+
+def test_fetch_patient_timeline(mock_db_manager):
+    """Test single-patient timelines, including patients without events."""
+    manager, _ = _manager(mock_db_manager, [[Event("P1", 1, "lab", "L1")]])
+    assert manager.fetch_patient_timeline("P1") == [
+        {"patient_id": "P1", "event_time": 1, "event_type": "lab", "event_id": "L1"}
+    ]
+    assert list(manager.iter_patient_timelines([])) == []
+
+    manager, _ = _manager(mock_db_manager, [])
+    assert manager.fetch_patient_timeline("P9") == []
+
+def test_timeline_query_failure(mock_db_manager):
+    """Test database errors surface as QueryError."""
+    manager, _ = _manager(mock_db_manager, error=sa_exc.SQLAlchemyError("boom"))
+    with pytest.raises(QueryError):
+        manager.fetch_patient_timeline("P1")
@@ -0,0 +1,85 @@
+import pytest
+from collections import namedtuple
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from sqlalchemy import exc as sa_exc
+from shcdc_emr_db.db import QueryError
+from shcdc_emr_db.trends import QualityTrendStore, MetricSet, DEFAULT_METRIC_SETS
+
+SET = MetricSet("patients", "emr_patient_info", {("", "rows"): "COUNT(*)", ("tel", "missing"): "SUM(1)"})
+State = namedtuple("State", "watermark full_snapshot_at")
+Metrics = namedtuple("Metrics", "org_code watermark m0 m1")
+Series = namedtuple("Series", "series_id org_code field metric")
+
+def test_metric_query(mock_db_manager):
+    """Test metric sets aggregate per org with an all-orgs rollup, filtered by watermark when incremental."""
+    store = QualityTrendStore(mock_db_manager, metric_sets=[SET])
+    query = store.metric_query(SET, incremental=True)
+    # NULL and '' org codes fall into one group rather than two sharing the '' key
+    assert "GROUP BY ROLLUP (COALESCE(t.org_code, ''))" in query
+    assert "GROUPING(COALESCE(t.org_code, '')) = 1" in query
+    assert "WHERE t.operation_time > :watermark" in query
+    assert "COUNT(*) AS m0" in query and "SUM(1) AS m1" in query
+    assert "WHERE" not in store.metric_query(SET, incremental=False)
+
+    orphans = next(m for m in DEFAULT_METRIC_SETS if m.name == "order.orphans")
+    query = store.metric_query(orphans, incremental=False)
+    assert "'*' AS org_code" in query and "ROLLUP" not in query
+
+def test_incremental_snapshot_adds_to_last_values(mock_db_manager):
+    """Test new rows are added to the previous values and untouched series are carried forward."""
+    conn = MagicMock()
+    watermark = datetime(2024, 1, 1)
+    conn.execute.return_value.first.return_value = State(watermark, datetime(2024, 1, 1))
+    conn.execute.return_value.fetchall.side_effect = [
+        [Metrics("*", datetime(2024, 1, 2), 2, 1), Metrics("O1", datetime(2024, 1, 2), 2, 1)],
+        [(1, 100.0), (2, 10.0), (3, 50.0), (4, 5.0), (5, 50.0), (6, 5.0)],
+    ]
+    conn.execute.side_effect = lambda *args: (
+        [Series(i + 1, org, field, metric) for i, (org, field, metric) in enumerate([
+            ("*", "", "rows"), ("*", "tel", "missing"), ("O1", "", "rows"),
+            ("O1", "tel", "missing"), ("O2", "", "rows"), ("O2", "tel", "missing"),
+        ])] if "SELECT series_id" in str(args[0]) else conn.execute.return_value
+    )
+
+    store = QualityTrendStore(mock_db_manager, metric_sets=[SET])
+    assert store._snapshot_set(conn, SET, datetime(2024, 1, 3), full=False) == 6
+
+    executed = [call.args for call in conn.execute.call_args_list]
+    metric_query, metric_params = executed[1]
+    assert metric_params == {"watermark": watermark}
+    points = next(params for sql, *params in executed if "quality_points (series_id" in str(sql))[0]
+    assert dict(zip(points["ids"], points["values"])) == {1: 102.0, 2: 11.0, 3: 52.0, 4: 6.0, 5: 50.0, 6: 5.0}
+    state = executed[-1][1]
+    assert state["watermark"] == datetime(2024, 1, 2)
+    assert state["full_snapshot_at"] is None
+
+def test_filters():
+    """Test history queries filter only on the given dimensions."""
+    conditions, params = QualityTrendStore._filters("emr_order", None, "*", None)
+    assert conditions == ["TRUE", "s.table_name = :table_name", "s.org_code = :org_code"]
+    assert params == {"table_name": "emr_order", "org_code": "*"}
+
+def test_snapshot_is_full_when_last_full_is_old(mock_db_manager):
+    """Test an incremental snapshot recomputes the set once the last full one is older than full_every."""
+    conn = MagicMock()
+    conn.execute.return_value.first.return_value = State(datetime(2024, 1, 9), datetime(2024, 1, 1))
+    conn.execute.return_value.fetchall.return_value = []
+    store = QualityTrendStore(mock_db_manager, metric_sets=[SET], full_every=timedelta(days=7))
+
+    store._snapshot_set(conn, SET, datetime(2024, 1, 10), full=False)
+    executed = [call.args for call in conn.execute.call_args_list]
+    assert "WHERE t.operation_time" not in str(executed[1][0])
+    assert executed[-1][1]["full_snapshot_at"] == datetime(2024, 1, 10)
+
+def test_frame_only_hides_missing_tables(mock_db_manager):
+    """Test history reads return nothing before the first snapshot but surface other SQL errors."""
+    store = QualityTrendStore(mock_db_manager, metric_sets=[SET])
+    context = MagicMock()
+    mock_db_manager.get_connection.return_value = context
+    conn = context.__enter__.return_value
+    conn.execute.side_effect = sa_exc.ProgrammingError("SELECT", {}, MagicMock(pgcode="42P01"))
+    assert store.series().empty
+    conn.execute.side_effect = sa_exc.ProgrammingError("SELECT", {}, MagicMock(pgcode="42703"))
+    with pytest.raises(QueryError):
+        store.series()
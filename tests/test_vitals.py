@@ -0,0 +1,40 @@
+import io
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+from shcdc_emr_db.vitals import VitalSignsSeries, bucket_width, SERIES_COLUMNS
+
+FRAME = pd.DataFrame([["P1", "T", datetime(2024, 1, 1), 3, 36.5, 38.2, 37.1, 36.9]], columns=list(SERIES_COLUMNS))
+
+def test_bucket_width_and_query(query_executor):
+    """Test the width keeps the bucket count under max_points and the query bins and aggregates in SQL."""
+    assert bucket_width(datetime(2020, 1, 1), datetime(2024, 1, 1), 500) == timedelta(days=7)
+    assert bucket_width(datetime(2024, 1, 1), datetime(2024, 1, 2), 500) == timedelta(minutes=5)
+    vitals = VitalSignsSeries(query_executor)
+    sql, params = vitals.bucket_query(timedelta(days=1), ["P1"], items=["sbp"], org_codes=["O1"])
+    assert "date_bin(CAST(:bucket AS interval), measure_time" in sql
+    assert "(array_agg(value ORDER BY measure_time DESC))[1] AS last" in sql
+    assert "WHEN '收缩压' THEN 'SBP'" in sql and "invalid_flag IS DISTINCT FROM '1'" in sql
+    assert params["items"] == ["SBP"] and params["org_codes"] == ["O1"] and params["bucket"] == timedelta(days=1)
+    cohort, _ = vitals.bucket_query(timedelta(days=1), per_patient=False)
+    assert "GROUP BY item, bucket_start" in cohort and "patient_id = ANY" not in cohort
+
+def test_iter_series_picks_bucket_from_range(mocker, query_executor):
+    """Test a missing width is derived from the readings' time range."""
+    vitals = VitalSignsSeries(query_executor)
+    mocker.patch.object(vitals, "time_range", return_value=(datetime(2024, 1, 1), datetime(2024, 3, 1)))
+    frames = mocker.patch.object(query_executor, "iter_frames", return_value=iter([FRAME]))
+    assert vitals.series(["P1"], max_points=100).equals(FRAME)
+    assert frames.call_args[0][1]["bucket"] == timedelta(days=1)
+
+def test_write_ipc_round_trip(mocker, query_executor):
+    """Test series are written as an Arrow stream with a fixed schema, also when empty."""
+    vitals = VitalSignsSeries(query_executor)
+    mocker.patch.object(query_executor, "iter_frames", side_effect=[iter([FRAME]), iter([])])
+    sink = io.BytesIO()
+    assert vitals.write_ipc(sink, ["P1"], bucket=timedelta(days=1)) == 1
+    table = pa.ipc.open_stream(sink.getvalue()).read_all()
+    assert table.column("last").to_pylist() == [36.9]
+    empty = io.BytesIO()
+    assert vitals.write_ipc(empty, ["P1"], bucket=timedelta(days=1)) == 0
+    assert pa.ipc.open_stream(empty.getvalue()).read_all().schema == table.schema